@@ -0,0 +1,210 @@
+import asyncio
+import json
+import logging
+import os
+import signal
+import time
+from contextlib import asynccontextmanager
+from typing import *
+
+from dnbad.awsad.awsad import AwsAd
+from dnbad.awsad.saml import Saml
+from dnbad.awsad.saml_login import SamlLogin
+from dnbad.common import trace
+from dnbad.common.azure_auth import AuthBrowser, AuthConfig, AuthPage, AzureAuthHandler
+from dnbad.common.local_config import LocalConfig
+from dnbad.common.password_manager import PasswordManager
+from dnbad.common.utils import run_sync, start_private_unix_server
+from dnbad.gproxy.gproxy_ad_login import GProxyAdLogin, GProxyAzureAuthHandler
+from .client import agent_socket_path
+
+__all__ = ["DnbadAgent"]
+
+LOG = logging.getLogger(__name__)
+
+
+class DnbadAgent:
+    """
+    Owns one authenticated Azure session for awsad, gproxy and the AwsAd API, which become thin clients.
+    The config and the password are loaded once. The browser is started on the first request that needs it, and is
+    closed after `browser_idle_timeout` seconds without use. Concurrent identical requests share one result.
+
+    Requests and responses are JSON lines over a Unix socket only the user can access:
+    {"op": "saml", "tenant_id": str, "app_id": str} -> {"result": <SAML response>}
+    {"op": "device_code", "code": str} -> {"result": null}
+    {"op": "credentials", "profile": str|null} -> {"result": {"AccessKeyId": ..., "Expiration": <ISO 8601>}}
+    {"op": "status"} and {"op": "stop"}
+    Failures are returned as {"error": str}.
+    """
+    BROWSER_IDLE_TIMEOUT = 15 * 60
+    POLL_TIME = 10
+
+    def __init__(
+            self,
+            auth_config: Optional[AuthConfig] = None,
+            browser_idle_timeout: float = BROWSER_IDLE_TIMEOUT,
+            socket_path: Optional[str] = None,
+            password_manager: Optional[PasswordManager] = None
+    ):
+        self.auth_config = auth_config or AuthConfig(headless=True, lean=True)
+        self.browser_idle_timeout = browser_idle_timeout
+        self.socket_path = socket_path or agent_socket_path()
+        self.password_manager = password_manager or PasswordManager(LocalConfig.load().username)
+        self.auth_handler = AzureAuthHandler(self.password_manager)
+        self.started = time.time()
+        self._browser: Optional[AuthBrowser] = None
+        self._browser_lock: Optional[asyncio.Lock] = None
+        self._browser_pages = 0
+        self._browser_used = 0.0
+        self._in_flight: Dict[tuple, asyncio.Future] = {}
+        self._stop: Optional[asyncio.Event] = None
+
+    def run_sync(self):
+        run_sync(self.run())
+
+    async def run(self):
+        self._browser_lock = asyncio.Lock()
+        self._stop = asyncio.Event()
+        server = await start_private_unix_server(self._handle, self.socket_path)
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, self._stop.set)
+        except (NotImplementedError, RuntimeError):
+            # Not in the main thread (e.g. in tests):
+            pass
+        LOG.info(f"dnbad agent listening on {self.socket_path}")
+        try:
+            while not self._stop.is_set():
+                await self._close_idle_browser()
+                try:
+                    await asyncio.wait_for(self._stop.wait(), timeout=self.POLL_TIME)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            server.close()
+            await server.wait_closed()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+            await self._close_browser()
+            LOG.info("dnbad agent stopped.")
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            line = await reader.readline()
+            if line:
+                response = await self.handle_request(json.loads(line))
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+        except (ValueError, ConnectionError) as e:
+            LOG.debug(f"dnbad agent request failed: {e!r}")
+        finally:
+            writer.close()
+
+    async def handle_request(self, request: dict) -> dict:
+        op = request.get("op")
+        try:
+            with trace.span(f"agent.{op}"):
+                if op == "saml":
+                    result = await self._coalesce(
+                        ("saml", request["tenant_id"], request["app_id"]),
+                        lambda: self.saml(request["tenant_id"], request["app_id"])
+                    )
+                elif op == "device_code":
+                    result = await self._coalesce(
+                        ("device_code", request["code"]), lambda: self.device_code(request["code"])
+                    )
+                elif op == "credentials":
+                    result = await self._coalesce(
+                        ("credentials", request.get("profile")), lambda: self.credentials(request.get("profile"))
+                    )
+                elif op == "status":
+                    result = self.status()
+                elif op == "stop":
+                    self._stop.set()
+                    result = None
+                else:
+                    return {"error": f"Unknown op '{op}'"}
+        except Exception as e:
+            LOG.warning(f"dnbad agent: {op} failed: {e!r}")
+            return {"error": str(e) or repr(e)}
+        return {"result": result}
+
+    async def _coalesce(self, key: tuple, factory: Callable[[], Awaitable]) -> Any:
+        """ Requests with the same key, while the first is in flight, wait for the result of the first. """
+        future = self._in_flight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(factory())
+            self._in_flight[key] = future
+            future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        else:
+            LOG.info(f"dnbad agent: joining in-flight request {key[0]}.")
+        # A client which disconnects must not cancel the request for the others:
+        return await asyncio.shield(future)
+
+    def status(self) -> dict:
+        return {
+            "pid": os.getpid(),
+            "uptime": time.time() - self.started,
+            "username": self.password_manager.username,
+            "browser": self._browser is not None,
+            "in_flight": len(self._in_flight)
+        }
+
+    async def saml(self, tenant_id: str, app_id: str) -> str:
+        url = Saml.build_url(tenant_id=tenant_id, app_id=app_id)
+        if self.auth_config.use_cookies and self.auth_config.http_fast_path:
+            with trace.span("saml.http"):
+                saml_response = await SamlLogin.login_http(self.auth_handler.cookie_store, url)
+            if saml_response:
+                return saml_response
+        async with self._page(self.auth_handler) as auth_page:
+            return await SamlLogin.saml_from_page(auth_page, url)
+
+    async def device_code(self, code: str):
+        async with self._page(GProxyAzureAuthHandler(code, self.password_manager)) as auth_page:
+            await auth_page.goto(GProxyAdLogin.URL)
+            await auth_page.await_auth()
+
+    async def credentials(self, profile: Optional[str]) -> dict:
+        aws_ad = AwsAd(profile, saml_provider=self.saml)
+        await aws_ad.login_if_invalid_credentials_async(self.auth_config)
+        return aws_ad.credentials()
+
+    @asynccontextmanager
+    async def _page(self, auth_handler: AzureAuthHandler) -> AuthPage:
+        """ An auth page in the warm browser. The page is closed on exit, and the browser is kept. """
+        browser = await self._acquire_browser()
+        try:
+            page = await browser.new_page()
+            try:
+                async with AuthPage(page, auth_handler, self.auth_config) as auth_page:
+                    yield auth_page
+            finally:
+                await page.close()
+        finally:
+            self._release_browser()
+
+    async def _acquire_browser(self) -> AuthBrowser:
+        async with self._browser_lock:
+            if self._browser is None:
+                browser = AuthBrowser(self.auth_handler, self.auth_config)
+                await browser.__aenter__()
+                self._browser = browser
+                LOG.info("dnbad agent: browser started.")
+            self._browser_pages += 1
+            return self._browser
+
+    def _release_browser(self):
+        self._browser_pages -= 1
+        self._browser_used = time.time()
+
+    async def _close_idle_browser(self):
+        if self._browser and self._browser_pages == 0 and \
+                time.time() - self._browser_used > self.browser_idle_timeout:
+            LOG.info("dnbad agent: browser idle. Closing it.")
+            await self._close_browser()
+
+    async def _close_browser(self):
+        async with self._browser_lock:
+            if self._browser:
+                browser, self._browser = self._browser, None
+                await browser.__aexit__(None, None, None)
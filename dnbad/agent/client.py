@@ -0,0 +1,97 @@
+import asyncio
+import json
+import logging
+import socket
+from typing import *
+
+from dnbad.common import get_data_file_path
+from dnbad.common.exceptions import AdUtilException
+from dnbad.common.utils import is_private_socket
+
+__all__ = ["AgentError", "AgentClient"]
+
+LOG = logging.getLogger(__name__)
+
+
+class AgentError(AdUtilException):
+    pass
+
+
+def agent_socket_path() -> str:
+    return get_data_file_path("agent.sock")
+
+
+class AgentClient:
+    """
+    Thin client of the dnbad agent, with one JSON request and response per line over its Unix socket.
+    Requests that need a login may wait for MFA, hence the long timeout.
+    """
+    TIMEOUT = 180
+    PING_TIMEOUT = 0.5
+
+    def __init__(self, socket_path: Optional[str] = None):
+        self.socket_path = socket_path or agent_socket_path()
+
+    def available(self) -> bool:
+        """ True if an agent of the user is listening. """
+        if not is_private_socket(self.socket_path):
+            return False
+        try:
+            self._request({"op": "status"}, self.PING_TIMEOUT)
+        except AgentError:
+            return False
+        return True
+
+    @staticmethod
+    def _result(response: dict) -> Any:
+        if "error" in response:
+            raise AgentError(f"dnbad agent: {response['error']}")
+        return response.get("result")
+
+    def _request(self, request: dict, timeout: float = TIMEOUT) -> Any:
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+                s.settimeout(timeout)
+                s.connect(self.socket_path)
+                s.sendall(json.dumps(request).encode() + b"\n")
+                with s.makefile("rb") as f:
+                    line = f.readline()
+        except OSError as e:
+            raise AgentError(f"dnbad agent not reachable: {e}") from e
+        if not line:
+            raise AgentError("dnbad agent closed the connection.")
+        return self._result(json.loads(line))
+
+    async def _request_async(self, request: dict, timeout: float = TIMEOUT) -> Any:
+        try:
+            reader, writer = await asyncio.open_unix_connection(self.socket_path)
+        except OSError as e:
+            raise AgentError(f"dnbad agent not reachable: {e}") from e
+        try:
+            writer.write(json.dumps(request).encode() + b"\n")
+            await writer.drain()
+            line = await asyncio.wait_for(reader.readline(), timeout)
+        finally:
+            writer.close()
+        if not line:
+            raise AgentError("dnbad agent closed the connection.")
+        return self._result(json.loads(line))
+
+    def status(self) -> dict:
+        return self._request({"op": "status"}, self.PING_TIMEOUT)
+
+    def stop(self):
+        self._request({"op": "stop"}, self.PING_TIMEOUT)
+
+    async def saml_async(self, tenant_id: str, app_id: str) -> str:
+        return await self._request_async({"op": "saml", "tenant_id": tenant_id, "app_id": app_id})
+
+    async def device_code_async(self, code: str):
+        await self._request_async({"op": "device_code", "code": code})
+
+    async def credentials_async(self, profile: Optional[str]) -> dict:
+        """ Credentials of the profile, in the fields of the STS Credentials. Expiration is in ISO 8601. """
+        return await self._request_async({"op": "credentials", "profile": profile})
+
+    def credentials(self, profile: Optional[str]) -> dict:
+        return self._request({"op": "credentials", "profile": profile})
@@ -1,3 +1,20 @@
-from .aws_config import *
-from .awsad import AwsAd
-from .configure import *
+"""
+The API is imported on first use, such that the light modules of the package (e.g. the credential process)
+can be used without importing boto3 and awscli.
+"""
+import importlib
+
+__all__ = ["MissingAwsConfigException", "AwsConfig", "AwsAd", "AWSAdConfigure"]
+
+_MODULES = {
+    "MissingAwsConfigException": ".aws_config",
+    "AwsConfig": ".aws_config",
+    "AwsAd": ".awsad",
+    "AWSAdConfigure": ".configure",
+}
+
+
+def __getattr__(name: str):
+    if name in _MODULES:
+        return getattr(importlib.import_module(_MODULES[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,3 +1,6 @@
+import os
+import shutil
+import tempfile
 from dataclasses import dataclass, asdict
 from os import path
 from typing import *
@@ -7,6 +10,7 @@ from botocore.exceptions import ProfileNotFound
 from botocore.session import Session
 import datetime
 from dnbad.common.exceptions import AdUtilException
+from dnbad.common.file_lock import FileLock
 
 __all__ = ["MissingAwsConfigException", "AwsConfig"]
 
@@ -77,27 +81,79 @@ class AwsConfig:
         except KeyError:
             raise MissingAwsConfigException(session.profile)
 
-    def save(self):
-        session = Session(profile=self.profile)
-        writer = ConfigFileWriter()
-        values = {
+    def _section(self, session: Session, config_file: bool) -> dict:
+        if session.profile is None:
+            return {}
+        return {"__section__": f"profile {session.profile}" if config_file else session.profile}
+
+    def _config_values(self, session: Session) -> dict:
+        return {
             "awsad-azure_tenant_id": self.azure_tenant_id,
             "awsad-azure_app_id": self.azure_app_id,
             "awsad-azure_app_title": self.azure_app_title,
             "awsad-aws_default_role_arn": self.aws_default_role_arn,
-            "awsad-aws_session_duration": self.aws_session_duration
+            "awsad-aws_session_duration": self.aws_session_duration,
+            **self._section(session, config_file=True)
         }
-        if session.profile is not None:
-            values["__section__"] = f"profile {session.profile}"
-        writer.update_config(values, self.config_file_path(session, expand_user=True))
 
-        writer = ConfigFileWriter()
-        values = {
+    def _credentials_values(self, session: Session) -> dict:
+        return {
             "aws_access_key_id": self.aws_access_key_id,
             "aws_secret_access_key": self.aws_secret_access_key,
             "aws_session_token": self.aws_session_token,
-            "awsad-aws_expiration_time": self.aws_expiration_time.isoformat() if self.aws_expiration_time else None
+            "awsad-aws_expiration_time": self.aws_expiration_time.isoformat() if self.aws_expiration_time else None,
+            **self._section(session, config_file=False)
         }
-        if session.profile is not None:
-            values["__section__"] = session.profile
-        writer.update_config(values, self.credentials_file_path(session, expand_user=True))
+
+    def save(self):
+        self.save_all([self])
+
+    @classmethod
+    def save_all(cls, configs: Sequence["AwsConfig"]):
+        """ Saves the configs of many profiles with one write per file, so readers never see a partial update. """
+        if not configs:
+            return
+        sessions = [Session(profile=c.profile) for c in configs]
+        cls._update_file(cls.config_file_path(sessions[0], True),
+                         [c._config_values(s) for c, s in zip(configs, sessions)])
+        cls._update_file(cls.credentials_file_path(sessions[0], True),
+                         [c._credentials_values(s) for c, s in zip(configs, sessions)])
+
+    @staticmethod
+    def _update_file(file_path: str, sections: List[dict]):
+        """
+        Applies the updates to a copy of the file, which then replaces the file. The lock of the file is held
+        throughout, such that concurrent writers (e.g. a login and the refresh daemon) do not drop each other's updates.
+        """
+        os.makedirs(path.dirname(file_path), exist_ok=True)
+        with FileLock(f"{file_path}.lock"):
+            fd, tmp_path = tempfile.mkstemp(dir=path.dirname(file_path), prefix=".tmp-")
+            try:
+                with os.fdopen(fd, "w") as f:
+                    if path.exists(file_path):
+                        with open(file_path, "r") as original:
+                            shutil.copyfileobj(original, f)
+                writer = ConfigFileWriter()
+                for values in sections:
+                    writer.update_config(values, tmp_path)
+                if path.exists(file_path):
+                    shutil.copymode(file_path, tmp_path)
+                os.replace(tmp_path, file_path)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+
+    @staticmethod
+    def configured_profiles(group: Optional[str] = None) -> List[Optional[str]]:
+        """
+        The profiles configured for awsad, with None being the default profile.
+        With a group, only the profiles listing it in `awsad-groups` (comma separated) of their config.
+        """
+        profiles = []
+        for name, values in sorted(Session().full_config["profiles"].items()):
+            if "awsad-azure_app_id" not in values:
+                continue
+            if group is not None and group not in [g.strip() for g in values.get("awsad-groups", "").split(",")]:
+                continue
+            profiles.append(None if name == "default" else name)
+        return profiles
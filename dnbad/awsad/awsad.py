@@ -1,4 +1,6 @@
+import asyncio
 import datetime
+import functools
 import logging
 import os
 from dataclasses import dataclass
@@ -6,13 +8,25 @@ from typing import *
 from xml.etree import ElementTree
 
 import boto3
+import botocore.session
+from botocore.exceptions import ClientError
 from dateutil import tz
 
+from dnbad.agent.client import AgentClient
+from dnbad.common import get_data_file_path, trace
+from dnbad.common.azure_auth import AuthResult
 from dnbad.common.configure import *
+from dnbad.common.exceptions import AdUtilException
+from dnbad.common.file_lock import FileLock, LockTimeoutError
 from dnbad.common.local_config import LocalConfig
 from dnbad.common.password_manager import PasswordManager
+from dnbad.common.utils import run_sync
 from .aws_config import AwsConfig
+from .credential_process import CredentialCache, clamp_refresh_margin
+from .refreshing_credentials import create_refreshing_credentials
 from .saml import Saml
+from .role_metadata import RoleMetadataCache
+from .saml_cache import SamlCache
 from .saml_login import SamlLogin, AuthConfig
 
 LOG = logging.getLogger(__name__)
@@ -30,21 +44,86 @@ class AwsSAMLRole:
         return self.arn.split("/")[1]
 
 
+SamlProvider = Callable[[str, str], Awaitable[str]]
+AzureApp = Tuple[str, str]
+
+
+@dataclass
+class LoginResult:
+    profile: Optional[str]
+    role: Optional[AwsSAMLRole] = None
+    expiration_time: Optional[datetime.datetime] = None
+    error: Optional[Exception] = None
+    # In the fields of the STS Credentials, see AwsAd.credentials:
+    credentials: Optional[dict] = None
+
+
 class AwsAd:
     AWS_MIN_SESSION_DURATION = 900
+    # Seconds before expiry where a refreshing session logs in again.
+    REFRESH_MARGIN = 15 * 60
+    # Seconds to wait for a login to the profile in another process, which may wait for MFA.
+    LOGIN_LOCK_TIMEOUT = 180
+    # Endpoint overrides per AWS service, e.g. for testing against local fakes.
+    ENDPOINT_URLS: Dict[str, str] = {}
+    _SAML_CACHE = SamlCache()
 
-    def __init__(self, profile: str):
+    def __init__(self, profile: str, saml_provider: Optional[SamlProvider] = None):
+        """
+        The SAML response is retrieved with saml_provider(tenant_id, app_id) if given, else from the dnbad agent if
+        it is running, else by logging in with SamlLogin.
+        """
         self.profile = profile
+        self._saml_provider = saml_provider
         self._local_config = LocalConfig.load()
         self._aws_config: AwsConfig = AwsConfig.load(profile)
 
-    def has_valid_credentials(self) -> bool:
+    def has_valid_credentials(self, margin: float = 0) -> bool:
+        """ True if the credentials do not expire within margin seconds. """
         return self._aws_config.aws_expiration_time is not None and \
-               self._aws_config.aws_expiration_time > datetime.datetime.now(tz.UTC)
+               self._aws_config.aws_expiration_time > datetime.datetime.now(tz.UTC) + datetime.timedelta(seconds=margin)
+
+    def _refresh_margin(self, margin: float) -> float:
+        """ The margin, clamped to the session duration of the profile (see clamp_refresh_margin). """
+        return clamp_refresh_margin(margin, self._aws_config.aws_session_duration)
+
+    def credentials(self) -> dict:
+        """ The stored credentials, in the fields of the STS Credentials. Expiration is in ISO 8601. """
+        return {
+            "AccessKeyId": self._aws_config.aws_access_key_id,
+            "SecretAccessKey": self._aws_config.aws_secret_access_key,
+            "SessionToken": self._aws_config.aws_session_token,
+            "Expiration": self._aws_config.aws_expiration_time.isoformat()
+            if self._aws_config.aws_expiration_time else None
+        }
 
     def session(self) -> boto3.Session:
         return boto3.Session(profile_name=self.profile)
 
+    def refreshing_session(
+            self,
+            region_name: Optional[str] = None,
+            auth_config: Optional[AuthConfig] = None,
+            refresh_margin: float = REFRESH_MARGIN
+    ) -> boto3.Session:
+        """
+        A session for long running processes, with credentials which are refreshed in place `refresh_margin` seconds
+        (at most half the session duration) before they expire, in a background thread. Clients of the session may be
+        shared between threads, which share one refresh. The refresh logs in if another process has not already done so.
+        """
+        # The margin depends on the session duration, which is known after a login:
+        self.login_if_invalid_credentials(auth_config, refresh_margin)
+        refresh_margin = self._refresh_margin(refresh_margin)
+
+        def fetch() -> dict:
+            aws_ad = AwsAd(self.profile, self._saml_provider)
+            return aws_ad.login_if_invalid_credentials(auth_config, refresh_margin).credentials()
+
+        botocore_session = botocore.session.Session(profile=self.profile)
+        # botocore has no public setter for refreshable credentials:
+        botocore_session._credentials = create_refreshing_credentials(fetch, refresh_margin)
+        return boto3.Session(botocore_session=botocore_session, region_name=region_name)
+
     @classmethod
     def _get_aws_saml_roles(cls, saml_xml: ElementTree) -> List[AwsSAMLRole]:
         roles = []
@@ -80,9 +159,19 @@ class AwsAd:
             self._aws_config.aws_default_role_arn = role
         return role
 
+    @classmethod
+    def _sts_client(cls):
+        # A session per client, since the default session is not thread safe, and STS calls run in an executor.
+        return boto3.Session().client('sts', endpoint_url=cls.ENDPOINT_URLS.get('sts'))
+
+    @staticmethod
+    async def _in_executor(func: Callable, *args, **kwargs):
+        """ Runs a blocking call (e.g. to STS) in the default executor, such that the event loop is not blocked. """
+        return await asyncio.get_running_loop().run_in_executor(None, functools.partial(func, *args, **kwargs))
+
     @classmethod
     def _get_max_session_duration(cls, saml_response: str, role: AwsSAMLRole) -> int:
-        min_credentials = boto3.client('sts').assume_role_with_saml(
+        min_credentials = cls._sts_client().assume_role_with_saml(
             RoleArn=role.arn,
             PrincipalArn=role.principal_arn,
             SAMLAssertion=saml_response,
@@ -92,24 +181,61 @@ class AwsAd:
             aws_access_key_id=min_credentials["AccessKeyId"],
             aws_secret_access_key=min_credentials["SecretAccessKey"],
             aws_session_token=min_credentials["SessionToken"]
-        ).resource("iam").Role(role.role_name()).max_session_duration
+        ).resource("iam", endpoint_url=cls.ENDPOINT_URLS.get('iam')).Role(role.role_name()).max_session_duration
 
     @classmethod
     def _assume_role(cls, saml_response: str, role: AwsSAMLRole, session_duration: Optional[int]) -> dict:
-        return boto3.client('sts').assume_role_with_saml(
+        return cls._sts_client().assume_role_with_saml(
             RoleArn=role.arn,
             PrincipalArn=role.principal_arn,
             SAMLAssertion=saml_response,
             DurationSeconds=session_duration
         )["Credentials"]
 
-    def login_if_invalid_credentials(self, auth_config: Optional[AuthConfig] = None) -> "AwsAd":
-        if not self.has_valid_credentials():
-            self.login(auth_config)
+    def login_if_invalid_credentials(self, auth_config: Optional[AuthConfig] = None, margin: float = 0) -> "AwsAd":
+        return run_sync(self.login_if_invalid_credentials_async(auth_config, margin))
+
+    async def login_if_invalid_credentials_async(
+            self, auth_config: Optional[AuthConfig] = None, margin: float = 0
+    ) -> "AwsAd":
+        """
+        Logs in if the credentials have expired, or expire within margin seconds, clamped to half the session duration.
+        One process (or task) at a time logs in to a profile. The others wait for it, and use its credentials.
+        """
+        if self.has_valid_credentials(self._refresh_margin(margin)):
+            return self
+        lock = self._login_lock()
+        if not lock.try_acquire():
+            LOG.info(f"Waiting for another login to '{self.profile or 'default'}'.")
+            try:
+                # The OS releases the lock of a holder which crashed:
+                await lock.acquire_async()
+            except LockTimeoutError:
+                self._aws_config = AwsConfig.load(self.profile)
+                if self.has_valid_credentials(self._refresh_margin(margin)):
+                    return self
+                raise AdUtilException(f"Timed out after {self.LOGIN_LOCK_TIMEOUT}s waiting for another login to "
+                                      f"'{self.profile or 'default'}'.")
+        try:
+            self._aws_config = AwsConfig.load(self.profile)
+            if not self.has_valid_credentials(self._refresh_margin(margin)):
+                await self.login_async(auth_config)
+            else:
+                LOG.info(f"Using the credentials of another login to '{self.profile or 'default'}'.")
+        finally:
+            lock.release()
         return self
 
-    def setup_default_boto3_session(self, region_name: Optional[str] = None) -> "AwsAd":
-        boto3.setup_default_session(profile_name=self.profile, region_name=region_name)
+    def _login_lock(self) -> FileLock:
+        """ Held while logging in to the profile, by one process (or task) at a time. """
+        return FileLock(get_data_file_path(f"login_{self.profile or 'default'}.lock"), self.LOGIN_LOCK_TIMEOUT)
+
+    def setup_default_boto3_session(self, region_name: Optional[str] = None, refreshing: bool = False) -> "AwsAd":
+        """ With refreshing, the default session is a refreshing_session. """
+        if refreshing:
+            boto3.DEFAULT_SESSION = self.refreshing_session(region_name)
+        else:
+            boto3.setup_default_session(profile_name=self.profile, region_name=region_name)
         return self
 
     def setup_default_boto3_session_environment(self, region_name: Optional[str] = None) -> "AwsAd":
@@ -119,31 +245,322 @@ class AwsAd:
         return self
 
     def login(self, auth_config: Optional[AuthConfig] = None):
+        run_sync(self.login_async(auth_config))
+
+    async def login_async(self, auth_config: Optional[AuthConfig] = None):
+        with trace.span("awsad.login", profile=self.profile):
+            await self._login(auth_config)
+
+    async def _login(self, auth_config: Optional[AuthConfig]):
         auth_config = auth_config or AuthConfig()
-        saml_response = SamlLogin(
-            auth_config=auth_config,
-            password_manager=PasswordManager(self._local_config.username),
-            tenant_id=self._aws_config.azure_tenant_id,
-            app_id=self._aws_config.azure_app_id
-        ).login()
-        LOG.info("SAML Response retrieved")
+        saml_response, cached = await self._saml_response(auth_config)
 
         saml_xml = Saml.response_to_xml(saml_response)
         aws_roles = self._get_aws_saml_roles(saml_xml)
         aws_role = self._choose_role(aws_roles)
 
-        if self._aws_config.aws_session_duration is None:
-            max_session_duration = self._get_max_session_duration(saml_response, aws_role)
-            self._aws_config.aws_session_duration = max_session_duration
+        async def fresh_saml_response() -> str:
+            return (await self._saml_response(auth_config, use_cache=False))[0]
+
+        credentials = await self._credentials_for_saml_response(saml_response, cached, aws_role, fresh_saml_response)
 
-        credentials = self._assume_role(
-            saml_response=saml_response,
-            role=aws_role,
-            session_duration=self._aws_config.aws_session_duration
-        )
         self._put_credentials_in_config(credentials, aws_role.arn)
-        self._aws_config.save()
+        with trace.span("awsad.config_save"):
+            self._aws_config.save()
+            CredentialCache(self.profile).save(self.credentials())
+
+        self._print_summary(aws_role)
+
+    async def _credentials_for_saml_response(
+            self,
+            saml_response: str,
+            cached: bool,
+            aws_role: AwsSAMLRole,
+            fresh_saml_response: Callable[[], Awaitable[str]]
+    ) -> dict:
+        """
+        Assumes the role. A cached SAML Response rejected by STS (e.g. revoked) is removed from the cache, and the role
+        is assumed once more with the response of fresh_saml_response().
+        """
+        try:
+            return await self._credentials_for_role(saml_response, aws_role)
+        except ClientError as e:
+            if not cached:
+                raise
+            LOG.info(f"Cached SAML Response was rejected ({e.response['Error']['Code']}). Logging in again.")
+            self._SAML_CACHE.delete(*self._azure_app())
+            return await self._credentials_for_role(await fresh_saml_response(), aws_role)
+
+    async def _credentials_for_role(self, saml_response: str, aws_role: AwsSAMLRole) -> dict:
+        if self._aws_config.aws_session_duration is None:
+            self._aws_config.aws_session_duration = await self._session_duration(saml_response, aws_role)
+        try:
+            return await self._assume_role_async(saml_response, aws_role)
+        except ClientError as e:
+            if not self._is_session_duration_error(e):
+                raise
+            # The duration of the SAML response, the cache or the profile exceeds the max of the role:
+            LOG.info(f"Session duration {self._aws_config.aws_session_duration}s was rejected. Looking it up.")
+            self._aws_config.aws_session_duration = await self._probe_session_duration(saml_response, aws_role)
+            return await self._assume_role_async(saml_response, aws_role)
+
+    async def _assume_role_async(self, saml_response: str, aws_role: AwsSAMLRole) -> dict:
+        with trace.span("sts.assume_role_with_saml"):
+            return await self._in_executor(
+                self._assume_role,
+                saml_response=saml_response,
+                role=aws_role,
+                session_duration=self._aws_config.aws_session_duration
+            )
+
+    async def _session_duration(self, saml_response: str, aws_role: AwsSAMLRole) -> int:
+        """ The SessionDuration of the SAML response, else the cached max of the role, else probed from the role. """
+        values = Saml.get_saml_response_values(Saml.response_to_xml(saml_response), "SessionDuration")
+        if values:
+            LOG.info(f"Session duration from the SAML Response: {values[0]}s.")
+            return int(values[0])
+        metadata = RoleMetadataCache().get(aws_role.arn)
+        if metadata:
+            LOG.info(f"Session duration from the role metadata cache: {metadata.max_session_duration}s.")
+            return metadata.max_session_duration
+        return await self._probe_session_duration(saml_response, aws_role)
+
+    async def _probe_session_duration(self, saml_response: str, aws_role: AwsSAMLRole) -> int:
+        with trace.span("sts.max_session_duration"):
+            max_session_duration = await self._in_executor(self._get_max_session_duration, saml_response, aws_role)
+        RoleMetadataCache().put(aws_role.arn, max_session_duration)
+        return max_session_duration
+
+    @staticmethod
+    def _is_session_duration_error(e: ClientError) -> bool:
+        error = e.response.get("Error", {})
+        return error.get("Code") == "ValidationError" and "DurationSeconds" in error.get("Message", "")
+
+    def _azure_app(self) -> Tuple[str, str]:
+        return self._aws_config.azure_tenant_id, self._aws_config.azure_app_id
+
+    async def _saml_response(self, auth_config: AuthConfig, use_cache: bool = True) -> Tuple[str, bool]:
+        """ Returns the SAML response, and whether it was cached. Profiles of the same app share cached responses. """
+        tenant_id, app_id = self._azure_app()
+        if use_cache:
+            saml_response = self._SAML_CACHE.get(tenant_id, app_id)
+            if saml_response:
+                return saml_response, True
+        with trace.span("saml.login"):
+            saml_response = await self._retrieve_saml_response(auth_config)
+        LOG.info("SAML Response retrieved")
+        self._SAML_CACHE.put(tenant_id, app_id, saml_response)
+        return saml_response, False
+
+    async def _retrieve_saml_response(self, auth_config: AuthConfig) -> str:
+        tenant_id, app_id = self._azure_app()
+        if self._saml_provider:
+            return await self._saml_provider(tenant_id, app_id)
+        if auth_config.use_agent:
+            agent = AgentClient()
+            if agent.available():
+                LOG.info("Retrieving SAML Response from the dnbad agent.")
+                return await agent.saml_async(tenant_id, app_id)
+        return await SamlLogin(
+            auth_config=auth_config,
+            password_manager=PasswordManager(self._local_config.username),
+            tenant_id=tenant_id,
+            app_id=app_id
+        ).login_async()
+
+    @classmethod
+    def login_many(
+            cls, profiles: Sequence[Optional[str]], auth_config: Optional[AuthConfig] = None, concurrency: int = 8
+    ) -> List[LoginResult]:
+        return run_sync(cls.login_many_async(profiles, auth_config, concurrency))
+
+    @classmethod
+    async def login_many_async(
+            cls, profiles: Sequence[Optional[str]], auth_config: Optional[AuthConfig] = None, concurrency: int = 8
+    ) -> List[LoginResult]:
+        """
+        Logs in to the profiles in one pass. One SAML response is retrieved per Azure app (in one browser), the roles
+        are assumed concurrently, and the credentials of all profiles are written at the end, with one write per file.
+        A failing profile does not stop the others. Its error is in the result. Profiles with a login in another process
+        are not logged in again, and get the credentials of that login.
+        """
+        auth_config = auth_config or AuthConfig()
+        results = {profile: LoginResult(profile) for profile in profiles}
+        aws_ads: List[AwsAd] = []
+        for profile in results:
+            try:
+                aws_ads.append(cls(profile))
+            except AdUtilException as e:
+                results[profile].error = e
+        if not aws_ads:
+            return list(results.values())
+
+        # Profiles with a login in another process (or task) use its credentials, as login_if_invalid_credentials.
+        locks: Dict[AwsAd, FileLock] = {}
+        others: List[AwsAd] = []
+        for aws_ad in aws_ads:
+            lock = aws_ad._login_lock()
+            if lock.try_acquire():
+                locks[aws_ad] = lock
+            else:
+                others.append(aws_ad)
+
+        async def login_locked():
+            try:
+                to_login = []
+                for aws_ad in locks:
+                    expiration_time = aws_ad._aws_config.aws_expiration_time
+                    aws_ad._aws_config = AwsConfig.load(aws_ad.profile)
+                    if aws_ad._aws_config.aws_expiration_time != expiration_time:
+                        LOG.info(f"Using the credentials of another login to '{aws_ad.profile or 'default'}'.")
+                        aws_ad._set_stored_result(results[aws_ad.profile])
+                    else:
+                        to_login.append(aws_ad)
+                if to_login:
+                    await cls._login_many(to_login, results, auth_config, concurrency)
+            finally:
+                for lock in locks.values():
+                    lock.release()
+
+        await asyncio.gather(login_locked(), *(aws_ad._await_other_login(results[aws_ad.profile]) for aws_ad in others))
+        return list(results.values())
+
+    async def _await_other_login(self, result: LoginResult):
+        """ Waits for the login to the profile in another process (or task), and takes its credentials. """
+        LOG.info(f"Waiting for another login to '{self.profile or 'default'}'.")
+        lock = self._login_lock()
+        try:
+            await lock.acquire_async()
+        except LockTimeoutError:
+            pass
+        else:
+            lock.release()
+        self._aws_config = AwsConfig.load(self.profile)
+        if self.has_valid_credentials():
+            self._set_stored_result(result)
+        else:
+            result.error = AdUtilException(f"Another login to '{self.profile or 'default'}' failed, or did not finish "
+                                           f"within {self.LOGIN_LOCK_TIMEOUT}s.")
+
+    def _set_stored_result(self, result: LoginResult):
+        result.expiration_time = self._aws_config.aws_expiration_time
+        result.credentials = self.credentials()
+
+    @classmethod
+    async def _login_many(
+            cls, aws_ads: List["AwsAd"], results: Dict[Optional[str], LoginResult], auth_config: AuthConfig,
+            concurrency: int
+    ):
+        username = aws_ads[0]._local_config.username
+        with trace.span("saml.login_many"):
+            saml_responses, cached_apps = await cls._saml_responses_for_apps(
+                {aws_ad._azure_app() for aws_ad in aws_ads}, auth_config, username
+            )
+        # Profiles of an app with a rejected cached response share one new response:
+        fresh_responses: Dict[AzureApp, asyncio.Future] = {}
+
+        def fresh_saml_response(app: AzureApp) -> Callable[[], Awaitable[str]]:
+            async def fresh() -> str:
+                if app not in fresh_responses:
+                    fresh_responses[app] = asyncio.ensure_future(
+                        cls._saml_responses_for_apps({app}, auth_config, username, use_cache=False)
+                    )
+                response = (await asyncio.shield(fresh_responses[app]))[0][app]
+                if isinstance(response, Exception):
+                    raise response
+                return response
+            return fresh
+
+        # Roles are chosen one by one, since the user may be asked:
+        roles: Dict[AwsAd, AwsSAMLRole] = {}
+        for aws_ad in aws_ads:
+            saml_response = saml_responses[aws_ad._azure_app()]
+            try:
+                if isinstance(saml_response, Exception):
+                    raise saml_response
+                roles[aws_ad] = aws_ad._choose_role(aws_ad._get_aws_saml_roles(Saml.response_to_xml(saml_response)))
+            except Exception as e:
+                results[aws_ad.profile].error = e
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def assume_role(aws_ad: AwsAd, role: AwsSAMLRole):
+            result = results[aws_ad.profile]
+            try:
+                async with semaphore:
+                    app = aws_ad._azure_app()
+                    credentials = await aws_ad._credentials_for_saml_response(
+                        saml_responses[app], app in cached_apps, role, fresh_saml_response(app)
+                    )
+            except Exception as e:
+                LOG.warning(f"Assuming role '{role.arn}' for profile '{aws_ad.profile or 'default'}' failed: {e!r}")
+                result.error = e
+                return
+            aws_ad._put_credentials_in_config(credentials, role.arn)
+            result.role = role
+            result.expiration_time = aws_ad._aws_config.aws_expiration_time
+            result.credentials = aws_ad.credentials()
+
+        with trace.span("sts.assume_role_with_saml_many", roles=len(roles)):
+            await asyncio.gather(*(assume_role(aws_ad, role) for aws_ad, role in roles.items()))
+        logged_in = [aws_ad for aws_ad in aws_ads if results[aws_ad.profile].error is None]
+        with trace.span("awsad.config_save"):
+            AwsConfig.save_all([aws_ad._aws_config for aws_ad in logged_in])
+            for aws_ad in logged_in:
+                CredentialCache(aws_ad.profile).save(aws_ad.credentials())
+
+    @classmethod
+    async def _saml_responses_for_apps(
+            cls, apps: Set[AzureApp], auth_config: AuthConfig, username: str, use_cache: bool = True
+    ) -> Tuple[Dict[AzureApp, Union[str, Exception]], Set[AzureApp]]:
+        """
+        The SAML response, or the error, per app, and the apps whose response came from the cache.
+        Apps not in the cache are retrieved together.
+        """
+        responses: Dict[AzureApp, Union[str, Exception]] = {}
+        for app in apps if use_cache else []:
+            saml_response = cls._SAML_CACHE.get(*app)
+            if saml_response:
+                responses[app] = saml_response
+        cached = set(responses)
+        missing = [app for app in apps if app not in responses]
+        if not missing:
+            return responses, cached
+
+        agent = AgentClient() if auth_config.use_agent else None
+        if agent and agent.available():
+            LOG.info("Retrieving SAML Responses from the dnbad agent.")
+            values = await asyncio.gather(*(agent.saml_async(*app) for app in missing), return_exceptions=True)
+            results = [
+                AuthResult(app, error=value) if isinstance(value, Exception) else AuthResult(app, value)
+                for app, value in zip(missing, values)
+            ]
+        else:
+            results = [
+                result async for result in SamlLogin.login_many(auth_config, PasswordManager(username), missing)
+            ]
+        for result in results:
+            if result.error is not None:
+                responses[result.target] = result.error
+            else:
+                responses[result.target] = result.value
+                cls._SAML_CACHE.put(*result.target, result.value)
+        LOG.info(f"SAML Responses retrieved for {len(missing)} app(s).")
+        return responses, cached
+
+    @staticmethod
+    def print_login_summary(results: Sequence[LoginResult]):
+        rows = [("Profile", "Role", "Credentials expire at")]
+        for result in results:
+            if result.error is not None:
+                status = f"FAILED: {result.error}"
+            else:
+                status = f"{result.expiration_time.astimezone(tz.tzlocal()):%Y-%m-%d %H:%M:%S %Z}"
+            rows.append((result.profile or "default", result.role.role_name() if result.role else "-", status))
+        widths = [max(len(row[i]) for row in rows) for i in range(2)]
+        print("\n".join(f"{row[0]:<{widths[0]}}  {row[1]:<{widths[1]}}  {row[2]}" for row in rows))
 
+    def _print_summary(self, aws_role: AwsSAMLRole):
         delimiter = ''.join(['-'] * 60)
         expiration_time = self._aws_config.aws_expiration_time.astimezone(tz.tzlocal())
         print(
@@ -0,0 +1,130 @@
+"""
+Serves the credentials of a profile to the AWS CLI and SDKs as a credential_process, e.g. in ~/.aws/config:
+
+    [profile my-tool]
+    credential_process = awsad credentials -p <awsad profile>
+
+The AWS CLI and SDKs run the process for every new session, so a cache hit only reads a small JSON file, written on
+every login, and only imports the standard library. The login (with boto3 and the browser) is imported when the
+credentials have expired, or expire within the refresh margin.
+"""
+import argparse
+import datetime
+import json
+import logging
+import os
+import sys
+from typing import *
+
+from dnbad.common import get_data_file_path
+
+__all__ = ["CredentialCache", "clamp_refresh_margin", "awsad_main", "main"]
+
+COMMAND = "credentials"
+# The AWS SDKs refresh credentials which expire within 15 minutes, and would then run the process for every call.
+REFRESH_MARGIN = 20 * 60
+# The largest refresh margin, as a fraction of the lifetime of the credentials.
+MAX_REFRESH_MARGIN_FRACTION = 0.5
+
+
+def clamp_refresh_margin(margin: float, lifetime: Optional[float]) -> float:
+    """
+    The margin, at most half the lifetime (e.g. the session duration) of the credentials if known.
+    Else fresh credentials of a short session would be within the margin, and be refreshed on every use.
+    """
+    if lifetime is None:
+        return margin
+    return min(margin, lifetime * MAX_REFRESH_MARGIN_FRACTION)
+
+
+class CredentialCache:
+    """ The last credentials of a profile, in the output format of a credential_process. """
+
+    def __init__(self, profile: Optional[str]):
+        self.path = get_data_file_path(f"credentials_{profile or 'default'}.json")
+
+    def load(self) -> Optional[dict]:
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def save(self, credentials: dict):
+        """ Takes the credentials in the fields of the STS Credentials, with Expiration in ISO 8601. """
+        # Imported here, since utils imports asyncio, which is slow to import and not needed to serve a cache hit.
+        from dnbad.common.utils import atomic_write
+        atomic_write(self.path, json.dumps({"Version": 1, **credentials}))
+
+    def lifetime(self, credentials: Optional[dict]) -> Optional[float]:
+        """ Seconds from the login, when the file was written, to the expiration of the credentials. """
+        try:
+            expiration = datetime.datetime.fromisoformat(credentials["Expiration"])
+            return expiration.timestamp() - os.path.getmtime(self.path)
+        except (TypeError, KeyError, ValueError, OSError):
+            return None
+
+    @staticmethod
+    def is_fresh(credentials: Optional[dict], margin: float) -> bool:
+        """ True if the credentials do not expire within margin seconds. """
+        try:
+            expiration = datetime.datetime.fromisoformat(credentials["Expiration"])
+        except (TypeError, KeyError, ValueError):
+            return False
+        return expiration - datetime.timedelta(seconds=margin) > datetime.datetime.now(datetime.timezone.utc)
+
+
+def add_arguments_to_parser(parser: argparse.ArgumentParser):
+    parser.add_argument("-p", "--profile", help="AWS Profile")
+    parser.add_argument("-m", "--refresh-margin", help="Login if the credentials expire within this many seconds",
+                        type=int, default=REFRESH_MARGIN)
+
+
+def serve(profile: Optional[str], refresh_margin: float = REFRESH_MARGIN) -> int:
+    """ Prints the credentials of the profile as JSON on stdout, logging in if needed. """
+    cache = CredentialCache(profile)
+    credentials = cache.load()
+    if not cache.is_fresh(credentials, clamp_refresh_margin(refresh_margin, cache.lifetime(credentials))):
+        try:
+            credentials = _login(profile, refresh_margin)
+        except Exception as e:
+            print(f"awsad: Could not get credentials for '{profile or 'default'}': {e}", file=sys.stderr)
+            return 1
+    json.dump(credentials, sys.stdout)
+    return 0
+
+
+def _login(profile: Optional[str], refresh_margin: float) -> dict:
+    """ Logs in with the full stack. Everything is printed to stderr, since stdout is read by the AWS CLI. """
+    from contextlib import redirect_stdout
+    from .awsad import AwsAd
+
+    logging.basicConfig(stream=sys.stderr, level=logging.INFO, format="%(levelname)-8s %(message)s")
+    with redirect_stdout(sys.stderr):
+        aws_ad = AwsAd(profile).login_if_invalid_credentials(margin=refresh_margin)
+    # Credentials from a login are cached by AwsAd, but valid credentials from an older version may not be:
+    credentials = {"Version": 1, **aws_ad.credentials()}
+    CredentialCache(profile).save(aws_ad.credentials())
+    return credentials
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(f"awsad {COMMAND}", description="Credentials as an AWS credential_process")
+    add_arguments_to_parser(parser)
+    # As --trace of the other commands of awsad, but the summary is printed to stderr:
+    parser.add_argument("--trace", help="Write timing spans as JSON lines to the file, and print a summary",
+                        metavar="FILE")
+    args = parser.parse_args(argv)
+    if args.trace:
+        from dnbad.common import trace
+        with trace.export(args.trace, f"awsad.{COMMAND}", summary_file=sys.stderr):
+            return serve(args.profile, args.refresh_margin)
+    return serve(args.profile, args.refresh_margin)
+
+
+def awsad_main() -> int:
+    """ Entry point of awsad. The credential process is dispatched before the imports of the other commands. """
+    if sys.argv[1:2] == [COMMAND]:
+        return main(sys.argv[2:])
+    from dnbad.cli_awsad import main as cli_main
+    return cli_main()
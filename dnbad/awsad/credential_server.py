@@ -0,0 +1,226 @@
+import asyncio
+import datetime
+import json
+import logging
+import secrets
+import signal
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import *
+
+from dateutil import tz
+
+from dnbad.common import trace
+from dnbad.common.utils import run_sync
+from .awsad import AwsAd, AuthConfig, LoginResult
+from .credential_process import clamp_refresh_margin
+
+__all__ = ["CredentialServer"]
+
+LOG = logging.getLogger(__name__)
+
+
+class CredentialServer:
+    """
+    Serves the credentials of profiles from memory on localhost, in the format of the container credential provider
+    of the AWS SDKs. A client sets, for a profile:
+
+        AWS_CONTAINER_CREDENTIALS_FULL_URI=http://127.0.0.1:<port>/<profile>
+        AWS_CONTAINER_AUTHORIZATION_TOKEN=<token>
+
+    The credentials are refreshed `refresh_margin` seconds (at most half their lifetime) before they expire, and the
+    SDKs pick them up by themselves.
+    A request for credentials which have expired anyway (e.g. after a failed refresh) waits for a refresh, which is
+    shared by all requests for the profile.
+    """
+    # The AWS SDKs refresh credentials which expire within 15 minutes.
+    REFRESH_MARGIN = 20 * 60
+    RETRY_TIME = 60
+    REQUEST_TIMEOUT = 180
+    DEFAULT_PROFILE = "default"
+
+    def __init__(
+            self,
+            profiles: Sequence[Optional[str]],
+            auth_config: Optional[AuthConfig] = None,
+            port: int = 0,
+            refresh_margin: float = REFRESH_MARGIN,
+            token: Optional[str] = None
+    ):
+        self.profiles = list(profiles)
+        self.auth_config = auth_config or AuthConfig()
+        self.port = port
+        self.refresh_margin = refresh_margin
+        self.token = token or secrets.token_urlsafe(32)
+        self._credentials: Dict[Optional[str], dict] = {}
+        self._received_at: Dict[Optional[str], datetime.datetime] = {}
+        self._lock = threading.Lock()
+        self._refreshing: Dict[Optional[str], asyncio.Future] = {}
+        self._retry_at: Dict[Optional[str], datetime.datetime] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stop: Optional[asyncio.Event] = None
+        self._http: Optional[ThreadingHTTPServer] = None
+
+    def url(self, profile: Optional[str]) -> str:
+        return f"http://127.0.0.1:{self.port}/{profile or self.DEFAULT_PROFILE}"
+
+    def run_sync(self, started: Optional[Callable[[], None]] = None):
+        run_sync(self.run(started))
+
+    async def run(self, started: Optional[Callable[[], None]] = None):
+        self._loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+        for profile in self.profiles:
+            aws_ad = AwsAd(profile)
+            if aws_ad.has_valid_credentials(self.refresh_margin):
+                self._set_credentials(profile, aws_ad.credentials())
+        self._http = ThreadingHTTPServer(("127.0.0.1", self.port), self._handler_class())
+        self.port = self._http.server_port
+        threading.Thread(target=self._http.serve_forever, daemon=True).start()
+        try:
+            self._loop.add_signal_handler(signal.SIGTERM, self._stop.set)
+        except (NotImplementedError, RuntimeError):
+            # Not in the main thread (e.g. in tests):
+            pass
+        LOG.info(f"Serving credentials on http://127.0.0.1:{self.port}")
+        if started:
+            started()
+        try:
+            while not self._stop.is_set():
+                due = self._due_profiles()
+                if due:
+                    await self.refresh(due)
+                try:
+                    await asyncio.wait_for(self._stop.wait(), timeout=self._seconds_to_next_refresh())
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._http.shutdown()
+            self._http.server_close()
+
+    def stop(self):
+        self._loop.call_soon_threadsafe(self._stop.set)
+
+    def _set_credentials(self, profile: Optional[str], credentials: dict):
+        with self._lock:
+            self._credentials[profile] = credentials
+            self._received_at[profile] = datetime.datetime.now(tz.UTC)
+
+    def _get_credentials(self, profile: Optional[str]) -> Optional[dict]:
+        with self._lock:
+            return self._credentials.get(profile)
+
+    def _refresh_at(self, profile: Optional[str]) -> datetime.datetime:
+        credentials = self._get_credentials(profile)
+        if profile in self._retry_at:
+            return self._retry_at[profile]
+        if credentials is None:
+            # Due at once. A time of now would be later than the now of the caller.
+            return datetime.datetime.min.replace(tzinfo=tz.UTC)
+        expiration = datetime.datetime.fromisoformat(credentials["Expiration"])
+        lifetime = (expiration - self._received_at[profile]).total_seconds()
+        return expiration - datetime.timedelta(seconds=clamp_refresh_margin(self.refresh_margin, lifetime))
+
+    def _due_profiles(self) -> List[Optional[str]]:
+        now = datetime.datetime.now(tz.UTC)
+        return [p for p in self.profiles if self._refresh_at(p) <= now]
+
+    def _seconds_to_next_refresh(self) -> float:
+        next_refresh = min(self._refresh_at(p) for p in self.profiles)
+        return max(1.0, (next_refresh - datetime.datetime.now(tz.UTC)).total_seconds())
+
+    async def refresh(self, profiles: Sequence[Optional[str]]):
+        """ Logs in to the profiles, in one pass. Profiles with a refresh in flight wait for it instead. """
+        new = [p for p in profiles if p not in self._refreshing]
+        if new:
+            task = asyncio.ensure_future(self._login(new))
+            for profile in new:
+                self._refreshing[profile] = task
+            task.add_done_callback(lambda _: [self._refreshing.pop(p, None) for p in new])
+        tasks = {self._refreshing[p] for p in profiles if p in self._refreshing}
+        # A request which times out must not cancel the refresh for the others:
+        await asyncio.gather(*(asyncio.shield(task) for task in tasks))
+
+    async def _login(self, profiles: List[Optional[str]]):
+        try:
+            with trace.span("awsad.serve.refresh", profiles=len(profiles)):
+                results = await AwsAd.login_many_async(profiles, self.auth_config)
+        except Exception as e:
+            results = [LoginResult(profile, error=e) for profile in profiles]
+        for result in results:
+            if result.error is None:
+                self._retry_at.pop(result.profile, None)
+                self._set_credentials(result.profile, result.credentials)
+                expiration = result.expiration_time.astimezone(tz.tzlocal())
+                LOG.info(f"Refreshed credentials of '{result.profile or 'default'}', "
+                         f"expiring at {expiration:%Y-%m-%d %H:%M:%S %Z}.")
+            else:
+                LOG.warning(f"Refreshing credentials of '{result.profile or 'default'}' failed: {result.error}. "
+                            f"Retrying in {self.RETRY_TIME}s.")
+                self._retry_at[result.profile] = \
+                    datetime.datetime.now(tz.UTC) + datetime.timedelta(seconds=self.RETRY_TIME)
+
+    @staticmethod
+    def _has_expired(credentials: Optional[dict]) -> bool:
+        return credentials is None or \
+               datetime.datetime.fromisoformat(credentials["Expiration"]) <= datetime.datetime.now(tz.UTC)
+
+    def credentials_for_request(self, profile: Optional[str]) -> Optional[dict]:
+        """ Called from the HTTP threads. Waits for a refresh if the credentials have expired. """
+        credentials = self._get_credentials(profile)
+        if self._has_expired(credentials):
+            refresh = asyncio.run_coroutine_threadsafe(self._refresh_for_request(profile), self._loop)
+            refresh.result(self.REQUEST_TIMEOUT)
+            credentials = self._get_credentials(profile)
+        return None if self._has_expired(credentials) else credentials
+
+    async def _refresh_for_request(self, profile: Optional[str]):
+        """
+        Joins the refresh of the profile in flight. Else refreshes, unless a refresh failed within the retry time, such
+        that the retries of the SDKs do not start a login (and an MFA prompt) each.
+        """
+        if profile in self._refreshing:
+            await asyncio.shield(self._refreshing[profile])
+        elif profile not in self._retry_at or self._retry_at[profile] <= datetime.datetime.now(tz.UTC):
+            await self.refresh([profile])
+
+    def _handler_class(self) -> type:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if not secrets.compare_digest(self.headers.get("Authorization", ""), server.token):
+                    self._send(401, {"message": "Invalid authorization token"})
+                    return
+                name = self.path.strip("/")
+                profile = None if name == server.DEFAULT_PROFILE else name
+                if profile not in server.profiles:
+                    self._send(404, {"message": f"Profile '{name}' is not served"})
+                    return
+                try:
+                    credentials = server.credentials_for_request(profile)
+                except Exception as e:
+                    LOG.warning(f"Serving credentials of '{name}' failed: {e!r}")
+                    credentials = None
+                if credentials is None:
+                    self._send(503, {"message": f"No credentials for '{name}'"})
+                    return
+                self._send(200, {
+                    "AccessKeyId": credentials["AccessKeyId"],
+                    "SecretAccessKey": credentials["SecretAccessKey"],
+                    "Token": credentials["SessionToken"],
+                    "Expiration": credentials["Expiration"]
+                })
+
+            def _send(self, status: int, body: dict):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                LOG.debug(f"{self.address_string()} {format % args}")
+
+        return Handler
@@ -1,12 +1,15 @@
-import asyncio
+from __future__ import annotations
+
 import re
 from dataclasses import dataclass
 from typing import *
 
-from pyppeteer.page import Page
-
 from dnbad.common.azure_auth import *
 from dnbad.common.password_manager import PasswordManager
+from dnbad.common.utils import run_sync
+
+if TYPE_CHECKING:
+    from pyppeteer.page import Page
 
 
 @dataclass(frozen=True)
@@ -31,11 +34,11 @@ class AzureAppsFinder:
         self.timeout = timeout
 
     def find_aws_apps_sync(self) -> List[AdApp]:
-        return asyncio.get_event_loop().run_until_complete(self.find_aws_apps())
+        return run_sync(self.find_aws_apps())
 
     async def find_aws_apps(self) -> List[AdApp]:
         async with single_auth_page(AzureAuthHandler(self.password_manager), self.config) as auth_page:
-            await auth_page.page.goto(self.APPS_URL)
+            await auth_page.goto(self.APPS_URL)
             await auth_page.await_after_auth(auth_page.page.waitForSelector(self.APP_ITEM_SELECTOR, visible=True))
 
             # Examine app results:
@@ -48,19 +51,17 @@ class AzureAppsFinder:
             m = re.search(f"(?<={key}=)[^&']+", s)
             return m.group(0) if m else None
 
-        async def get_attr(handle, attribute):
-            return await page.evaluate(f'(e) => e.getAttribute("{attribute}")', handle)
-
-        apps = []
-        aws_items = await page.querySelectorAll(cls.APP_ITEM_SELECTOR)
-        for item in aws_items:
-
-            title = await get_attr(item, "alt")
-            img_src = await get_attr(item, "src")
-
-            apps.append(AdApp(
+        # One evaluation for all items, instead of a round trip per item and attribute:
+        aws_items = await page.evaluate(
+            '(selector) => Array.from(document.querySelectorAll(selector))'
+            '.map(e => [e.getAttribute("alt"), e.getAttribute("src")])',
+            cls.APP_ITEM_SELECTOR
+        )
+        return [
+            AdApp(
                 title=title,
                 tenant_id=get_url_attr(img_src, 'tenantId'),
                 app_id=get_url_attr(img_src, 'appId')
-            ))
-        return apps
+            )
+            for title, img_src in aws_items
+        ]
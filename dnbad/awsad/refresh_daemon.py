@@ -0,0 +1,181 @@
+import asyncio
+import datetime
+import heapq
+import itertools
+import logging
+import signal
+import time
+from typing import *
+
+from dateutil import tz
+
+from dnbad.common import trace
+from dnbad.common.utils import run_sync
+from .aws_config import AwsConfig, MissingAwsConfigException
+from .awsad import AwsAd, AuthConfig, LoginResult
+
+__all__ = ["RefreshDaemon"]
+
+LOG = logging.getLogger(__name__)
+
+
+class RefreshDaemon:
+    """
+    Keeps the stored credentials of profiles valid, by logging in `refresh_margin` seconds before they expire.
+
+    The profiles are kept in a priority queue by their next refresh. Due profiles are refreshed in one pass, together
+    with the profiles of the same Azure apps due within `batch_window` seconds, since they share the SAML response.
+    A failing profile is retried with exponential backoff. The login is headless by default, with the saved cookies and
+    the password in the keyring.
+    """
+    REFRESH_MARGIN = 20 * 60
+    BATCH_WINDOW = 10 * 60
+    MIN_BACKOFF = 60
+    MAX_BACKOFF = 30 * 60
+    # The longest wait between checks of the queue. Waits do not count time where the computer sleeps.
+    POLL_TIME = 60
+
+    def __init__(
+            self,
+            profiles: Sequence[Optional[str]],
+            auth_config: Optional[AuthConfig] = None,
+            refresh_margin: float = REFRESH_MARGIN,
+            batch_window: float = BATCH_WINDOW,
+            max_backoff: float = MAX_BACKOFF
+    ):
+        self.profiles = list(profiles)
+        self.auth_config = auth_config or AuthConfig()
+        self.refresh_margin = refresh_margin
+        self.batch_window = batch_window
+        self.max_backoff = max_backoff
+        # Entries of (refresh at, sequence number, profile). The sequence number orders profiles due at the same time.
+        self._queue: List[Tuple[datetime.datetime, int, Optional[str]]] = []
+        self._sequence = itertools.count()
+        self._failures: Dict[Optional[str], int] = {}
+        self._stop: Optional[asyncio.Event] = None
+
+    def run_sync(self):
+        run_sync(self.run())
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+        try:
+            loop.add_signal_handler(signal.SIGTERM, self._stop.set)
+        except (NotImplementedError, RuntimeError):
+            # Not in the main thread (e.g. in tests):
+            pass
+        self.schedule_all()
+        while not self._stop.is_set() and self._queue:
+            await self.refresh_due()
+            try:
+                await asyncio.wait_for(self._stop.wait(), timeout=self._seconds_to_next_refresh())
+            except asyncio.TimeoutError:
+                pass
+
+    def schedule_all(self):
+        for profile in self.profiles:
+            refresh_at = self._stored_refresh_at(profile)
+            if refresh_at is not None:
+                self._schedule(profile, refresh_at)
+                LOG.info(f"Next refresh of '{profile or 'default'}' at {self._local_time(refresh_at)}.")
+
+    def next_refresh(self) -> Optional[Tuple[datetime.datetime, Optional[str]]]:
+        """ The time and profile of the next refresh, if any. """
+        return (self._queue[0][0], self._queue[0][2]) if self._queue else None
+
+    @staticmethod
+    def _local_time(t: datetime.datetime) -> str:
+        return f"{t.astimezone(tz.tzlocal()):%Y-%m-%d %H:%M:%S %Z}"
+
+    def _schedule(self, profile: Optional[str], refresh_at: datetime.datetime):
+        heapq.heappush(self._queue, (refresh_at, next(self._sequence), profile))
+
+    def _stored_refresh_at(
+            self, profile: Optional[str], now: Optional[datetime.datetime] = None
+    ) -> Optional[datetime.datetime]:
+        """ When the stored credentials of the profile are due (now if missing), or None if it is not configured. """
+        try:
+            expiration = AwsConfig.load(profile).aws_expiration_time
+        except MissingAwsConfigException as e:
+            LOG.warning(f"Not refreshing '{profile or 'default'}': {e}")
+            return None
+        if expiration is None:
+            return now or datetime.datetime.now(tz.UTC)
+        return expiration - datetime.timedelta(seconds=self.refresh_margin)
+
+    def _seconds_to_next_refresh(self) -> float:
+        if not self._queue:
+            return self.POLL_TIME
+        seconds = (self._queue[0][0] - datetime.datetime.now(tz.UTC)).total_seconds()
+        return min(max(seconds, 0), self.POLL_TIME)
+
+    def _next_batch(self) -> List[Optional[str]]:
+        """ Takes the due profiles, and the profiles of their apps due within the batch window, off the queue. """
+        now = datetime.datetime.now(tz.UTC)
+        due = []
+        while self._queue and self._queue[0][0] <= now:
+            _, _, profile = heapq.heappop(self._queue)
+            # Another process (e.g. awsad login) may have refreshed the profile already:
+            refresh_at = self._stored_refresh_at(profile, now) if profile not in self._failures else now
+            if refresh_at is None:
+                continue
+            if refresh_at > now:
+                self._schedule(profile, refresh_at)
+            else:
+                due.append(profile)
+        if not due:
+            return []
+
+        apps = {self._azure_app(profile) for profile in due}
+        window_end = now + datetime.timedelta(seconds=self.batch_window)
+        early = [
+            entry for entry in self._queue
+            if entry[0] <= window_end and entry[2] not in self._failures and self._azure_app(entry[2]) in apps
+        ]
+        if early:
+            self._queue = [entry for entry in self._queue if entry not in early]
+            heapq.heapify(self._queue)
+        return due + [profile for _, _, profile in early]
+
+    @staticmethod
+    def _azure_app(profile: Optional[str]) -> Optional[Tuple[str, str]]:
+        try:
+            config = AwsConfig.load(profile)
+        except MissingAwsConfigException:
+            return None
+        return config.azure_tenant_id, config.azure_app_id
+
+    async def refresh_due(self) -> List[LoginResult]:
+        """ Refreshes the due profiles in one pass, and schedules their next refresh. """
+        profiles = self._next_batch()
+        if not profiles:
+            return []
+        started = time.time()
+        try:
+            with trace.span("awsad.refresh_daemon.refresh", profiles=len(profiles)):
+                results = await AwsAd.login_many_async(profiles, self.auth_config)
+        except Exception as e:
+            results = [LoginResult(profile, error=e) for profile in profiles]
+        latency = time.time() - started
+        succeeded = [result for result in results if result.error is None]
+        LOG.info(f"Refreshed {len(succeeded)} of {len(profiles)} profile(s) in {latency:.1f}s.")
+
+        now = datetime.datetime.now(tz.UTC)
+        for result in results:
+            name = result.profile or "default"
+            if result.error is None:
+                self._failures.pop(result.profile, None)
+                # Sessions shorter than the margin are refreshed at the rate of failures, not continuously:
+                refresh_at = max(result.expiration_time - datetime.timedelta(seconds=self.refresh_margin),
+                                 now + datetime.timedelta(seconds=self.MIN_BACKOFF))
+                LOG.info(f"Refreshed '{name}'. Next refresh at {self._local_time(refresh_at)}.")
+            else:
+                failures = self._failures.get(result.profile, 0) + 1
+                self._failures[result.profile] = failures
+                backoff = min(self.MIN_BACKOFF * 2 ** (failures - 1), self.max_backoff)
+                refresh_at = now + datetime.timedelta(seconds=backoff)
+                LOG.warning(f"Refreshing '{name}' failed ({failures} in a row): {result.error}. "
+                            f"Retrying in {backoff:.0f}s.")
+            self._schedule(result.profile, refresh_at)
+        return results
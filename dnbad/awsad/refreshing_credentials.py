@@ -0,0 +1,76 @@
+import datetime
+import logging
+import threading
+import time
+import weakref
+from typing import *
+
+from botocore.credentials import RefreshableCredentials
+from dateutil import tz
+
+__all__ = ["create_refreshing_credentials"]
+
+LOG = logging.getLogger(__name__)
+
+# Returns credentials in the fields of the STS Credentials, with Expiration in ISO 8601 (see AwsAd.credentials).
+CredentialsFetcher = Callable[[], dict]
+
+
+def _to_metadata(credentials: dict) -> dict:
+    return {
+        "access_key": credentials["AccessKeyId"],
+        "secret_key": credentials["SecretAccessKey"],
+        "token": credentials["SessionToken"],
+        "expiry_time": credentials["Expiration"],
+    }
+
+
+def create_refreshing_credentials(
+        fetch: CredentialsFetcher,
+        refresh_margin: float,
+        background: bool = True
+) -> RefreshableCredentials:
+    """
+    Credentials which are refreshed in place with fetch, `refresh_margin` seconds before they expire.
+    botocore refreshes under a lock: In the margin one thread refreshes while the others use the current credentials,
+    and close to expiry all threads wait for the one refresh. With background, a daemon thread refreshes at the start
+    of the margin, such that no caller waits for a login. It stops when the credentials are garbage collected.
+    """
+    credentials = RefreshableCredentials.create_from_metadata(
+        metadata=_to_metadata(fetch()),
+        refresh_using=lambda: _to_metadata(fetch()),
+        method="dnbad-awsad"
+    )
+    credentials._advisory_refresh_timeout = refresh_margin
+    credentials._mandatory_refresh_timeout = min(RefreshableCredentials._mandatory_refresh_timeout, refresh_margin)
+    if background:
+        threading.Thread(
+            target=_refresh_in_background, args=(weakref.ref(credentials), refresh_margin),
+            name="dnbad-credentials-refresh", daemon=True
+        ).start()
+    return credentials
+
+
+# Seconds between checks of the background thread. Also the delay after a failed refresh.
+_BACKGROUND_POLL_TIME = 60
+
+
+def _refresh_in_background(credentials_ref: "weakref.ref[RefreshableCredentials]", refresh_margin: float):
+    while True:
+        credentials = credentials_ref()
+        if credentials is None:
+            return
+        if credentials.refresh_needed(refresh_margin):
+            started = time.time()
+            try:
+                # Refreshes under the lock of the credentials, as any caller would:
+                credentials.get_frozen_credentials()
+            except Exception as e:
+                LOG.warning(f"Refreshing credentials in the background failed: {e}")
+            if not credentials.refresh_needed(refresh_margin):
+                LOG.info(f"Credentials refreshed in the background in {time.time() - started:.1f}s.")
+        seconds_to_margin = (credentials._expiry_time - datetime.datetime.now(tz.UTC)).total_seconds() - refresh_margin
+        # The thread must not keep the credentials alive while sleeping:
+        del credentials
+        # After a failed refresh, the credentials are in the margin, and the refresh is retried after a poll:
+        time.sleep(min(seconds_to_margin, _BACKGROUND_POLL_TIME) if seconds_to_margin > 0 else _BACKGROUND_POLL_TIME)
@@ -0,0 +1,64 @@
+import json
+import logging
+import time
+from dataclasses import dataclass, asdict
+from typing import *
+
+from dnbad.common import get_data_file_path
+from dnbad.common.file_lock import FileLock
+from dnbad.common.utils import atomic_write
+
+__all__ = ["RoleMetadata", "RoleMetadataCache"]
+
+LOG = logging.getLogger(__name__)
+
+
+@dataclass
+class RoleMetadata:
+    max_session_duration: int
+    updated: float
+
+
+class RoleMetadataCache:
+    """
+    Metadata of IAM roles per role ARN, shared by all profiles assuming the role, such that it is looked up once.
+    Entries older than `max_age` seconds are looked up again, in case the role has changed.
+    """
+    MAX_AGE = 7 * 24 * 60 * 60
+
+    def __init__(self, path: Optional[str] = None, max_age: float = MAX_AGE):
+        self.path = path or get_data_file_path("role_metadata.json")
+        self.max_age = max_age
+        self._lock = FileLock(f"{self.path}.lock")
+
+    def _read(self) -> Dict[str, dict]:
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except ValueError:
+            LOG.debug(f"Ignoring unreadable role metadata cache '{self.path}'.")
+            return {}
+
+    def get(self, role_arn: str) -> Optional[RoleMetadata]:
+        entry = self._read().get(role_arn)
+        if entry is None:
+            return None
+        try:
+            metadata = RoleMetadata(**entry)
+        except TypeError:
+            return None
+        return metadata if time.time() - metadata.updated < self.max_age else None
+
+    def put(self, role_arn: str, max_session_duration: int):
+        with self._lock:
+            entries = self._read()
+            entries[role_arn] = asdict(RoleMetadata(max_session_duration, time.time()))
+            atomic_write(self.path, json.dumps(entries))
+
+    def delete(self, role_arn: str):
+        with self._lock:
+            entries = self._read()
+            if entries.pop(role_arn, None) is not None:
+                atomic_write(self.path, json.dumps(entries))
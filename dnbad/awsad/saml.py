@@ -6,6 +6,8 @@ import zlib
 from typing import *
 from xml.etree import ElementTree
 
+from dateutil.parser import isoparse
+
 
 class Saml:
     _SAML_REQUEST = \
@@ -35,6 +37,17 @@ class Saml:
                 values.append(value.text)
         return values
 
+    @classmethod
+    def get_not_on_or_after(cls, saml_xml: ElementTree) -> Optional[datetime.datetime]:
+        """ The time the assertion expires, being the earliest of the Conditions and SubjectConfirmationData. """
+        times = [
+            isoparse(element.get("NotOnOrAfter"))
+            for tag in ("Conditions", "SubjectConfirmationData")
+            for element in saml_xml.iter(f"{cls._SAML_ATTR_NS}{tag}")
+            if element.get("NotOnOrAfter")
+        ]
+        return min(times, default=None)
+
     @classmethod
     def build_url(cls, tenant_id: str, app_id: str):
         saml_request = base64.b64encode(
@@ -0,0 +1,155 @@
+import datetime
+import json
+import logging
+import os
+import threading
+from typing import *
+
+from dateutil import tz
+
+from dnbad.common import get_data_file_path
+from dnbad.common.file_lock import FileLock
+from dnbad.common.utils import atomic_write
+from .saml import Saml
+
+__all__ = ["SamlCache", "EncryptedFile"]
+
+LOG = logging.getLogger(__name__)
+
+AzureApp = Tuple[str, str]
+
+
+class EncryptedFile:
+    """
+    A JSON object in a file only the user can read, encrypted with a key kept in the OS keyring.
+    Requires the optional packages cryptography and keyring. Unreadable files are treated as empty.
+    """
+    KEYRING_SERVICE = "dnb-ad-utils"
+    KEYRING_USERNAME = "saml-cache-key"
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = FileLock(f"{path}.lock")
+        self._fernet = None
+
+    @classmethod
+    def is_available(cls) -> bool:
+        try:
+            import cryptography.fernet
+            import keyring
+        except ImportError:
+            return False
+        return True
+
+    def _get_fernet(self):
+        if self._fernet is None:
+            import keyring
+            from cryptography.fernet import Fernet
+            key = keyring.get_password(self.KEYRING_SERVICE, self.KEYRING_USERNAME)
+            if key is None:
+                key = Fernet.generate_key().decode()
+                keyring.set_password(self.KEYRING_SERVICE, self.KEYRING_USERNAME, key)
+            self._fernet = Fernet(key.encode())
+        return self._fernet
+
+    def _read(self) -> dict:
+        from cryptography.fernet import InvalidToken
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, "rb") as f:
+            token = f.read()
+        try:
+            return json.loads(self._get_fernet().decrypt(token))
+        except (InvalidToken, ValueError):
+            LOG.debug(f"Ignoring unreadable encrypted file '{self.path}'.")
+            return {}
+
+    def load(self) -> dict:
+        with self._lock:
+            return self._read()
+
+    def update(self, func: Callable[[dict], dict]):
+        """ Replaces the content with func(content), locked against concurrent updates. """
+        with self._lock:
+            data = func(self._read())
+            atomic_write(self.path, self._get_fernet().encrypt(json.dumps(data).encode()).decode(), 0o600)
+
+
+class SamlCache:
+    """
+    SAML responses per (tenant_id, app_id), used until the assertion expires. An assertion lists every role of the
+    app, so profiles of the same app and role switches can assume roles without logging in again. Thread safe.
+
+    If DNBAD_SAML_CACHE_FILE is set to 1, the responses are also kept in an encrypted file, shared between processes.
+    """
+    # Seconds before NotOnOrAfter where a response is no longer used, leaving time for the STS calls.
+    MARGIN = 30
+    FILE_ENVIRONMENT_VARIABLE = "DNBAD_SAML_CACHE_FILE"
+
+    def __init__(self):
+        self._entries: Dict[AzureApp, Tuple[datetime.datetime, str]] = {}
+        self._lock = threading.Lock()
+        self._file: Optional[EncryptedFile] = None
+
+    @staticmethod
+    def _file_key(app: AzureApp) -> str:
+        return "/".join(app)
+
+    def file(self) -> Optional[EncryptedFile]:
+        if os.environ.get(self.FILE_ENVIRONMENT_VARIABLE) != "1":
+            return None
+        if not EncryptedFile.is_available():
+            LOG.warning(f"{self.FILE_ENVIRONMENT_VARIABLE} requires the packages cryptography and keyring.")
+            return None
+        if self._file is None:
+            self._file = EncryptedFile(get_data_file_path("saml_cache.bin"))
+        return self._file
+
+    def _is_valid(self, not_on_or_after: datetime.datetime) -> bool:
+        return datetime.datetime.now(tz.UTC) + datetime.timedelta(seconds=self.MARGIN) < not_on_or_after
+
+    def get(self, tenant_id: str, app_id: str) -> Optional[str]:
+        app = (tenant_id, app_id)
+        with self._lock:
+            entry = self._entries.get(app)
+            if entry is None and self.file():
+                stored = self.file().load().get(self._file_key(app))
+                if stored:
+                    entry = (datetime.datetime.fromisoformat(stored["not_on_or_after"]), stored["saml_response"])
+                    self._entries[app] = entry
+            if entry is None:
+                LOG.info(f"SAML response cache miss for app '{app_id}'.")
+                return None
+            if not self._is_valid(entry[0]):
+                LOG.info(f"SAML response cache miss for app '{app_id}': The assertion has expired.")
+                del self._entries[app]
+                return None
+            seconds_left = (entry[0] - datetime.datetime.now(tz.UTC)).total_seconds()
+            LOG.info(f"SAML response cache hit for app '{app_id}', valid for {seconds_left:.0f}s.")
+            return entry[1]
+
+    def put(self, tenant_id: str, app_id: str, saml_response: str):
+        """ Stores the response, unless the assertion has no expiry, or has expired. """
+        not_on_or_after = Saml.get_not_on_or_after(Saml.response_to_xml(saml_response))
+        if not_on_or_after is None or not self._is_valid(not_on_or_after):
+            return
+        app = (tenant_id, app_id)
+        stored = {"not_on_or_after": not_on_or_after.isoformat(), "saml_response": saml_response}
+        with self._lock:
+            self._entries[app] = (not_on_or_after, saml_response)
+            if self.file():
+                self.file().update(lambda data: {**self._valid_file_entries(data), self._file_key(app): stored})
+
+    def delete(self, tenant_id: str, app_id: str):
+        app = (tenant_id, app_id)
+        with self._lock:
+            self._entries.pop(app, None)
+            if self.file():
+                self.file().update(lambda data: {
+                    k: v for k, v in self._valid_file_entries(data).items() if k != self._file_key(app)
+                })
+
+    def _valid_file_entries(self, data: dict) -> dict:
+        return {
+            k: v for k, v in data.items() if self._is_valid(datetime.datetime.fromisoformat(v["not_on_or_after"]))
+        }
@@ -0,0 +1,159 @@
+import logging
+import urllib.request
+from html.parser import HTMLParser
+from http.cookiejar import Cookie, CookieJar
+from typing import *
+from urllib.error import URLError
+from urllib.parse import urlencode, urljoin
+
+from dnbad.common.cookie_store import CookieStore
+from .saml import Saml
+
+__all__ = ["HttpSamlLogin"]
+
+LOG = logging.getLogger(__name__)
+
+
+class _PageParser(HTMLParser):
+    """ Collects the forms and headings of a page. """
+
+    def __init__(self):
+        super().__init__()
+        self.forms: List[dict] = []
+        self.headings: List[str] = []
+        self.is_interactive_app = False
+        self._in_heading = False
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == "form":
+            self.forms.append({"action": attrs.get("action"), "method": attrs.get("method", "get"), "inputs": []})
+        elif tag == "input" and self.forms:
+            self.forms[-1]["inputs"].append(attrs)
+        elif tag == "div" and attrs.get("role") == "heading":
+            self._in_heading = True
+
+    def handle_endtag(self, tag):
+        if tag == "div":
+            self._in_heading = False
+
+    def handle_data(self, data):
+        if self._in_heading and data.strip():
+            self.headings.append(data.strip())
+        # The interactive Azure login pages are rendered client side from this config object:
+        if "$Config=" in data:
+            self.is_interactive_app = True
+
+
+class HttpSamlLogin:
+    """
+    Retrieves the SAML response without a browser, by replaying the stored Azure cookies with a plain HTTP client.
+    Redirects and auto-submitting forms are followed until the form posting to AWS is found.
+    If Azure asks for any interaction (password, MFA, etc.) None is returned, and the browser login must be used.
+    """
+    MAX_STEPS = 10
+    TIMEOUT = 10
+    USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0 Safari/537.36"
+
+    def __init__(self, cookie_store: CookieStore, url: str):
+        self.cookie_store = cookie_store
+        self.url = url
+        self.cookie_jar = CookieJar()
+        self._opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self.cookie_jar))
+
+    def login(self) -> Optional[str]:
+        cookies = self.cookie_store.load()
+        if not cookies:
+            return None
+        for c in cookies:
+            self.cookie_jar.set_cookie(self._to_cookie(c))
+
+        url, data = self.url, None
+        try:
+            for _ in range(self.MAX_STEPS):
+                url, page = self._request(url, data)
+                parser = _PageParser()
+                parser.feed(page)
+
+                saml_response = self._find_saml_response(parser.forms)
+                if saml_response:
+                    LOG.info("SAML Response retrieved without browser.")
+                    self._save_cookies(cookies)
+                    return saml_response
+                if parser.headings or parser.is_interactive_app:
+                    LOG.info(f"Interaction required ({', '.join(parser.headings) or 'login page'}). Using browser.")
+                    return None
+                form = self._find_auto_submit_form(parser.forms)
+                if form is None:
+                    LOG.info(f"No way forward from '{url}'. Using browser.")
+                    return None
+                url, data = self._submit_form(url, form)
+        except (URLError, OSError) as e:
+            LOG.info(f"HTTP login failed ({e}). Using browser.")
+            return None
+        LOG.info("Too many steps in HTTP login. Using browser.")
+        return None
+
+    @staticmethod
+    def _to_cookie(c: dict) -> Cookie:
+        """ Converts a DevTools protocol cookie to a cookiejar cookie. """
+        domain = c["domain"]
+        expires = c.get("expires", -1)
+        return Cookie(
+            version=0, name=c["name"], value=c["value"],
+            port=None, port_specified=False,
+            domain=domain, domain_specified=domain.startswith("."), domain_initial_dot=domain.startswith("."),
+            path=c.get("path", "/"), path_specified=True,
+            secure=c.get("secure", False),
+            expires=int(expires) if expires >= 0 else None,
+            discard=expires < 0,
+            comment=None, comment_url=None,
+            rest={"HttpOnly": None} if c.get("httpOnly") else {}
+        )
+
+    def _save_cookies(self, stored: List[dict]):
+        """ Writes back the cookies refreshed by Azure, keeping the attributes of the stored cookies. """
+        cookies = {(c["name"], c["domain"], c.get("path", "/")): c for c in stored}
+        for cookie in self.cookie_jar:
+            key = (cookie.name, cookie.domain, cookie.path)
+            cookies[key] = {
+                **cookies.get(key, {"secure": cookie.secure, "httpOnly": cookie.has_nonstandard_attr("HttpOnly")}),
+                "name": cookie.name,
+                "value": cookie.value,
+                "domain": cookie.domain,
+                "path": cookie.path,
+                "expires": cookie.expires if cookie.expires is not None else -1,
+                "session": cookie.expires is None
+            }
+        self.cookie_store.write(list(cookies.values()))
+
+    def _request(self, url: str, data: Optional[bytes]) -> Tuple[str, str]:
+        request = urllib.request.Request(url, data=data, headers={"User-Agent": self.USER_AGENT})
+        with self._opener.open(request, timeout=self.TIMEOUT) as response:
+            return response.geturl(), response.read().decode("utf-8", errors="replace")
+
+    @staticmethod
+    def _find_saml_response(forms: List[dict]) -> Optional[str]:
+        for form in forms:
+            if form["action"] != Saml.SAML_COMPLETE_URL:
+                continue
+            for i in form["inputs"]:
+                if i.get("name") == "SAMLResponse":
+                    return i.get("value")
+        return None
+
+    @staticmethod
+    def _find_auto_submit_form(forms: List[dict]) -> Optional[dict]:
+        """ A form with only hidden inputs is submitted by script on the page. """
+        for form in forms:
+            if form["action"] and all(i.get("type") == "hidden" for i in form["inputs"]):
+                return form
+        return None
+
+    @staticmethod
+    def _submit_form(url: str, form: dict) -> Tuple[str, Optional[bytes]]:
+        action = urljoin(url, form["action"])
+        values = urlencode([(i["name"], i.get("value") or "") for i in form["inputs"] if i.get("name")])
+        if form["method"].lower() == "post":
+            return action, values.encode()
+        return f"{action}?{values}", None
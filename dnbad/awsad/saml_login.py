@@ -1,13 +1,23 @@
+from __future__ import annotations
+
 import asyncio
 from dataclasses import dataclass
+from typing import *
 from urllib.parse import parse_qs
 
-from pyppeteer.network_manager import Request
-
+from dnbad.common import trace
 from dnbad.common.azure_auth import *
 from dnbad.common.azure_auth_handler import AzureAuthHandler
+from dnbad.common.cookie_store import CookieStore
 from dnbad.common.password_manager import PasswordManager
+from dnbad.common.utils import run_sync
 from .saml import Saml
+from .saml_http import HttpSamlLogin
+
+if TYPE_CHECKING:
+    from pyppeteer.network_manager import Request
+
+AzureApp = Tuple[str, str]
 
 
 @dataclass
@@ -18,14 +28,67 @@ class SamlLogin:
     app_id: str
 
     def login(self) -> str:
-        return asyncio.get_event_loop().run_until_complete(self._login())
-
-    async def _login(self) -> str:
-        async with single_auth_page(AzureAuthHandler(self.password_manager), self.auth_config) as auth_page:
-            url = Saml.build_url(tenant_id=self.tenant_id, app_id=self.app_id)
-            await auth_page.page.goto(url)
-            request = await auth_page.await_after_auth(auth_page.page.waitForRequest(Saml.SAML_COMPLETE_URL))
-            return self._get_saml_response_from_request(request)
+        return run_sync(self.login_async())
+
+    async def login_async(self) -> str:
+        auth_handler = AzureAuthHandler(self.password_manager)
+        url = Saml.build_url(tenant_id=self.tenant_id, app_id=self.app_id)
+
+        if self.auth_config.use_cookies and self.auth_config.http_fast_path:
+            with trace.span("saml.http"):
+                saml_response = await self.login_http(auth_handler.cookie_store, url)
+            if saml_response:
+                return saml_response
+
+        with trace.span("saml.browser"):
+            async with single_auth_page(auth_handler, self.auth_config) as auth_page:
+                return await self.saml_from_page(auth_page, url)
+
+    @classmethod
+    async def login_many(
+            cls,
+            auth_config: AuthConfig,
+            password_manager: PasswordManager,
+            apps: Sequence[AzureApp],
+            concurrency: int = 4,
+            timeout: Optional[float] = 60
+    ) -> AsyncIterator[AuthResult]:
+        """
+        Retrieves a SAML response for each (tenant_id, app_id), yielding results as they finish.
+        Apps not served by the HTTP fast path are retrieved in one browser, authenticating only once.
+        """
+        auth_handler = AzureAuthHandler(password_manager)
+
+        remaining = list(apps)
+        if auth_config.use_cookies and auth_config.http_fast_path:
+            remaining = []
+            for app, saml_response in zip(apps, await asyncio.gather(*(
+                    cls.login_http(auth_handler.cookie_store, Saml.build_url(*app)) for app in apps
+            ))):
+                if saml_response:
+                    yield AuthResult(app, saml_response)
+                else:
+                    remaining.append(app)
+        if not remaining:
+            return
+
+        async def action(auth_page: AuthPage, app: AzureApp) -> str:
+            return await cls.saml_from_page(auth_page, Saml.build_url(*app))
+
+        async for result in multi_auth_pages(auth_handler, auth_config, remaining, action, concurrency, timeout):
+            yield result
+
+    @classmethod
+    async def saml_from_page(cls, auth_page: AuthPage, url: str) -> str:
+        """ Navigates the auth page to the SAML url of an app, and returns the SAML response after the auth. """
+        await auth_page.goto(url)
+        request = await auth_page.await_after_auth(auth_page.page.waitForRequest(Saml.SAML_COMPLETE_URL))
+        return cls._get_saml_response_from_request(request)
+
+    @classmethod
+    async def login_http(cls, cookie_store: CookieStore, url: str) -> Optional[str]:
+        """ The SAML response with the stored cookies over HTTP, without a browser. None if a browser is needed. """
+        return await asyncio.get_running_loop().run_in_executor(None, HttpSamlLogin(cookie_store, url).login)
 
     @classmethod
     def _get_saml_response_from_request(cls, request: Request) -> str:
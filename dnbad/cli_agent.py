@@ -0,0 +1,59 @@
+from typing import *
+
+from dnbad.agent.agent import DnbadAgent
+from dnbad.agent.client import AgentClient, AgentError
+from dnbad.common.azure_auth import AuthConfig
+from dnbad.common.cli_base import CliBase, Namespace
+
+
+def main() -> int:
+    return AgentCli().handle()
+
+
+class AgentCli(CliBase):
+    def __init__(self):
+        super().__init__("dnbad-agent", "Local agent holding the Azure session for awsad, gproxy and the AwsAd API")
+        p_start = self.add_cmd("start", "Start the agent (runs in the foreground)")
+        p_start.add_argument("-n", "--no-headless", help="Run the agent browser in non-headless mode",
+                             action="store_true")
+        p_start.add_argument("-i", "--idle-timeout", help="Seconds without use before closing the browser",
+                             type=int, default=DnbadAgent.BROWSER_IDLE_TIMEOUT)
+
+        self.add_cmd("stop", "Stop the agent")
+        self.add_cmd("status", "Check if the agent is running")
+
+    def _handle_cmd(self, cmd: str, args: Namespace) -> Optional[bool]:
+        client = AgentClient()
+        if cmd == "start":
+            if client.available():
+                print("dnbad agent is already running.")
+                return False
+            agent = DnbadAgent(
+                auth_config=AuthConfig(headless=not args.no_headless, lean=True),
+                browser_idle_timeout=args.idle_timeout
+            )
+            # Asked once here, such that requests never wait for input:
+            agent.password_manager.fetch_password()
+            agent.run_sync()
+        elif cmd == "stop":
+            try:
+                client.stop()
+            except AgentError:
+                print("dnbad agent is not running.")
+                return False
+            print("dnbad agent stopped.")
+        elif cmd == "status":
+            try:
+                status = client.status()
+            except AgentError:
+                print("Running: False")
+                return False
+            print(f"Running: True\n"
+                  f"Pid: {status['pid']}\n"
+                  f"User: {status['username']}\n"
+                  f"Browser open: {status['browser']}\n"
+                  f"Requests in flight: {status['in_flight']}")
+
+
+if __name__ == '__main__':
+    main()
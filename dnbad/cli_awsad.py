@@ -1,8 +1,16 @@
 from typing import *
 
 from dnbad.awsad import *
+from dnbad.awsad import credential_process
+from dnbad.awsad.credential_server import CredentialServer
+from dnbad.awsad.refresh_daemon import RefreshDaemon
+from dnbad.awsad.saml import Saml
+from dnbad.awsad.saml_http import HttpSamlLogin
 from dnbad.common.azure_auth import AuthConfig
 from dnbad.common.cli_base import CliBase, Namespace
+from dnbad.common.keep_alive import SessionKeepAlive
+from dnbad.common.local_config import LocalConfig
+from dnbad.common.password_manager import PasswordManager
 
 
 def main() -> int:
@@ -14,7 +22,25 @@ class AwsAdCli(CliBase):
         super().__init__("awsad", "AWS Login with Azure AD")
         p_login = self.add_cmd("login", "Login and store credentials in .aws/credentials")
         AuthConfig.add_arguments_to_parser(p_login)
-        self._add_profile(p_login)
+        self._add_profiles(p_login)
+
+        p_serve = self.add_cmd("serve", "Serve refreshed credentials on localhost to the AWS SDKs and CLI")
+        AuthConfig.add_arguments_to_parser(p_serve)
+        self._add_profiles(p_serve)
+        p_serve.add_argument("-P", "--port", help="Port on 127.0.0.1. Default is a free port", type=int, default=0)
+        p_serve.add_argument("--refresh-margin", help="Seconds before expiry to refresh credentials", type=int,
+                             default=CredentialServer.REFRESH_MARGIN)
+
+        p_daemon = self.add_cmd("refresh-daemon", "Refresh the credentials of profiles before they expire. "
+                                                  "Default is all profiles configured for awsad")
+        AuthConfig.add_arguments_to_parser(p_daemon)
+        self._add_profiles(p_daemon)
+        p_daemon.add_argument("--refresh-margin", help="Seconds before expiry to refresh credentials", type=int,
+                              default=RefreshDaemon.REFRESH_MARGIN)
+        p_daemon.add_argument("--batch-window", help="Seconds ahead to refresh profiles of the same Azure app early",
+                              type=int, default=RefreshDaemon.BATCH_WINDOW)
+        p_daemon.add_argument("--max-backoff", help="Longest wait in seconds before retrying a failed refresh",
+                              type=int, default=RefreshDaemon.MAX_BACKOFF)
 
         p_configure = self.add_cmd("configure", "Configure a profile")
         AuthConfig.add_arguments_to_parser(p_configure)
@@ -22,20 +48,66 @@ class AwsAdCli(CliBase):
 
         self.add_cmd("list", "List all AWS profiles")
 
+        p_credentials = self.add_cmd(credential_process.COMMAND, "Print credentials as an AWS credential_process")
+        credential_process.add_arguments_to_parser(p_credentials)
+
         p_status = self.add_cmd("status", "Get status of credentials")
         self._add_profile(p_status)
 
+        p_keep_alive = self.add_cmd("keep-alive", "Periodically refresh the Azure session to avoid repeated MFA")
+        self._add_profile(p_keep_alive)
+        p_keep_alive.add_argument("-i", "--interval", help="Seconds between refreshes", type=int,
+                                  default=SessionKeepAlive.INTERVAL)
+
     @staticmethod
     def _add_profile(parser):
         parser.add_argument("-p", "--profile", help="AWS Profile")
 
+    @staticmethod
+    def _profile(name: Optional[str]) -> Optional[str]:
+        """ The profile named 'default' is None, as in AwsConfig. """
+        return None if name == "default" else name
+
+    @classmethod
+    def _add_profiles(cls, parser):
+        profiles = parser.add_mutually_exclusive_group()
+        cls._add_profile(profiles)
+        profiles.add_argument("--profiles", help="Comma separated AWS Profiles, handled in one pass")
+        profiles.add_argument("-g", "--group", help="The profiles with the group in 'awsad-groups'")
+        profiles.add_argument("-a", "--all", help="All profiles configured for awsad", action="store_true")
+
+    @classmethod
+    def _login_profiles(cls, args: Namespace) -> Optional[List[Optional[str]]]:
+        """ The profiles of a multi profile login, or None for a login to one profile. """
+        if args.all:
+            return AwsConfig.configured_profiles()
+        if args.group:
+            return AwsConfig.configured_profiles(args.group)
+        if args.profiles:
+            return [cls._profile(p) for p in (p.strip() for p in args.profiles.split(",")) if p]
+        return None
+
     def _handle_cmd(self, cmd: str, args: Namespace) -> Optional[bool]:
         if cmd == "login":
-            return AwsAd(
-                profile=args.profile
-            ).login(
-                auth_config=AuthConfig.from_args(args)
-            )
+            profiles = self._login_profiles(args)
+            if profiles is None:
+                return AwsAd(
+                    profile=args.profile
+                ).login(
+                    auth_config=AuthConfig.from_args(args)
+                )
+            return login_many(profiles, AuthConfig.from_args(args))
+        elif cmd == "serve":
+            profiles = self._login_profiles(args)
+            if profiles is None:
+                profiles = [self._profile(args.profile)]
+            return serve(profiles, AuthConfig.from_args(args), args.port, args.refresh_margin)
+        elif cmd == "refresh-daemon":
+            profiles = self._login_profiles(args)
+            if profiles is None:
+                profiles = [self._profile(args.profile)] if args.profile else AwsConfig.configured_profiles()
+            return refresh_daemon(profiles, AuthConfig.from_args(args), args.refresh_margin, args.batch_window,
+                                  args.max_backoff)
         elif args.cmd == "configure":
             return AWSAdConfigure().configure(
                 profile=args.profile,
@@ -44,10 +116,64 @@ class AwsAdCli(CliBase):
         elif args.cmd == "list":
             print(f"AWS Profiles:\n{AWSAdConfigure.list_profiles()}")
             return True
+        elif args.cmd == credential_process.COMMAND:
+            return credential_process.serve(args.profile, args.refresh_margin) == 0
         elif args.cmd == "status":
             status = AwsAd(profile=args.profile).has_valid_credentials()
             print(f"Credentials: {'Valid' if status else 'Invalid'}")
             return status
+        elif args.cmd == "keep-alive":
+            keep_alive(args.profile, args.interval)
+
+
+def login_many(profiles: List[Optional[str]], auth_config: AuthConfig) -> bool:
+    if not profiles:
+        print("No matching profiles are configured for awsad.")
+        return False
+    results = AwsAd.login_many(profiles, auth_config)
+    print()
+    AwsAd.print_login_summary(results)
+    return all(result.error is None for result in results)
+
+
+def serve(profiles: List[Optional[str]], auth_config: AuthConfig, port: int, refresh_margin: int) -> bool:
+    if not profiles:
+        print("No matching profiles are configured for awsad.")
+        return False
+    server = CredentialServer(profiles, auth_config, port, refresh_margin)
+
+    def started():
+        for profile in profiles:
+            print(f"\nFor profile '{profile or 'default'}':\n"
+                  f"    export AWS_CONTAINER_CREDENTIALS_FULL_URI={server.url(profile)}\n"
+                  f"    export AWS_CONTAINER_AUTHORIZATION_TOKEN={server.token}")
+
+    server.run_sync(started)
+    return True
+
+
+def refresh_daemon(profiles: List[Optional[str]], auth_config: AuthConfig, refresh_margin: int, batch_window: int,
+                   max_backoff: int) -> bool:
+    if not profiles:
+        print("No matching profiles are configured for awsad.")
+        return False
+    RefreshDaemon(profiles, auth_config, refresh_margin, batch_window, max_backoff).run_sync()
+    return True
+
+
+def keep_alive(profile: Optional[str], interval: int):
+    """ Refreshes over HTTP through the app of the profile if configured, else in a headless browser. """
+    password_manager = PasswordManager(LocalConfig.load().username)
+    try:
+        aws_config = AwsConfig.load(profile)
+    except MissingAwsConfigException:
+        aws_config = None
+
+    def http_probe(cookie_store) -> bool:
+        url = Saml.build_url(tenant_id=aws_config.azure_tenant_id, app_id=aws_config.azure_app_id)
+        return HttpSamlLogin(cookie_store, url).login() is not None
+
+    SessionKeepAlive(password_manager, http_probe=http_probe if aws_config else None, interval=interval).run_sync()
 
 
 if __name__ == '__main__':
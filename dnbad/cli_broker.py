@@ -0,0 +1,45 @@
+from typing import *
+
+from dnbad.common.browser_backend import BACKENDS
+from dnbad.common.browser_broker import BrowserBroker
+from dnbad.common.cli_base import CliBase, Namespace
+
+
+def main() -> int:
+    return BrokerCli().handle()
+
+
+class BrokerCli(CliBase):
+    def __init__(self):
+        super().__init__("dnbad-broker", "Long-lived browser shared by awsad and gproxy")
+        p_start = self.add_cmd("start", "Start the browser broker (runs in the foreground). Its DevTools port is "
+                                        "reachable by any local user, so do not use it on shared machines")
+        p_start.add_argument("-n", "--no-headless", help="Run the broker browser in non-headless mode",
+                             action="store_true")
+        p_start.add_argument("-i", "--idle-timeout", help="Seconds without use before shutting down",
+                             type=int, default=BrowserBroker.IDLE_TIMEOUT)
+        p_start.add_argument("--backend", help="Browser driver", choices=BACKENDS, default="auto")
+
+        self.add_cmd("stop", "Stop the browser broker")
+        self.add_cmd("status", "Check if the browser broker is running and healthy")
+
+    def _handle_cmd(self, cmd: str, args: Namespace) -> Optional[bool]:
+        if cmd == "start":
+            if BrowserBroker.status():
+                print("Browser broker is already running.")
+                return False
+            BrowserBroker(
+                headless=not args.no_headless, idle_timeout=args.idle_timeout, backend=args.backend
+            ).run_sync()
+        elif cmd == "stop":
+            stopped = BrowserBroker.stop()
+            print("Browser broker stopped." if stopped else "Browser broker is not running.")
+            return stopped
+        elif cmd == "status":
+            endpoint = BrowserBroker.status()
+            print(f"Running: {endpoint is not None}")
+            return endpoint is not None
+
+
+if __name__ == '__main__':
+    main()
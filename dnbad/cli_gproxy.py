@@ -4,6 +4,7 @@ import pexpect.exceptions
 
 from dnbad.common.azure_auth import AuthConfig
 from dnbad.common.cli_base import *
+from dnbad.common.keep_alive import SessionKeepAlive
 from dnbad.common.local_config import LocalConfig
 from dnbad.common.password_manager import PasswordManager
 from dnbad.gproxy.constants import *
@@ -84,14 +85,20 @@ def disconnect() -> bool:
 def persist():
     config = LocalConfig.load()
     g_proxy = GProxy(config)
+    # Runs all day, often on small machines: The browser only lives for the duration of a login.
     ad_config = AuthConfig(
         headless=True,
         use_cookies=True,
         dump_io=False,
-        keep_open=False
+        keep_open=False,
+        lean=True,
+        low_memory=True
     )
     password_manager = PasswordManager(config.username)
     password_manager.fetch_password()
+    # Users of only GProxy may have no app tiles, so the session is checked by the account menu of the portal:
+    keep_alive = SessionKeepAlive(password_manager, ad_config, signed_in_selector=SessionKeepAlive.SIGNED_IN_SELECTOR)
+    last_refresh = time.time()
 
     connected = g_proxy.is_connected()
     if connected:
@@ -104,9 +111,15 @@ def persist():
             try:
                 g_proxy.connect(password_manager, ad_config)
                 LOG.info(f"Connected: {g_proxy.is_connected()}")
+                last_refresh = time.time()
             except (GProxyError, pexpect.exceptions.TIMEOUT) as e:
                 LOG.warning(f"An error occurred when connecting:\n {str(e)}")
 
+        # Keep the Azure session alive, such that a reconnect does not require MFA.
+        if time.time() - last_refresh > PERSIST_KEEP_ALIVE_TIME:
+            keep_alive.refresh_sync()
+            last_refresh = time.time()
+
         time.sleep(PERSIST_POLL_TIME if connected else PERSIST_RETRY_TIME)
 
 
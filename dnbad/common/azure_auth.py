@@ -1,3 +1,5 @@
+from __future__ import annotations
+
 import asyncio
 import logging
 from asyncio import Task, create_task, wait
@@ -5,15 +7,24 @@ from contextlib import asynccontextmanager
 from dataclasses import dataclass
 from typing import *
 
-from pyppeteer.page import Page
-
+from . import trace
 from .azure_auth_handler import *
+from .browser_backend import BACKENDS
+from .chromium_profile import ChromiumProfile
 from .pyppeteer import PypBrowser
+from .request_filter import RequestFilter
+
+if TYPE_CHECKING:
+    from pyppeteer.page import Page
 
-__all__ = ["AuthPage", "AuthConfig", "AuthBrowser", "single_auth_page", "AzureAuthHandler"]
+__all__ = ["AuthPage", "AuthConfig", "AuthBrowser", "AuthResult", "single_auth_page", "multi_auth_pages",
+           "AzureAuthHandler"]
 
 LOG = logging.getLogger(__name__)
 
+T = TypeVar("T")
+R = TypeVar("R")
+
 
 @dataclass(frozen=True)
 class AuthConfig:
@@ -21,19 +32,47 @@ class AuthConfig:
     use_cookies: bool = True
     dump_io: bool = False
     keep_open: bool = False
+    use_broker: bool = False
+    http_fast_path: bool = True
+    lean: bool = False
+    persistent_profile: bool = False
+    backend: str = "auto"
+    low_memory: bool = False
+    use_agent: bool = True
 
     @staticmethod
     def add_arguments_to_parser(parser):
         parser.add_argument("-n", "--no-headless", help="Login to Azure AD in non-headless mode", action="store_true")
         parser.add_argument("-o", "--keep-open", help="Keep browser open", action="store_true")
         parser.add_argument("-c", "--no-cookies", help="Login without using cookies", action="store_true")
+        parser.add_argument("-b", "--broker", help="Attach to a running browser broker if available",
+                            action="store_true")
+        parser.add_argument("-l", "--lean", help="Skip loading images, fonts and telemetry in headless mode",
+                            action="store_true")
+        parser.add_argument("-d", "--persistent-profile", help="Keep the browser cache and storage between logins",
+                            action="store_true")
+        parser.add_argument("--browser-only", help="Always login in the browser, skipping the cookie based HTTP login",
+                            action="store_true")
+        parser.add_argument("--backend", help="Browser driver. auto uses the built-in cdp driver if Chromium is found",
+                            choices=BACKENDS, default="auto")
+        parser.add_argument("-m", "--low-memory", help="Minimize browser memory, and close the browser after login",
+                            action="store_true")
+        parser.add_argument("--no-agent", help="Login in this process, even if the dnbad agent is running",
+                            action="store_true")
 
     @classmethod
     def from_args(cls, args) -> "AuthConfig":
         return AuthConfig(
             headless=not args.no_headless,
             use_cookies=not args.no_cookies,
-            keep_open=args.keep_open
+            keep_open=args.keep_open,
+            use_broker=args.broker,
+            http_fast_path=not args.browser_only,
+            lean=args.lean,
+            persistent_profile=args.persistent_profile,
+            backend=args.backend,
+            low_memory=args.low_memory,
+            use_agent=not args.no_agent
         )
 
 
@@ -43,11 +82,19 @@ class AuthPage:
     Upon completion the auth task is cancelled.
     """
 
-    def __init__(self, page: Page, auth_handler: AzureAuthHandler, config: AuthConfig):
+    def __init__(self, page: Page, auth_handler: AzureAuthHandler, config: AuthConfig, load_cookies: bool = True):
         self.page: Page = page
         self.auth_config = config
         self._auth_handler = auth_handler
+        self._load_cookies = load_cookies
         self._auth_task: Optional[Task] = None
+        # Only headless, since the skipped resources would be missed by a user looking at the page.
+        self.request_filter: Optional[RequestFilter] = RequestFilter() if config.lean and config.headless else None
+
+    async def goto(self, url: str):
+        """ Navigates without waiting for the full load event in lean mode. The auth handler reacts to headings. """
+        with trace.span("page.goto", url=url.split("?")[0]):
+            await self.page.goto(url, waitUntil="domcontentloaded" if self.request_filter else "load")
 
     async def await_auth(self):
         return await self._auth_task
@@ -58,33 +105,124 @@ class AuthPage:
         else:
             task = awaitable
 
-        done, pending = await wait((task, self._auth_task), return_when=asyncio.FIRST_COMPLETED)
-        if self._auth_task in done:
-            # If auth task completes first, there may be an exception. Make sure that its raised.
-            await self._auth_task
-        return await task
+        with trace.span("auth.await_after_auth"):
+            done, pending = await wait((task, self._auth_task), return_when=asyncio.FIRST_COMPLETED)
+            if self._auth_task in done:
+                # If auth task completes first, there may be an exception. Make sure that its raised.
+                await self._auth_task
+            return await task
 
     async def __aenter__(self):
-        if self.auth_config.use_cookies:
-            await self._auth_handler.load_cookies(self.page)
-        self._auth_task = create_task(self._auth_handler.handle_auth(self.page))
+        if self.request_filter:
+            await self.request_filter.install(self.page)
+        if self.auth_config.use_cookies and self._load_cookies:
+            with trace.span("auth.cookies.load"):
+                await self._auth_handler.load_cookies(self.page)
+        # The watcher is installed before the caller navigates, such that no heading is missed.
+        watcher = HeadingWatcher()
+        await watcher.install(self.page)
+        self._auth_task = create_task(self._auth_handler.handle_auth(self.page, watcher))
         return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         if exc_type is None:
-            await self._auth_handler.save_cookies(self.page)
-            self._auth_task.cancel()
+            with trace.span("auth.cookies.save"):
+                await self._auth_handler.save_cookies(self.page)
+        self._auth_task.cancel()
+        if self.request_filter:
+            LOG.info(f"Lean mode: {self.request_filter.summary()}")
         return False
 
 
 class AuthBrowser(PypBrowser):
     def __init__(self, auth_handler: AzureAuthHandler, auth_config: AuthConfig):
-        super().__init__(auth_config.headless, auth_config.dump_io)
+        super().__init__(
+            auth_config.headless,
+            auth_config.dump_io,
+            use_broker=auth_config.use_broker,
+            backend=auth_config.backend,
+            low_memory=auth_config.low_memory
+        )
         self.auth_handler = auth_handler
         self.auth_config = auth_config
-
-    async def new_auth_page(self) -> AuthPage:
-        return AuthPage(await self.browser.newPage(), self.auth_handler, self.auth_config)
+        self._profile: Optional[ChromiumProfile] = None
+
+    async def _launch(self):
+        # The profile is only used by a browser of our own, and not acquired when attached to the broker.
+        if self.auth_config.persistent_profile:
+            profile = ChromiumProfile(self.auth_handler.password_manager.username)
+            # If the profile is in use, the browser is launched with a temporary profile, relying on the cookie store.
+            if profile.acquire():
+                self._profile = profile
+                self.user_data_dir = profile.path
+        try:
+            await super()._launch()
+        except BaseException:
+            self._release_profile()
+            raise
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        try:
+            return await super().__aexit__(exc_type, exc_value, traceback)
+        finally:
+            self._release_profile()
+
+    def _release_profile(self):
+        if self._profile:
+            self._profile.release()
+            self._profile = None
+
+    async def new_auth_page(self, load_cookies: bool = True) -> AuthPage:
+        return AuthPage(await self.new_page(), self.auth_handler, self.auth_config, load_cookies)
+
+    async def map_auth_pages(
+            self,
+            targets: Sequence[T],
+            action: Callable[[AuthPage, T], Awaitable[R]],
+            concurrency: int = 4,
+            timeout: Optional[float] = 60
+    ) -> AsyncIterator["AuthResult"]:
+        """
+        Runs the action for each target on its own auth page, yielding results as they finish.
+        The first target authenticates the session. The rest then run concurrently, sharing the session of the browser.
+        """
+
+        async def run(target: T, load_cookies: bool) -> AuthResult:
+            try:
+                auth_page = await self.new_auth_page(load_cookies)
+                try:
+                    async with auth_page as p:
+                        value = await asyncio.wait_for(action(p, target), timeout)
+                finally:
+                    # Closed after the auth page has exited, which saves the cookies of the page.
+                    await auth_page.page.close()
+                return AuthResult(target, value)
+            except Exception as e:
+                LOG.warning(f"Auth page for '{target}' failed: {e!r}")
+                return AuthResult(target, error=e)
+
+        if len(targets) == 0:
+            return
+        first = await run(targets[0], load_cookies=True)
+        yield first
+
+        semaphore = asyncio.Semaphore(concurrency)
+        # If the first target failed, there is no session to share.
+        load_cookies = first.error is not None
+
+        async def run_limited(target: T) -> AuthResult:
+            async with semaphore:
+                return await run(target, load_cookies)
+
+        for next_done in asyncio.as_completed([run_limited(t) for t in targets[1:]]):
+            yield await next_done
+
+
+@dataclass
+class AuthResult(Generic[T, R]):
+    target: T
+    value: Optional[R] = None
+    error: Optional[Exception] = None
 
 
 @asynccontextmanager
@@ -92,3 +230,17 @@ async def single_auth_page(auth_handler: AzureAuthHandler, config: AuthConfig) -
     """ Opens a browser and auth page """
     async with AuthBrowser(auth_handler, config) as b, await b.new_auth_page() as p:
         yield p
+
+
+async def multi_auth_pages(
+        auth_handler: AzureAuthHandler,
+        config: AuthConfig,
+        targets: Sequence[T],
+        action: Callable[[AuthPage, T], Awaitable[R]],
+        concurrency: int = 4,
+        timeout: Optional[float] = 60
+) -> AsyncIterator[AuthResult]:
+    """ Opens a browser, and runs the action for each target on its own auth page. See AuthBrowser.map_auth_pages """
+    async with AuthBrowser(auth_handler, config) as b:
+        async for result in b.map_auth_pages(targets, action, concurrency, timeout):
+            yield result
@@ -1,19 +1,21 @@
+from __future__ import annotations
+
 import asyncio
 import inspect
-import json
 import logging
-import os
+import time
 from dataclasses import dataclass
 from typing import *
 
-from pyppeteer.errors import TimeoutError as PypTimeoutError
-from pyppeteer.page import Page
-
-from dnbad.common import get_data_file_path
+from dnbad.common import get_data_file_path, trace
+from dnbad.common.cookie_store import CookieStore
 from dnbad.common.exceptions import AdUtilException
 from dnbad.common.password_manager import PasswordManager
 
-__all__ = ["MfaExpiredException", "AuthState", "AzureAuthHandler"]
+if TYPE_CHECKING:
+    from pyppeteer.page import Page
+
+__all__ = ["MfaExpiredException", "AuthState", "on_state", "HeadingWatcher", "AzureAuthHandler"]
 
 LOG = logging.getLogger(__name__)
 PRINT = print
@@ -31,28 +33,87 @@ class PasswordError(AdUtilException):
 class AuthState:
     matches: Tuple[str]
     timeout: Optional[int]
+    name: Optional[str]
 
     def __init__(self, *matches: str, timeout=None):
         self.matches = matches
         self.timeout = timeout
+        self.name = None
+
+    def __set_name__(self, owner, name):
+        self.name = name
 
     @staticmethod
-    def find(s: str, states: List["AuthState"], default=None):
-        matching = [state for state in states if s in state.matches]
-        if len(matching) > 1:
-            raise Exception("More than one state matching heading.")
-        elif len(matching) == 1:
-            return matching[0]
-        else:
-            return default
+    def normalize(heading: str) -> str:
+        """ Normalizes case, whitespace, hyphens and apostrophes, such that small variations map to the same state. """
+        heading = heading.replace("\u2019", "'").replace("-", " ").strip().rstrip(".?!").lower()
+        return " ".join(heading.split())
+
+
+def on_state(*states: AuthState):
+    """ Registers the decorated coroutine as the handler of the states. Subclasses may register new handlers. """
+
+    def decorator(func):
+        func.auth_states = states
+        return func
+
+    return decorator
+
+
+class HeadingWatcher:
+    """
+    Pushes changes of the visible Azure heading from the page to Python.
+    A MutationObserver is injected in every document of the page, and reports through an exposed function,
+    such that each heading change costs one message instead of polling and evaluating the text.
+    """
+    BINDING_NAME = "dnbadHeadingChanged"
+    _WATCHER_JS = """() => {
+        if (window.__dnbadHeadingWatcher) return;
+        window.__dnbadHeadingWatcher = true;
+        let last = null;
+        const isVisible = (e) => {
+            const style = window.getComputedStyle(e);
+            return style && style.visibility !== "hidden" && e.getClientRects().length > 0;
+        };
+        const report = () => {
+            for (const e of document.querySelectorAll("div[role='heading']")) {
+                const text = e.textContent;
+                if (text && text !== last && isVisible(e)) {
+                    last = text;
+                    window.%s(text);
+                    return;
+                }
+            }
+        };
+        new MutationObserver(report).observe(document, {
+            childList: true, subtree: true, characterData: true, attributes: true
+        });
+        report();
+    }""" % BINDING_NAME
+
+    def __init__(self):
+        self._queue: asyncio.Queue = asyncio.Queue()
+
+    async def install(self, page: Page):
+        await page.exposeFunction(self.BINDING_NAME, self._queue.put_nowait)
+        await page.evaluateOnNewDocument(self._WATCHER_JS)
+        await page.evaluate(self._WATCHER_JS)
+
+    async def next_heading(self, current: str, timeout: Optional[float]) -> str:
+        """ Waits for a heading different from the current. Raises asyncio.TimeoutError after timeout seconds. """
+        return await asyncio.wait_for(self._next_different(current), timeout)
+
+    async def _next_different(self, current: str) -> str:
+        while True:
+            heading = await self._queue.get()
+            if heading != current:
+                return heading
 
 
 class AzureAuthHandler:
     DEFAULT_TIMEOUT = 20
     TIMEOUT_MFA = 120
     AZURE_BASE_URL = "https://login.microsoftonline.com"
-    # For some reason this cookie creates an error when used, but it is not needed for restoring session.
-    IGNORE_COOKIE_NAMES = ["esctx"]
 
     STATE_PICK_ACC = AuthState("Pick an account")
     STATE_SIGN_IN = AuthState("Sign in")
@@ -70,61 +131,128 @@ class AzureAuthHandler:
 
     END_STATES = (STATE_MFA, STATE_OTC_CODE)
 
+    # Compiled per class when the class is defined. See _compile_states.
+    _STATE_TABLE: Dict[str, AuthState] = {}
+    _STATE_HANDLERS: Dict[str, str] = {}
+
     def __init__(self, password_manager: PasswordManager):
         self.password_manager = password_manager
-        self.cookie_path = get_data_file_path(f"cookies_{password_manager.username}.json")
+        self.cookie_store = CookieStore(get_data_file_path(f"cookies_{password_manager.username}.json"))
+        self.state_timings: List[Tuple[str, float]] = []
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._compile_states()
 
     @classmethod
-    def _states(cls):
-        return [s for key, s in inspect.getmembers(cls) if key.startswith("STATE") and isinstance(s, AuthState)]
+    def _compile_states(cls):
+        """ Builds the lookup table from normalized heading to state, and from state to handler. """
+        table = {}
+        for key, state in inspect.getmembers(cls, lambda m: isinstance(m, AuthState)):
+            for match in state.matches:
+                normalized = AuthState.normalize(match)
+                if table.get(normalized, state) is not state:
+                    raise Exception(f"More than one state matching heading '{match}'.")
+                table[normalized] = state
+        cls._STATE_TABLE = table
+
+        handlers = {}
+        # Walk from base to subclass, such that registrations in subclasses take precedence. The handlers are
+        # stored by name, such that a subclass may also override a handler without registering it again.
+        for klass in reversed(cls.__mro__):
+            for name, func in vars(klass).items():
+                for state in getattr(func, "auth_states", ()):
+                    handlers[state.name] = name
+        cls._STATE_HANDLERS = handlers
+
+    @classmethod
+    def register_heading(cls, state: AuthState, *headings: str):
+        """ Adds heading variants (e.g. other locales) for a state. """
+        state.matches = state.matches + headings
+        # A subclass which failed to compile (and so failed to be defined) is left out:
+        for klass in [cls] + cls._all_subclasses():
+            if "_STATE_TABLE" in vars(klass):
+                klass._compile_states()
+
+    @classmethod
+    def _all_subclasses(cls) -> List[type]:
+        return [s for sub in cls.__subclasses__() for s in [sub] + sub._all_subclasses()]
+
+    @classmethod
+    def find_state(cls, heading: str) -> Optional[AuthState]:
+        return cls._STATE_TABLE.get(AuthState.normalize(heading))
+
+    async def handle_auth(self, page: Page, watcher: Optional[HeadingWatcher] = None):
+        if watcher is None:
+            watcher = HeadingWatcher()
+            await watcher.install(page)
 
-    async def handle_auth(self, page: Page):
-        states = self._states()
         heading = "**Init**"
         state = AuthState(heading)
+        self.state_timings = []
+        entered = time.time()
 
-        while True:
-            try:
-                timeout = state.timeout or self.DEFAULT_TIMEOUT
-                evt = await page.waitForXPath(
-                    f"//div[@role='heading' and text() != '{heading}']",
-                    visible=True,
-                    timeout=timeout * 1000 if timeout else None
-                )
-                heading = await page.evaluate('(e) => e.textContent', evt)
-                LOG.info(f"## AuthHeader: '{heading}'")
-
-                state = AuthState.find(heading, states)
-                if state is None:
-                    state = AuthState(heading)
-                else:
-                    await self._on_state_changed(page, state)
-                    if state in self.END_STATES:
-                        return
-            except PypTimeoutError:
-                self._on_timeout(state, heading)
+        try:
+            while True:
+                try:
+                    heading = await watcher.next_heading(heading, timeout=state.timeout or self.DEFAULT_TIMEOUT)
+                    LOG.info(f"## AuthHeader: '{heading}'")
+
+                    now = time.time()
+                    self.state_timings.append((state.matches[0], now - entered))
+                    trace.record("auth.state", entered, now, heading=state.matches[0])
+                    entered = now
+
+                    state = self.find_state(heading)
+                    if state is None:
+                        state = AuthState(heading)
+                    else:
+                        await self._on_state_changed(page, state)
+                        if state in self.END_STATES:
+                            return
+                except asyncio.TimeoutError:
+                    self._on_timeout(state, heading)
+        finally:
+            LOG.info("Auth state timings: " + ", ".join(f"'{h}' {t:.2f}s" for h, t in self.state_timings))
 
     async def _on_state_changed(self, page: Page, s: AuthState):
-        if s is self.STATE_PICK_ACC:
-            # There is always just one account (because of cookies).
-            await page.keyboard.press("Enter")
-            LOG.info("Account selected")
-        if s is self.STATE_MFA_EXPIRED:
-            raise MfaExpiredException("MFA Expired!")
-        elif s is self.STATE_SIGN_IN:
-            await self._submit_value(page, "input[name=loginfmt]", self.password_manager.username)
-            LOG.info("Username submitted")
-        elif s is self.STATE_PWD:
-            await self._submit_value(page, "input[name=passwd]", self.password_manager.get_password())
-            LOG.info("Password submitted")
-        elif s is self.STATE_MFA:
-            PRINT("Approve the sign-in request on your phone...")
-        elif s is self.STATE_PWD_UPDATE:
-            LOG.warning(f"Your password needs to be updated. "
-                        f"Login to {self.password_manager.username} in your browser.")
-        elif s is self.STATE_OTC_CODE:
-            await self._submit_value(page, "input[name=otc]", self.password_manager.ask_for_otc())
-            LOG.info("One-time-code submitted")
+        handler = self._STATE_HANDLERS.get(s.name)
+        if handler:
+            await getattr(self, handler)(page)
+
+    @on_state(STATE_PICK_ACC)
+    async def _pick_account(self, page: Page):
+        # There is always just one account (because of cookies).
+        await page.keyboard.press("Enter")
+        LOG.info("Account selected")
+
+    @on_state(STATE_MFA_EXPIRED)
+    async def _mfa_expired(self, page: Page):
+        raise MfaExpiredException("MFA Expired!")
+
+    @on_state(STATE_SIGN_IN)
+    async def _submit_username(self, page: Page):
+        await self._submit_value(page, "input[name=loginfmt]", self.password_manager.username)
+        LOG.info("Username submitted")
+
+    @on_state(STATE_PWD)
+    async def _submit_password(self, page: Page):
+        await self._submit_value(page, "input[name=passwd]", self.password_manager.get_password())
+        LOG.info("Password submitted")
+
+    @on_state(STATE_MFA)
+    async def _mfa(self, page: Page):
+        PRINT("Approve the sign-in request on your phone...")
+
+    @on_state(STATE_PWD_UPDATE)
+    async def _password_update(self, page: Page):
+        LOG.warning(f"Your password needs to be updated. "
+                    f"Login to {self.password_manager.username} in your browser.")
+
+    @on_state(STATE_OTC_CODE)
+    async def _submit_otc(self, page: Page):
+        await self._submit_value(page, "input[name=otc]", self.password_manager.ask_for_otc())
+        LOG.info("One-time-code submitted")
 
     def _on_timeout(self, state: AuthState, heading: str):
         if state is self.STATE_PWD:
@@ -145,18 +273,15 @@ class AzureAuthHandler:
         await page.keyboard.press("Enter")
 
     async def load_cookies(self, page: Page):
-        if os.path.exists(self.cookie_path):
-            with open(self.cookie_path, mode="r") as f:
-                cookies = json.load(f)
-            tasks = [asyncio.create_task(page.setCookie(c))
-                     for c in cookies if c["name"] not in self.IGNORE_COOKIE_NAMES]
-            if len(tasks) > 0:
-                await asyncio.wait(tasks, return_when=asyncio.ALL_COMPLETED)
-            LOG.info(f"Cookies for {self.password_manager.username} loaded.")
+        n = await self.cookie_store.inject(page)
+        if n > 0:
+            LOG.info(f"Cookies for {self.password_manager.username} loaded ({n}).")
         else:
             LOG.info(f"Cookies for {self.password_manager.username} not yet existing.")
 
     async def save_cookies(self, page: Page):
-        with open(self.cookie_path, mode="w") as f:
-            json.dump(await page.cookies(), f)
-        LOG.info(f"Cookies for {self.password_manager.username} saved.")
+        n = await self.cookie_store.save(page)
+        LOG.info(f"Cookies for {self.password_manager.username} saved ({n}).")
+
+
+AzureAuthHandler._compile_states()
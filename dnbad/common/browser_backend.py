@@ -0,0 +1,87 @@
+import logging
+from typing import *
+
+from . import cdp
+
+__all__ = ["BACKENDS", "resolve_backend", "launch", "connect", "send", "ignored_exceptions"]
+
+LOG = logging.getLogger(__name__)
+
+# "cdp" is the built-in driver (dnbad.common.cdp), "pyppeteer" is optional. "auto" picks cdp if Chromium is found.
+BACKENDS = ("auto", "cdp", "pyppeteer")
+
+
+def resolve_backend(backend: str) -> str:
+    if backend != "auto":
+        return backend
+    if cdp.find_chromium():
+        return "cdp"
+    LOG.debug("No Chromium found for the cdp backend. Using pyppeteer.")
+    return "pyppeteer"
+
+
+def _import_pyppeteer():
+    try:
+        import pyppeteer
+    except ImportError:
+        raise cdp.CdpError(
+            "Chromium not found, and pyppeteer is not installed. "
+            "Install Chromium, or pip install dnb-ad-utils[pyppeteer]."
+        ) from None
+    return pyppeteer
+
+
+async def launch(
+        backend: str,
+        headless: bool,
+        dump_io: bool = False,
+        user_data_dir: Optional[str] = None,
+        handle_signals: bool = True,
+        args: Sequence[str] = (),
+        pipe: bool = False
+):
+    """
+    Launches a browser with the backend. The browser has the pyppeteer Browser API subset of dnbad.common.cdp.
+    With pipe, DevTools is not exposed on a port of localhost, which any local user could attach to. pyppeteer does
+    not support it, and always listens on a port.
+    """
+    if resolve_backend(backend) == "cdp":
+        return await cdp.Browser.launch(
+            headless=headless, user_data_dir=user_data_dir, dump_io=dump_io, args=args, pipe=pipe
+        )
+    if pipe:
+        LOG.debug("pyppeteer does not support --remote-debugging-pipe. DevTools listens on a port of localhost.")
+    pyppeteer = _import_pyppeteer()
+    options = {"userDataDir": user_data_dir} if user_data_dir else {}
+    return await pyppeteer.launch(
+        headless=headless,
+        dump_io=dump_io,
+        autoClose=False,
+        handleSIGINT=handle_signals,
+        handleSIGTERM=handle_signals,
+        handleSIGHUP=handle_signals,
+        args=list(args),
+        **options
+    )
+
+
+async def connect(backend: str, ws_endpoint: str):
+    if resolve_backend(backend) == "cdp":
+        return await cdp.Browser.connect(ws_endpoint)
+    return await _import_pyppeteer().connect(browserWSEndpoint=ws_endpoint)
+
+
+async def send(page, method: str, params: Optional[dict] = None) -> dict:
+    """ Sends a DevTools protocol command in the session of a page of either backend. """
+    if isinstance(page, cdp.Page):
+        return await page.send(method, params)
+    # pyppeteer has no public accessor of the session of a page:
+    return await page._client.send(method, params or {})
+
+
+def ignored_exceptions(backend: str) -> Tuple[Type[BaseException], ...]:
+    """ Exceptions of the backend which are raised in background tasks when the browser closes. """
+    if resolve_backend(backend) == "cdp":
+        return cdp.CdpError,
+    from pyppeteer.errors import NetworkError
+    return NetworkError,
@@ -0,0 +1,167 @@
+import asyncio
+import json
+import logging
+import os
+import signal
+import time
+import urllib.request
+from dataclasses import dataclass, asdict
+from typing import *
+from urllib.parse import urlparse
+
+from . import browser_backend, get_data_file_path
+from .utils import atomic_write, run_sync
+
+__all__ = ["BrokerEndpoint", "BrowserBroker"]
+
+LOG = logging.getLogger(__name__)
+
+
+@dataclass
+class BrokerEndpoint:
+    """ The published endpoint of a running broker. The file modification time is used as the last activity. """
+    ws_endpoint: str
+    pid: int
+    browser_pid: int
+    headless: bool
+
+    @staticmethod
+    def file_path() -> str:
+        return get_data_file_path("browser_broker.json")
+
+    @classmethod
+    def load(cls) -> Optional["BrokerEndpoint"]:
+        try:
+            with open(cls.file_path(), "r") as f:
+                return cls(**json.load(f))
+        except (OSError, ValueError, TypeError):
+            return None
+
+    def save(self):
+        atomic_write(self.file_path(), json.dumps(asdict(self)))
+
+    @classmethod
+    def delete(cls):
+        try:
+            os.remove(cls.file_path())
+        except FileNotFoundError:
+            pass
+
+    @classmethod
+    def touch(cls):
+        try:
+            os.utime(cls.file_path())
+        except FileNotFoundError:
+            pass
+
+    @classmethod
+    def idle_seconds(cls) -> float:
+        return time.time() - os.path.getmtime(cls.file_path())
+
+    def version_url(self) -> str:
+        return f"http://{urlparse(self.ws_endpoint).netloc}/json/version"
+
+
+class BrowserBroker:
+    """
+    Keeps one Chromium running, such that awsad and gproxy can attach to it instead of cold starting a browser.
+    The broker shuts down when no client has used it for `idle_timeout` seconds.
+
+    Clients attach over DevTools on a port of localhost, which has no authentication: Any local user can attach to
+    the browser while it runs, and read the Azure session of a login in progress. The endpoint file is only readable
+    by the user, and each client logs in in its own incognito context, which is closed after the login, such that no
+    session is left in the browser between logins. Do not run the broker on machines shared with other users.
+    """
+    IDLE_TIMEOUT = 15 * 60
+    POLL_TIME = 10
+    HEALTH_CHECK_TIMEOUT = 1
+
+    def __init__(self, headless: bool = True, idle_timeout: int = IDLE_TIMEOUT, backend: str = "auto"):
+        self.headless = headless
+        self.idle_timeout = idle_timeout
+        self.backend = backend
+
+    def run_sync(self):
+        run_sync(self.run())
+
+    async def run(self):
+        browser = await browser_backend.launch(self.backend, self.headless, handle_signals=False)
+        endpoint = BrokerEndpoint(
+            ws_endpoint=browser.wsEndpoint,
+            pid=os.getpid(),
+            browser_pid=browser.process.pid,
+            headless=self.headless
+        )
+        endpoint.save()
+        LOG.info(f"Browser broker started on {endpoint.ws_endpoint}")
+
+        stop = asyncio.Event()
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+        try:
+            while not stop.is_set():
+                if len([t for t in browser.targets() if t.type == "page"]) > 1:
+                    # Clients have pages open:
+                    BrokerEndpoint.touch()
+                if BrokerEndpoint.idle_seconds() > self.idle_timeout:
+                    LOG.info("Browser broker idle. Shutting down.")
+                    break
+                if not self.health_check(endpoint):
+                    LOG.warning("Browser broker failed health check. Shutting down.")
+                    break
+                try:
+                    await asyncio.wait_for(stop.wait(), timeout=self.POLL_TIME)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            BrokerEndpoint.delete()
+            await browser.close()
+            LOG.info("Browser broker stopped.")
+
+    @classmethod
+    def health_check(cls, endpoint: BrokerEndpoint) -> bool:
+        """ Checks that the browser answers on its DevTools port, and that it is the browser that was published. """
+        try:
+            with urllib.request.urlopen(endpoint.version_url(), timeout=cls.HEALTH_CHECK_TIMEOUT) as response:
+                version = json.load(response)
+        except (OSError, ValueError):
+            return False
+        return version.get("webSocketDebuggerUrl") == endpoint.ws_endpoint
+
+    @classmethod
+    def status(cls) -> Optional[BrokerEndpoint]:
+        endpoint = BrokerEndpoint.load()
+        return endpoint if endpoint and cls.health_check(endpoint) else None
+
+    @classmethod
+    def stop(cls) -> bool:
+        endpoint = BrokerEndpoint.load()
+        if endpoint is None:
+            return False
+        try:
+            os.kill(endpoint.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            # Stale endpoint from a broker that did not exit cleanly:
+            BrokerEndpoint.delete()
+            return False
+        return True
+
+    @classmethod
+    async def connect(cls, headless: bool, backend: str = "auto"):
+        """
+        Attaches to a running broker with the backend, which may differ from the backend of the broker.
+        Returns None if there is no healthy broker, and the caller should launch.
+        """
+        endpoint = BrokerEndpoint.load()
+        if endpoint is None or endpoint.headless != headless:
+            return None
+        if not cls.health_check(endpoint):
+            LOG.info("Browser broker is not responding. Falling back to launching a browser.")
+            return None
+        try:
+            browser = await browser_backend.connect(backend, endpoint.ws_endpoint)
+        except Exception as e:
+            LOG.info(f"Could not connect to browser broker ({e}). Falling back to launching a browser.")
+            return None
+        BrokerEndpoint.touch()
+        LOG.info("Attached to browser broker.")
+        return browser
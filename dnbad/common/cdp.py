@@ -0,0 +1,667 @@
+"""
+A minimal asyncio Chrome DevTools Protocol driver for a locally installed Chromium.
+
+It implements the small part of the pyppeteer Browser and Page API that dnbad uses, such that the auth code runs on
+either backend, without the import time and memory of pyppeteer:
+
+    Browser: launch, connect, newPage, createIncognitoBrowserContext, targets, wsEndpoint, process, close, disconnect
+    Page: goto, evaluate, evaluateOnNewDocument, exposeFunction, type, keyboard.press, waitFor, waitForSelector,
+          waitForFunction, waitForRequest, setRequestInterception, on("request"/"response"), url, close
+
+Page.send sends any DevTools protocol command, see dnbad.common.browser_backend.send.
+"""
+import asyncio
+import fcntl
+import glob
+import json
+import logging
+import os
+import re
+import shutil
+import sys
+import tempfile
+from collections import defaultdict
+from typing import *
+
+import websockets
+
+__all__ = ["CdpError", "find_chromium", "Browser", "BrowserContext", "Page", "Request", "Response", "Target"]
+
+LOG = logging.getLogger(__name__)
+
+
+class CdpError(Exception):
+    pass
+
+
+_CHROMIUM_NAMES = ("chromium", "chromium-browser", "google-chrome", "google-chrome-stable", "chrome")
+_CHROMIUM_PATHS = (
+    "/Applications/Google Chrome.app/Contents/MacOS/Google Chrome",
+    "/Applications/Chromium.app/Contents/MacOS/Chromium",
+)
+# Where pyppeteer-install downloads Chromium:
+_PYPPETEER_CHROMIUM_GLOBS = (
+    "local-chromium/*/chrome-linux/chrome",
+    "local-chromium/*/chrome-mac/Chromium.app/Contents/MacOS/Chromium",
+    "local-chromium/*/chrome-win*/chrome.exe",
+)
+
+
+def _pyppeteer_home() -> str:
+    if os.environ.get("PYPPETEER_HOME"):
+        return os.environ["PYPPETEER_HOME"]
+    if sys.platform == "darwin":
+        return os.path.expanduser("~/Library/Application Support/pyppeteer")
+    return os.path.join(os.environ.get("XDG_DATA_HOME", os.path.expanduser("~/.local/share")), "pyppeteer")
+
+
+def find_chromium() -> Optional[str]:
+    """ Finds a Chromium executable: DNBAD_CHROMIUM, the PATH, the standard app locations, or pyppeteer's download. """
+    if os.environ.get("DNBAD_CHROMIUM"):
+        return os.environ["DNBAD_CHROMIUM"]
+    for name in _CHROMIUM_NAMES:
+        path = shutil.which(name)
+        if path:
+            return path
+    for path in _CHROMIUM_PATHS:
+        if os.path.exists(path):
+            return path
+    for pattern in _PYPPETEER_CHROMIUM_GLOBS:
+        paths = sorted(glob.glob(os.path.join(_pyppeteer_home(), pattern)))
+        if paths:
+            return paths[-1]
+    return None
+
+
+class _PipeTransport:
+    """
+    The DevTools protocol over --remote-debugging-pipe, with the send, iteration and close of a websocket.
+    Messages are JSON terminated by NUL. Chromium reads them on its fd 3, and writes them on its fd 4.
+    """
+    # Messages are buffered until their NUL. Some (e.g. Network.getAllCookies) are large.
+    READ_LIMIT = 256 * 1024 * 1024
+
+    def __init__(self, reader: asyncio.StreamReader, read_transport: asyncio.ReadTransport,
+                 writer: asyncio.StreamWriter):
+        self._reader = reader
+        self._read_transport = read_transport
+        self._writer = writer
+
+    @classmethod
+    async def open(cls, read_fd: int, write_fd: int) -> "_PipeTransport":
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader(limit=cls.READ_LIMIT)
+        read_transport, _ = await loop.connect_read_pipe(
+            lambda: asyncio.StreamReaderProtocol(reader), os.fdopen(read_fd, "rb", buffering=0)
+        )
+        write_transport, write_protocol = await loop.connect_write_pipe(
+            asyncio.streams.FlowControlMixin, os.fdopen(write_fd, "wb", buffering=0)
+        )
+        return cls(reader, read_transport, asyncio.StreamWriter(write_transport, write_protocol, None, loop))
+
+    async def send(self, message: str):
+        self._writer.write(message.encode() + b"\0")
+        await self._writer.drain()
+
+    async def __aiter__(self):
+        while True:
+            try:
+                message = await self._reader.readuntil(b"\0")
+            except asyncio.IncompleteReadError:
+                return
+            yield message[:-1].decode()
+
+    async def close(self):
+        self._writer.close()
+        self._read_transport.close()
+
+
+class _Connection:
+    """ One websocket, or pipe, to the browser. Page sessions are multiplexed on it with flat session ids. """
+
+    def __init__(self, ws):
+        self._ws = ws
+        self._last_id = 0
+        self._callbacks: Dict[int, asyncio.Future] = {}
+        self.sessions: Dict[Optional[str], _Session] = {}
+        self.root = _Session(self, None)
+        self._reader = asyncio.ensure_future(self._read())
+
+    @classmethod
+    async def open(cls, ws_endpoint: str) -> "_Connection":
+        return cls(await websockets.connect(ws_endpoint, max_size=None, ping_interval=None))
+
+    @classmethod
+    async def open_pipe(cls, read_fd: int, write_fd: int) -> "_Connection":
+        return cls(await _PipeTransport.open(read_fd, write_fd))
+
+    async def send(self, method: str, params: Optional[dict], session_id: Optional[str]) -> dict:
+        self._last_id += 1
+        message = {"id": self._last_id, "method": method, "params": params or {}}
+        if session_id:
+            message["sessionId"] = session_id
+        future = asyncio.get_running_loop().create_future()
+        self._callbacks[self._last_id] = future
+        await self._ws.send(json.dumps(message))
+        return await future
+
+    async def _read(self):
+        try:
+            async for raw in self._ws:
+                message = json.loads(raw)
+                if "id" in message:
+                    future = self._callbacks.pop(message["id"], None)
+                    if future is None or future.done():
+                        continue
+                    if "error" in message:
+                        future.set_exception(CdpError(message["error"].get("message", str(message["error"]))))
+                    else:
+                        future.set_result(message.get("result", {}))
+                else:
+                    session = self.sessions.get(message.get("sessionId"))
+                    if session:
+                        session.emit(message["method"], message.get("params", {}))
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            for future in self._callbacks.values():
+                if not future.done():
+                    future.set_exception(CdpError("Connection to the browser closed."))
+            self._callbacks.clear()
+
+    async def close(self):
+        await self._ws.close()
+        await self._reader
+
+
+class _Session:
+    """ Sends commands to a target and dispatches its events. Has the send() of a pyppeteer CDPSession. """
+
+    def __init__(self, connection: _Connection, session_id: Optional[str]):
+        self.connection = connection
+        self.session_id = session_id
+        self._listeners: Dict[str, List[Callable[[dict], None]]] = defaultdict(list)
+        connection.sessions[session_id] = self
+
+    async def send(self, method: str, params: Optional[dict] = None) -> dict:
+        return await self.connection.send(method, params, self.session_id)
+
+    def on(self, event: str, listener: Callable[[dict], None]):
+        self._listeners[event].append(listener)
+
+    def emit(self, event: str, params: dict):
+        for listener in list(self._listeners.get(event, ())):
+            listener(params)
+
+    def detach(self):
+        self.connection.sessions.pop(self.session_id, None)
+
+
+class Target(NamedTuple):
+    targetId: str
+    type: str
+    url: str
+
+
+class Request:
+    def __init__(
+            self,
+            session: _Session,
+            request: dict,
+            resource_type: str,
+            interception_id: Optional[str] = None,
+            network_id: Optional[str] = None
+    ):
+        self._session = session
+        self._interception_id = interception_id
+        self._network_id = network_id
+        self._has_post_data: bool = request.get("hasPostData", False)
+        self.url: str = request["url"]
+        self.method: str = request["method"]
+        self.headers: Dict[str, str] = request.get("headers", {})
+        self.postData: Optional[str] = request.get("postData")
+        self.resourceType: str = resource_type.lower()
+
+    async def _load_post_data(self):
+        """ Large post data is not included in the event, and must be fetched. """
+        if self.postData is None and self._has_post_data and self._network_id:
+            result = await self._session.send("Network.getRequestPostData", {"requestId": self._network_id})
+            self.postData = result["postData"]
+
+    async def continue_(self):
+        if self._interception_id:
+            await self._session.send("Fetch.continueRequest", {"requestId": self._interception_id})
+
+    async def abort(self):
+        if self._interception_id:
+            await self._session.send("Fetch.failRequest", {"requestId": self._interception_id, "errorReason": "Failed"})
+
+
+class Response:
+    def __init__(self, response: dict):
+        self.url: str = response["url"]
+        self.status: int = response["status"]
+        self.headers: Dict[str, str] = {k.lower(): v for k, v in response.get("headers", {}).items()}
+
+
+class _Keyboard:
+    # key: (windowsVirtualKeyCode, text)
+    _KEYS = {"Enter": (13, "\r"), "Tab": (9, ""), "Escape": (27, ""), "Backspace": (8, "")}
+
+    def __init__(self, session: _Session):
+        self._session = session
+
+    async def press(self, key: str):
+        code, text = self._KEYS.get(key, (ord(key.upper()[0]), key))
+        params = {"key": key, "code": key, "windowsVirtualKeyCode": code}
+        await self._session.send("Input.dispatchKeyEvent", {"type": "keyDown", "text": text, **params})
+        await self._session.send("Input.dispatchKeyEvent", {"type": "keyUp", **params})
+
+
+class Page:
+    # The lifecycle event that ends a navigation, per waitUntil of pyppeteer:
+    _LIFECYCLE_EVENTS = {
+        "load": "load",
+        "domcontentloaded": "DOMContentLoaded",
+        "networkidle0": "networkIdle",
+        "networkidle2": "networkAlmostIdle",
+    }
+    _FUNCTION_PATTERN = re.compile(r"^\s*(async\s+)?(function\b|\([^)]*\)\s*=>|\w+\s*=>)")
+    _SELECTOR_JS = """(selector, visible, hidden) => {
+        const e = document.querySelector(selector);
+        const isVisible = !!e && window.getComputedStyle(e).visibility !== "hidden" && e.getClientRects().length > 0;
+        if (hidden) return !e || !isVisible;
+        return !!e && (!visible || isVisible);
+    }"""
+    # Errors from evaluating while the page navigates. Polling retries on these.
+    _CONTEXT_ERRORS = ("Execution context was destroyed", "Cannot find context", "Inspected target navigated")
+
+    def __init__(self, session: _Session, target_id: str):
+        self._client = session
+        self.target_id = target_id
+        self.keyboard = _Keyboard(session)
+        self.url = "about:blank"
+        self._main_frame: Optional[str] = None
+        self._lifecycle: Dict[str, Set[str]] = defaultdict(set)
+        self._lifecycle_changed = asyncio.Event()
+        self._bindings: Dict[str, Callable] = {}
+        self._listeners: Dict[str, List[Callable]] = defaultdict(list)
+        self._intercepting = False
+
+        session.on("Page.lifecycleEvent", self._on_lifecycle_event)
+        session.on("Page.frameNavigated", self._on_frame_navigated)
+        session.on("Runtime.bindingCalled", self._on_binding_called)
+        session.on("Network.requestWillBeSent", self._on_request_will_be_sent)
+        session.on("Network.responseReceived", lambda p: self._emit("response", Response(p["response"])))
+        session.on("Fetch.requestPaused", self._on_request_paused)
+
+    async def _init(self):
+        frame_tree = (await asyncio.gather(
+            self._client.send("Page.getFrameTree"),
+            self._client.send("Page.enable"),
+            self._client.send("Page.setLifecycleEventsEnabled", {"enabled": True}),
+            self._client.send("Runtime.enable"),
+            self._client.send("Network.enable"),
+        ))[0]
+        self._main_frame = frame_tree["frameTree"]["frame"]["id"]
+
+    async def send(self, method: str, params: Optional[dict] = None) -> dict:
+        """ Sends a DevTools protocol command in the session of the page. """
+        return await self._client.send(method, params)
+
+    def on(self, event: str, listener: Callable):
+        """ Listens to the page events "request" and "response", like pyppeteer. """
+        self._listeners[event].append(listener)
+
+    def remove_listener(self, event: str, listener: Callable):
+        self._listeners[event].remove(listener)
+
+    def _emit(self, event: str, arg):
+        for listener in list(self._listeners.get(event, ())):
+            listener(arg)
+
+    def _on_lifecycle_event(self, params: dict):
+        if params["frameId"] == self._main_frame:
+            self._lifecycle[params["loaderId"]].add(params["name"])
+            self._lifecycle_changed.set()
+
+    def _on_frame_navigated(self, params: dict):
+        frame = params["frame"]
+        if frame.get("parentId") is None:
+            self._main_frame = frame["id"]
+            self.url = frame["url"]
+
+    def _on_binding_called(self, params: dict):
+        binding = self._bindings.get(params["name"])
+        if binding:
+            binding(params["payload"])
+
+    def _on_request_will_be_sent(self, params: dict):
+        # With interception enabled, requests are emitted when paused instead.
+        if not self._intercepting:
+            self._emit("request", Request(
+                self._client, params["request"], params.get("type", "other"), network_id=params["requestId"]
+            ))
+
+    def _on_request_paused(self, params: dict):
+        request = Request(
+            self._client, params["request"], params.get("resourceType", "other"), params["requestId"],
+            params.get("networkId")
+        )
+        if self._listeners.get("request"):
+            self._emit("request", request)
+        else:
+            asyncio.ensure_future(request.continue_())
+
+    async def setRequestInterception(self, value: bool):
+        self._intercepting = value
+        if value:
+            await self._client.send("Fetch.enable", {"patterns": [{"urlPattern": "*"}]})
+        else:
+            await self._client.send("Fetch.disable")
+
+    async def goto(self, url: str, waitUntil: str = "load", timeout: int = 30000):
+        result = await self._client.send("Page.navigate", {"url": url, "frameId": self._main_frame})
+        if result.get("errorText"):
+            raise CdpError(f"{result['errorText']} at {url}")
+        loader_id = result.get("loaderId")
+        if loader_id is None:
+            # Navigation within the document.
+            return
+        event = self._LIFECYCLE_EVENTS[waitUntil]
+        await asyncio.wait_for(self._wait_lifecycle(loader_id, event), timeout / 1000)
+
+    async def _wait_lifecycle(self, loader_id: str, event: str):
+        while event not in self._lifecycle[loader_id]:
+            self._lifecycle_changed.clear()
+            await self._lifecycle_changed.wait()
+
+    @classmethod
+    def _expression(cls, page_function: str, args: Sequence) -> str:
+        if cls._FUNCTION_PATTERN.match(page_function):
+            return f"({page_function})({', '.join(json.dumps(a) for a in args)})"
+        return page_function
+
+    async def evaluate(self, page_function: str, *args) -> Any:
+        """ Evaluates a function or expression in the page. Arguments and result must be JSON serializable. """
+        result = await self._client.send("Runtime.evaluate", {
+            "expression": self._expression(page_function, args),
+            "returnByValue": True,
+            "awaitPromise": True,
+        })
+        if "exceptionDetails" in result:
+            details = result["exceptionDetails"]
+            raise CdpError(details.get("exception", {}).get("description") or details.get("text"))
+        return result["result"].get("value")
+
+    async def evaluateOnNewDocument(self, page_function: str, *args):
+        await self._client.send("Page.addScriptToEvaluateOnNewDocument", {
+            "source": self._expression(page_function, args)
+        })
+
+    async def exposeFunction(self, name: str, function: Callable[[str], Any]):
+        """ Exposes a function of one string argument as window[name], in this and later documents. """
+        self._bindings[name] = function
+        await self._client.send("Runtime.addBinding", {"name": name})
+
+    async def waitForFunction(self, page_function: str, *args, polling: int = 100, timeout: int = 30000) -> Any:
+        """ Polls the function until it returns a truthy value. """
+
+        async def poll():
+            while True:
+                try:
+                    value = await self.evaluate(page_function, *args)
+                except CdpError as e:
+                    if not any(m in str(e) for m in self._CONTEXT_ERRORS):
+                        raise
+                    value = None
+                if value:
+                    return value
+                await asyncio.sleep(polling / 1000)
+
+        if not isinstance(polling, int):
+            polling = 100
+        return await asyncio.wait_for(poll(), timeout / 1000)
+
+    async def waitForSelector(self, selector: str, visible: bool = False, hidden: bool = False, timeout: int = 30000):
+        return await self.waitForFunction(self._SELECTOR_JS, selector, visible, hidden, timeout=timeout)
+
+    async def waitFor(self, selector: str, **options):
+        return await self.waitForSelector(selector, **options)
+
+    async def type(self, selector: str, text: str):
+        await self.evaluate("(selector) => document.querySelector(selector).focus()", selector)
+        await self._client.send("Input.insertText", {"text": text})
+
+    async def waitForRequest(self, url: Union[str, Callable[[Request], bool]], timeout: int = 30000) -> Request:
+        future = asyncio.get_running_loop().create_future()
+
+        def on_request(request: Request):
+            matches = url(request) if callable(url) else request.url == url
+            if matches and not future.done():
+                future.set_result(request)
+
+        self.on("request", on_request)
+        try:
+            request = await asyncio.wait_for(future, timeout / 1000)
+        finally:
+            self.remove_listener("request", on_request)
+        await request._load_post_data()
+        return request
+
+    async def close(self):
+        await self._client.connection.root.send("Target.closeTarget", {"targetId": self.target_id})
+        self._client.detach()
+
+
+class BrowserContext:
+    def __init__(self, browser: "Browser", context_id: str):
+        self._browser = browser
+        self.context_id = context_id
+
+    async def newPage(self) -> Page:
+        return await self._browser._new_page(self.context_id)
+
+    async def close(self):
+        await self._browser.connection.root.send("Target.disposeBrowserContext", {"browserContextId": self.context_id})
+
+
+class Browser:
+    LAUNCH_TIMEOUT = 30
+    CLOSE_TIMEOUT = 5
+    DEFAULT_ARGS = (
+        "--disable-background-networking",
+        "--disable-background-timer-throttling",
+        "--disable-breakpad",
+        "--disable-client-side-phishing-detection",
+        "--disable-default-apps",
+        "--disable-dev-shm-usage",
+        "--disable-extensions",
+        "--disable-hang-monitor",
+        "--disable-popup-blocking",
+        "--disable-prompt-on-repost",
+        "--disable-sync",
+        "--disable-translate",
+        "--metrics-recording-only",
+        "--no-first-run",
+        "--no-default-browser-check",
+        "--safebrowsing-disable-auto-update",
+        "--password-store=basic",
+        "--use-mock-keychain",
+    )
+    HEADLESS_ARGS = ("--headless", "--hide-scrollbars", "--mute-audio")
+
+    def __init__(
+            self,
+            connection: _Connection,
+            ws_endpoint: Optional[str],
+            process: Optional[asyncio.subprocess.Process] = None,
+            temp_dir: Optional[str] = None
+    ):
+        self.connection = connection
+        self.wsEndpoint = ws_endpoint
+        self.process = process
+        self._temp_dir = temp_dir
+        self._targets: Dict[str, Target] = {}
+
+    async def _init(self) -> "Browser":
+        root = self.connection.root
+        root.on("Target.targetCreated", self._on_target_changed)
+        root.on("Target.targetInfoChanged", self._on_target_changed)
+        root.on("Target.targetDestroyed", lambda p: self._targets.pop(p["targetId"], None))
+        await root.send("Target.setDiscoverTargets", {"discover": True})
+        return self
+
+    def _on_target_changed(self, params: dict):
+        info = params["targetInfo"]
+        self._targets[info["targetId"]] = Target(info["targetId"], info["type"], info["url"])
+
+    def targets(self) -> List[Target]:
+        return list(self._targets.values())
+
+    @classmethod
+    async def launch(
+            cls,
+            headless: bool = True,
+            user_data_dir: Optional[str] = None,
+            dump_io: bool = False,
+            args: Sequence[str] = (),
+            executable: Optional[str] = None,
+            pipe: bool = False
+    ) -> "Browser":
+        """
+        Launches Chromium. By default DevTools listens on a port of localhost, which other processes may attach to
+        (see BrowserBroker), but which any local user can reach as well. With pipe, DevTools is only reachable through
+        pipes to this process, and the browser has no wsEndpoint.
+        """
+        executable = executable or find_chromium()
+        if executable is None:
+            raise CdpError("Chromium not found. Install Chromium, or set DNBAD_CHROMIUM to its executable.")
+        temp_dir = None
+        if user_data_dir is None:
+            user_data_dir = temp_dir = tempfile.mkdtemp(prefix="dnbad_chromium_")
+        pipe_fds = cls._open_pipes() if pipe else None
+        try:
+            process = await asyncio.create_subprocess_exec(
+                executable,
+                *cls.DEFAULT_ARGS,
+                *(cls.HEADLESS_ARGS if headless else ()),
+                *args,
+                "--remote-debugging-pipe" if pipe else "--remote-debugging-port=0",
+                f"--user-data-dir={user_data_dir}",
+                "about:blank",
+                stdout=None if dump_io else asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.PIPE,
+                **(cls._pipe_options(pipe_fds) if pipe else {})
+            )
+        except BaseException:
+            if pipe_fds:
+                for fd in pipe_fds:
+                    os.close(fd)
+            if temp_dir:
+                shutil.rmtree(temp_dir, ignore_errors=True)
+            raise
+        try:
+            if pipe:
+                browser_read, parent_write, parent_read, browser_write = pipe_fds
+                os.close(browser_read)
+                os.close(browser_write)
+                ws_endpoint = None
+                asyncio.ensure_future(cls._drain(process.stderr, dump_io))
+                connection = await _Connection.open_pipe(parent_read, parent_write)
+            else:
+                ws_endpoint = await asyncio.wait_for(cls._read_ws_endpoint(process, dump_io), cls.LAUNCH_TIMEOUT)
+                # Keep reading stderr, such that Chromium never blocks on a full pipe.
+                asyncio.ensure_future(cls._drain(process.stderr, dump_io))
+                connection = await _Connection.open(ws_endpoint)
+            return await asyncio.wait_for(cls(connection, ws_endpoint, process, temp_dir)._init(), cls.LAUNCH_TIMEOUT)
+        except BaseException:
+            process.kill()
+            await process.wait()
+            if temp_dir:
+                shutil.rmtree(temp_dir, ignore_errors=True)
+            raise
+
+    @staticmethod
+    def _open_pipes() -> Tuple[int, int, int, int]:
+        """ The read and write ends of the pipe to the browser, and of the pipe from the browser. """
+        browser_read, parent_write = os.pipe()
+        parent_read, browser_write = os.pipe()
+        return browser_read, parent_write, parent_read, browser_write
+
+    @staticmethod
+    def _pipe_options(pipe_fds: Tuple[int, int, int, int]) -> dict:
+        """ Options of the subprocess, which put the ends of the browser at fd 3 and 4, as Chromium expects. """
+        browser_read, _, _, browser_write = pipe_fds
+
+        def move_fds():
+            # Copied above 4 first, such that neither is closed by the dup2 of the other:
+            read_fd = fcntl.fcntl(browser_read, fcntl.F_DUPFD, 5)
+            write_fd = fcntl.fcntl(browser_write, fcntl.F_DUPFD, 5)
+            os.dup2(read_fd, 3)
+            os.dup2(write_fd, 4)
+
+        # The pipes of Python are not inheritable, and only fd 3 and 4 are left open in the browser:
+        return {"preexec_fn": move_fds, "close_fds": False}
+
+    @staticmethod
+    async def _read_ws_endpoint(process: asyncio.subprocess.Process, dump_io: bool) -> str:
+        while True:
+            line = (await process.stderr.readline()).decode(errors="replace")
+            if not line:
+                raise CdpError(f"Chromium exited before listening for DevTools (code {await process.wait()}).")
+            if dump_io:
+                sys.stderr.write(line)
+            match = re.search(r"DevTools listening on (ws://\S+)", line)
+            if match:
+                return match.group(1)
+
+    @staticmethod
+    async def _drain(stream: asyncio.StreamReader, dump_io: bool):
+        while True:
+            line = await stream.readline()
+            if not line:
+                return
+            if dump_io:
+                sys.stderr.write(line.decode(errors="replace"))
+
+    @classmethod
+    async def connect(cls, ws_endpoint: str) -> "Browser":
+        return await cls(await _Connection.open(ws_endpoint), ws_endpoint)._init()
+
+    async def _new_page(self, context_id: Optional[str] = None) -> Page:
+        params = {"url": "about:blank"}
+        if context_id:
+            params["browserContextId"] = context_id
+        root = self.connection.root
+        target_id = (await root.send("Target.createTarget", params))["targetId"]
+        session_id = (await root.send("Target.attachToTarget", {"targetId": target_id, "flatten": True}))["sessionId"]
+        page = Page(_Session(self.connection, session_id), target_id)
+        await page._init()
+        return page
+
+    async def newPage(self) -> Page:
+        return await self._new_page()
+
+    async def createIncognitoBrowserContext(self) -> BrowserContext:
+        result = await self.connection.root.send("Target.createBrowserContext")
+        return BrowserContext(self, result["browserContextId"])
+
+    async def disconnect(self):
+        await self.connection.close()
+
+    async def close(self):
+        try:
+            await self.connection.root.send("Browser.close")
+        except CdpError:
+            pass
+        await self.connection.close()
+        if self.process:
+            try:
+                await asyncio.wait_for(self.process.wait(), self.CLOSE_TIMEOUT)
+            except asyncio.TimeoutError:
+                LOG.warning("Chromium did not exit. Killing it.")
+                self.process.kill()
+                await self.process.wait()
+        if self._temp_dir:
+            shutil.rmtree(self._temp_dir, ignore_errors=True)
@@ -0,0 +1,69 @@
+import logging
+import os
+from typing import *
+
+from . import get_data_file_path
+from .file_lock import FileLock
+
+__all__ = ["ChromiumProfile"]
+
+LOG = logging.getLogger(__name__)
+
+
+class ChromiumProfile:
+    """
+    A persistent Chromium user data dir per user, keeping the HTTP cache, service workers and storage between logins.
+    Only one browser may use the profile at a time. The caches are evicted oldest first when the size cap is exceeded.
+    """
+    MAX_SIZE = 200 * 1024 * 1024
+    CACHE_DIRS = (
+        os.path.join("Default", "Cache"),
+        os.path.join("Default", "Code Cache"),
+        os.path.join("Default", "GPUCache"),
+        os.path.join("Default", "Service Worker", "CacheStorage"),
+    )
+
+    def __init__(self, username: str, max_size: int = MAX_SIZE):
+        self.path = get_data_file_path(f"chromium_{username}")
+        self.max_size = max_size
+        self._lock = FileLock(f"{self.path}.lock")
+
+    def acquire(self) -> bool:
+        """ Returns False if another process is using the profile. """
+        if not self._lock.try_acquire():
+            LOG.info("Chromium profile is in use by another process.")
+            return False
+        os.makedirs(self.path, exist_ok=True)
+        self.evict()
+        return True
+
+    def release(self):
+        self._lock.release()
+
+    @staticmethod
+    def _files(directory: str) -> List[Tuple[str, os.stat_result]]:
+        files = []
+        for root, _, names in os.walk(directory):
+            for name in names:
+                file_path = os.path.join(root, name)
+                try:
+                    files.append((file_path, os.stat(file_path)))
+                except OSError:
+                    pass
+        return files
+
+    def size(self) -> int:
+        return sum(s.st_size for _, s in self._files(self.path))
+
+    def evict(self):
+        size = self.size()
+        if size <= self.max_size:
+            return
+        cache_files = [f for d in self.CACHE_DIRS for f in self._files(os.path.join(self.path, d))]
+        cache_files.sort(key=lambda f: f[1].st_mtime)
+        for file_path, stat in cache_files:
+            if size <= self.max_size:
+                break
+            os.remove(file_path)
+            size -= stat.st_size
+        LOG.info(f"Chromium profile cache evicted to {size / 1024 / 1024:.0f} MiB.")
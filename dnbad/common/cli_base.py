@@ -7,7 +7,7 @@ from dataclasses import dataclass
 from logging.handlers import RotatingFileHandler
 from typing import *
 
-from . import VERSION, get_data_file_path
+from . import VERSION, get_data_file_path, trace
 
 
 @dataclass
@@ -21,7 +21,10 @@ class CliBase:
         self.subparsers = self.parser.add_subparsers(dest="cmd")
 
     def add_cmd(self, name: str, help: str):
-        return self.subparsers.add_parser(name, help=help)
+        parser = self.subparsers.add_parser(name, help=help)
+        parser.add_argument("--trace", help="Write timing spans as JSON lines to the file, and print a summary",
+                            metavar="FILE")
+        return parser
 
     def handle(self):
         success = self._handle()
@@ -65,10 +68,16 @@ class CliBase:
             if args.cmd is None:
                 self.parser.print_help()
                 return True
+            elif args.trace:
+                return self._handle_cmd_traced(args)
             else:
                 return self._handle_cmd(args.cmd, args)
         finally:
             self.LOG.debug(f"======END(cmd={args.cmd},id={log_id})======")
 
+    def _handle_cmd_traced(self, args: Namespace) -> Optional[bool]:
+        with trace.export(args.trace, f"{self.prog}.{args.cmd}"):
+            return self._handle_cmd(args.cmd, args)
+
     def _handle_cmd(self, cmd: str, args: Namespace) -> Optional[bool]:
         raise NotImplementedError()
@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import time
+from typing import *
+
+from . import browser_backend
+from .file_lock import FileLock
+from .utils import atomic_write
+
+if TYPE_CHECKING:
+    from pyppeteer.page import Page
+
+__all__ = ["CookieStore"]
+
+LOG = logging.getLogger(__name__)
+
+
+class CookieStore:
+    """
+    The Azure cookies of a user, shared between awsad and gproxy.
+    Writes are atomic and locked, and expired cookies are pruned, such that concurrent logins do not lose the session.
+    """
+    # Cookies outside of these domains are not needed to restore the Azure session.
+    DOMAINS = ("microsoftonline.com", "microsoft.com", "live.com", "office.com")
+    # For some reason this cookie creates an error when used, but it is not needed for restoring session.
+    IGNORE_COOKIE_NAMES = ("esctx",)
+    # Fields accepted by Network.setCookies:
+    _COOKIE_PARAMS = ("name", "value", "domain", "path", "secure", "httpOnly", "sameSite", "expires")
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = FileLock(f"{path}.lock")
+
+    @classmethod
+    def _is_expired(cls, cookie: dict, now: float) -> bool:
+        # Session cookies have expires -1.
+        return 0 <= cookie.get("expires", -1) < now
+
+    @classmethod
+    def _in_scope(cls, cookie: dict) -> bool:
+        domain = cls._domain(cookie)
+        return any(domain == d or domain.endswith(f".{d}") for d in cls.DOMAINS)
+
+    @staticmethod
+    def _domain(cookie: dict) -> str:
+        return cookie["domain"].lstrip(".")
+
+    def _read(self) -> List[dict]:
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path, mode="r") as f:
+            return json.load(f)
+
+    def load(self) -> List[dict]:
+        """ Returns the stored cookies that are not expired. """
+        now = time.time()
+        return [c for c in self._read() if c["name"] not in self.IGNORE_COOKIE_NAMES and not self._is_expired(c, now)]
+
+    def write(self, cookies: List[dict]) -> int:
+        """
+        Stores the cookies in scope which are not expired. They are the cookies of the browser, and replace the stored
+        cookies of their domains. Stored cookies of other domains, e.g. saved by another login, are kept unless they are
+        expired or session cookies, which would otherwise never be pruned. Returns the number of cookies stored.
+        """
+        with self._lock:
+            now = time.time()
+            domains = {self._domain(c) for c in cookies}
+            kept = [
+                c for c in self._read()
+                if self._domain(c) not in domains and c.get("expires", -1) >= 0 and not self._is_expired(c, now)
+            ]
+            cookies = [c for c in cookies + kept if self._in_scope(c) and not self._is_expired(c, now)]
+            atomic_write(self.path, json.dumps(cookies))
+        return len(cookies)
+
+    async def inject(self, page: Page) -> int:
+        """ Sets all stored cookies in the page in one round trip. Returns the number of cookies set. """
+        cookies = [
+            {k: v for k, v in c.items() if k in self._COOKIE_PARAMS and not (k == "expires" and v < 0)}
+            for c in self.load()
+        ]
+        if cookies:
+            await browser_backend.send(page, "Network.setCookies", {"cookies": cookies})
+        return len(cookies)
+
+    async def save(self, page: Page) -> int:
+        """ Stores the Azure cookies of all domains in the browser, not only those of the current url. """
+        cookies = (await browser_backend.send(page, "Network.getAllCookies"))["cookies"]
+        return self.write(cookies)
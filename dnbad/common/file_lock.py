@@ -0,0 +1,63 @@
+import asyncio
+import fcntl
+import os
+import time
+from typing import *
+
+__all__ = ["FileLock", "LockTimeoutError"]
+
+
+class LockTimeoutError(Exception):
+    pass
+
+
+class FileLock:
+    """
+    Exclusive advisory lock on a file, shared between processes.
+    The lock is released by the OS if the holding process dies, so a crashed holder never leaves a stale lock.
+    """
+    POLL_TIME = 0.1
+
+    def __init__(self, path: str, timeout: Optional[float] = None):
+        self.path = path
+        self.timeout = timeout
+        self._fd: Optional[int] = None
+
+    def try_acquire(self) -> bool:
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self._fd = fd
+        return True
+
+    def acquire(self):
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        while not self.try_acquire():
+            if deadline is not None and time.monotonic() > deadline:
+                raise LockTimeoutError(f"Timed out waiting for lock '{self.path}'.")
+            time.sleep(self.POLL_TIME)
+
+    async def acquire_async(self):
+        """ As acquire, without blocking the event loop while waiting. """
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        while not self.try_acquire():
+            if deadline is not None and time.monotonic() > deadline:
+                raise LockTimeoutError(f"Timed out waiting for lock '{self.path}'.")
+            await asyncio.sleep(self.POLL_TIME)
+
+    def release(self):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+        return False
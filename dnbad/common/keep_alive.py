@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import asyncio
+import datetime
+import logging
+import time
+from typing import *
+
+from .azure_auth import AuthConfig, single_auth_page
+from .azure_auth_handler import AzureAuthHandler, on_state
+from .cookie_store import CookieStore
+from .exceptions import AdUtilException
+from .password_manager import PasswordManager
+from .utils import run_sync
+
+if TYPE_CHECKING:
+    from pyppeteer.page import Page
+
+__all__ = ["SessionExpiredException", "KeepAliveAuthHandler", "SessionKeepAlive"]
+
+LOG = logging.getLogger(__name__)
+
+
+class SessionExpiredException(AdUtilException):
+    pass
+
+
+class KeepAliveAuthHandler(AzureAuthHandler):
+    """ Refreshes the session without user interaction. Fails instead of asking for MFA or the password. """
+
+    @on_state(AzureAuthHandler.STATE_PWD)
+    async def _submit_password(self, page: Page):
+        if not self.password_manager.has_password():
+            raise SessionExpiredException("Azure session expired, and no stored password.")
+        await super()._submit_password(page)
+
+    @on_state(AzureAuthHandler.STATE_MFA, AzureAuthHandler.STATE_OTC_CODE)
+    async def _interaction_required(self, page: Page):
+        raise SessionExpiredException("Azure session expired, and MFA is required.")
+
+
+class SessionKeepAlive:
+    """
+    Periodically refreshes the Azure session in the stored cookies, such that later logins need no MFA.
+    The refresh is done with the http probe if given (returning True on success), else in a headless browser, where the
+    session is valid once an element matching `signed_in_selector` (by default the account menu of the portal) is shown.
+    """
+    INTERVAL = 30 * 60
+    URL = "https://myapplications.microsoft.com/"
+    # The account menu in the header of the portal, only shown when signed in. It does not depend on the apps of the
+    # user, and is not an image, which the lean mode blocks.
+    SIGNED_IN_SELECTOR = "#mectrl_main_trigger"
+    TIMEOUT = 60
+
+    def __init__(
+            self,
+            password_manager: PasswordManager,
+            auth_config: Optional[AuthConfig] = None,
+            http_probe: Optional[Callable[[CookieStore], bool]] = None,
+            interval: int = INTERVAL,
+            signed_in_selector: str = SIGNED_IN_SELECTOR
+    ):
+        self.password_manager = password_manager
+        self.auth_config = auth_config or AuthConfig(headless=True, lean=True)
+        self.http_probe = http_probe
+        self.interval = interval
+        self.signed_in_selector = signed_in_selector
+        self.valid_since: Optional[float] = None
+
+    def refresh_sync(self) -> bool:
+        return run_sync(self.refresh())
+
+    async def refresh(self) -> bool:
+        auth_handler = KeepAliveAuthHandler(self.password_manager)
+        try:
+            if self.http_probe and await asyncio.get_running_loop().run_in_executor(
+                    None, self.http_probe, auth_handler.cookie_store
+            ):
+                LOG.debug("Azure session refreshed over HTTP.")
+            else:
+                await asyncio.wait_for(self._refresh_browser(auth_handler), self.TIMEOUT)
+        except Exception as e:
+            self._on_failure(e)
+            return False
+        self._on_success()
+        return True
+
+    async def _refresh_browser(self, auth_handler: AzureAuthHandler):
+        async with single_auth_page(auth_handler, self.auth_config) as auth_page:
+            await auth_page.goto(self.URL)
+            # The page is on the hostname of the URL before any redirect to the login, so only the apps tell.
+            await auth_page.await_after_auth(auth_page.page.waitForSelector(self.signed_in_selector, visible=True))
+        LOG.debug("Azure session refreshed in browser.")
+
+    def _on_success(self):
+        now = time.time()
+        if self.valid_since is None:
+            self.valid_since = now
+        LOG.info(f"Azure session refreshed. Valid for {self._format(now - self.valid_since)}.")
+
+    def _on_failure(self, e: Exception):
+        if self.valid_since is None:
+            LOG.warning(f"Azure session refresh failed: {e}")
+        else:
+            LOG.warning(f"Azure session refresh failed after being valid for "
+                        f"{self._format(time.time() - self.valid_since)}: {e}")
+        self.valid_since = None
+
+    @staticmethod
+    def _format(seconds: float) -> str:
+        return str(datetime.timedelta(seconds=int(seconds)))
+
+    def run_sync(self):
+        run_sync(self.run())
+
+    async def run(self):
+        while True:
+            await self.refresh()
+            await asyncio.sleep(self.interval)
@@ -1,4 +1,7 @@
 import getpass
+from typing import *
+
+from .secret_cache import SecretCache, SecretHelperClient
 
 try:
     import keyring
@@ -12,6 +15,9 @@ except ImportError:
 
 class PasswordManager:
     SERVICE_NAME = "dnb-ad-utils"
+    # Keyring reads are slow, so they are shared by all instances in the process. If DNBAD_SECRET_CACHE_TTL is set,
+    # they are also shared with other processes through a secret helper.
+    _CACHE = SecretCache()
 
     def __init__(self, username: str, use_keyring=True):
         self.username = username
@@ -22,8 +28,32 @@ class PasswordManager:
     def is_keyring_available(cls) -> bool:
         return KEYRING
 
+    def _cache_key(self) -> str:
+        return f"{self.SERVICE_NAME}:{self.username}"
+
+    def _read_keyring(self) -> Optional[str]:
+        return self._CACHE.get_or_load(self._cache_key(), self._read_keyring_uncached)
+
+    def _read_keyring_uncached(self) -> Optional[str]:
+        helper = SecretHelperClient.from_environment()
+        if helper:
+            hit, password = helper.get(self._cache_key())
+            if hit:
+                return password
+        password = keyring.get_password(self.SERVICE_NAME, self.username)
+        if helper:
+            helper.put(self._cache_key(), password)
+        return password
+
+    @classmethod
+    def _invalidate(cls, key: str):
+        cls._CACHE.delete(key)
+        helper = SecretHelperClient.from_environment()
+        if helper:
+            helper.delete(key)
+
     def is_keyring_set(self):
-        return keyring.get_password(self.SERVICE_NAME, self.username) is not None
+        return self._read_keyring() is not None
 
     def ask_for_password(self):
         return getpass.getpass(f"Password for {self.username} (hidden input): ")
@@ -33,13 +63,18 @@ class PasswordManager:
 
     def delete_keyring(self):
         keyring.delete_password(self.SERVICE_NAME, self.username)
+        self._invalidate(self._cache_key())
 
     def fetch_password(self):
         if self.is_keyring_available():
-            self._password = keyring.get_password(self.SERVICE_NAME, self.username) or self.ask_for_password()
+            self._password = self._read_keyring() or self.ask_for_password()
         else:
             self._password = self.ask_for_password()
 
+    def has_password(self) -> bool:
+        """ True if the password is available without asking the user. """
+        return bool(self._password) or (self.is_keyring_available() and self.is_keyring_set())
+
     def get_password(self) -> str:
         if not self._password:
             self.fetch_password()
@@ -47,3 +82,4 @@ class PasswordManager:
 
     def set_keyring(self, password):
         keyring.set_password(self.SERVICE_NAME, self.username, password)
+        self._invalidate(self._cache_key())
@@ -0,0 +1,122 @@
+import asyncio
+import logging
+import os
+import signal
+import statistics
+import subprocess
+from collections import defaultdict
+from typing import *
+
+__all__ = ["process_tree", "process_start_times", "kill_processes", "RssSampler"]
+
+LOG = logging.getLogger(__name__)
+
+
+def _list_processes(columns: str) -> List[str]:
+    """ A line of the columns per process. Uses ps, such that it works on Linux and macOS. """
+    try:
+        return subprocess.run(
+            ["ps", "-A", "-o", columns], capture_output=True, text=True, check=True
+        ).stdout.splitlines()
+    except (OSError, subprocess.CalledProcessError) as e:
+        LOG.debug(f"Could not list processes: {e}")
+        return []
+
+
+def process_tree(pid: int) -> Dict[int, int]:
+    """ The process and its descendants, as pid to RSS in bytes. """
+    children: Dict[int, List[int]] = defaultdict(list)
+    rss: Dict[int, int] = {}
+    for line in _list_processes("pid=,ppid=,rss="):
+        child, parent, kib = (int(x) for x in line.split())
+        children[parent].append(child)
+        rss[child] = kib * 1024
+
+    tree = {}
+    stack = [pid]
+    while stack:
+        p = stack.pop()
+        if p in rss and p not in tree:
+            tree[p] = rss[p]
+            stack.extend(children[p])
+    return tree
+
+
+def process_start_times() -> Dict[int, str]:
+    """
+    The start time of each running process as printed by ps, which tells a process from a later one reusing its pid.
+    Zombies, which have exited but are not reaped by their parent yet, are left out.
+    """
+    start_times = {}
+    for line in _list_processes("pid=,stat=,lstart="):
+        pid, stat, start_time = line.split(maxsplit=2)
+        if not stat.startswith("Z"):
+            start_times[int(pid)] = start_time
+    return start_times
+
+
+def kill_processes(pids: Iterable[int], start_times: Optional[Dict[int, str]] = None) -> int:
+    """
+    Kills the processes which are still running. Returns the number killed.
+    Given the start times of the processes, a pid which has since been reused by another process is not killed.
+    """
+    current_start_times = process_start_times() if start_times is not None else None
+    killed = 0
+    for pid in pids:
+        if current_start_times is not None and current_start_times.get(pid) != start_times.get(pid):
+            continue
+        try:
+            os.kill(pid, signal.SIGKILL)
+            killed += 1
+        except (ProcessLookupError, PermissionError):
+            pass
+    return killed
+
+
+class RssSampler:
+    """
+    Samples the total RSS of a process tree in the background.
+    The steady state is the median of the second half of the samples, after the start-up peak.
+    """
+    INTERVAL = 0.5
+
+    def __init__(self, pid: int, interval: float = INTERVAL):
+        self.pid = pid
+        self.interval = interval
+        self.samples: List[int] = []
+        self.max_processes = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            self.sample(await asyncio.get_running_loop().run_in_executor(None, process_tree, self.pid))
+            await asyncio.sleep(self.interval)
+
+    def sample(self, tree: Dict[int, int]):
+        if tree:
+            self.samples.append(sum(tree.values()))
+            self.max_processes = max(self.max_processes, len(tree))
+
+    @property
+    def peak(self) -> int:
+        return max(self.samples, default=0)
+
+    @property
+    def steady(self) -> int:
+        return int(statistics.median(self.samples[len(self.samples) // 2:])) if self.samples else 0
+
+    def summary(self) -> str:
+        return (f"peak {self.peak / 1024 / 1024:.0f} MiB, steady {self.steady / 1024 / 1024:.0f} MiB, "
+                f"up to {self.max_processes} processes ({len(self.samples)} samples)")
@@ -1,30 +1,154 @@
+from __future__ import annotations
+
 import asyncio
+import logging
+import subprocess
 from typing import *
 
-import pyppeteer
-from pyppeteer.browser import Browser
-from pyppeteer.errors import NetworkError
+from . import browser_backend, trace
+from .browser_broker import BrowserBroker, BrokerEndpoint
+from .process_memory import RssSampler, kill_processes, process_start_times, process_tree
+
+if TYPE_CHECKING:
+    from pyppeteer.browser import Browser, BrowserContext
+    from pyppeteer.page import Page
+
+LOG = logging.getLogger(__name__)
 
 
 class PypBrowser:
-    def __init__(self, headless: bool, dump_io: bool, keep_open: bool = False):
+    # Chromium flags of the low memory mode:
+    LOW_MEMORY_ARGS = (
+        "--renderer-process-limit=1",
+        "--process-per-site",
+        "--disable-features=site-per-process,IsolateOrigins,Translate,MediaRouter",
+        "--disable-site-isolation-trials",
+        "--disable-gpu",
+        "--disable-software-rasterizer",
+        "--disable-extensions",
+        "--disable-component-extensions-with-background-pages",
+        "--disk-cache-size=1048576",
+        "--media-cache-size=1048576",
+        "--js-flags=--max-old-space-size=128",
+    )
+    # Seconds to wait for the browser to exit by itself in the low memory mode, before it is killed.
+    LOW_MEMORY_CLOSE_TIMEOUT = 2
+
+    def __init__(
+            self,
+            headless: bool,
+            dump_io: bool,
+            keep_open: bool = False,
+            use_broker: bool = False,
+            user_data_dir: Optional[str] = None,
+            backend: str = "auto",
+            low_memory: bool = False
+    ):
         self.headless = headless
         self.dump_io = dump_io
         self.keep_open = keep_open
+        self.use_broker = use_broker
+        self.user_data_dir = user_data_dir
+        self.backend = browser_backend.resolve_backend(backend)
+        # A single renderer, no GPU and a small cache. The browser is closed on exit even with keep_open.
+        self.low_memory = low_memory
         self.browser: Optional[Browser] = None
+        # Set when attached to a broker. Pages are then opened in a fresh context, and the browser is left running.
+        self.context: Optional[BrowserContext] = None
+        self._rss: Optional[RssSampler] = None
 
     def ignore_pyppeteer_exception_handler(self, loop, context):
-        if self.browser and isinstance(context["exception"], NetworkError):
+        if self.browser and isinstance(context.get("exception"), browser_backend.ignored_exceptions(self.backend)):
             return
         loop.default_exception_handler(context)
 
+    async def new_page(self) -> Page:
+        if self.context:
+            return await self.context.newPage()
+        return await self.browser.newPage()
+
     async def __aenter__(self):
-        self.browser = await pyppeteer.launch(headless=self.headless, dump_io=self.dump_io, autoClose=False)
+        if self.use_broker:
+            with trace.span("browser.connect_broker"):
+                self.browser = await BrowserBroker.connect(self.headless, self.backend)
+                if self.browser:
+                    self.context = await self.browser.createIncognitoBrowserContext()
+        if self.browser is None:
+            await self._launch()
         asyncio.get_running_loop().set_exception_handler(self.ignore_pyppeteer_exception_handler)
         return self
 
+    async def _launch(self):
+        """
+        Launches a browser of our own, when not attached to a broker. Only this process needs DevTools, so it is
+        reached over a pipe, and not on a port which other local users could attach to and take the session from.
+        """
+        with trace.span("browser.launch", headless=self.headless, backend=self.backend):
+            self.browser = await browser_backend.launch(
+                self.backend, self.headless, self.dump_io, self.user_data_dir,
+                args=self.LOW_MEMORY_ARGS if self.low_memory else (), pipe=True
+            )
+        if self.low_memory and self.browser.process:
+            self._rss = RssSampler(self.browser.process.pid)
+            self._rss.start()
+
     async def __aexit__(self, exc_type, exc_value, traceback):
-        if not self.keep_open:
-            await self.browser.close()
+        if self.context:
+            with trace.span("browser.disconnect_broker"):
+                await self.context.close()
+                await self.browser.disconnect()
+            BrokerEndpoint.touch()
+            self.context = None
+            self.browser = None
+        elif self.low_memory:
+            with trace.span("browser.close", low_memory=True) as s:
+                await self._close_low_memory(s)
+            self.browser = None
+        elif not self.keep_open:
+            with trace.span("browser.close"):
+                await self.browser.close()
             self.browser = None
         return False
+
+    async def _close_low_memory(self, s: trace.Span):
+        """ Closes the browser, and kills the processes of the browser which are left, such that none linger. """
+        process = self.browser.process
+        if process is None:
+            await self.browser.close()
+            return
+        loop = asyncio.get_running_loop()
+        tree = await loop.run_in_executor(None, process_tree, process.pid)
+        # The pids of the descendants may be reused once they exit. Only the same processes are killed after close:
+        start_times = await loop.run_in_executor(None, process_start_times)
+        if self._rss:
+            await self._rss.stop()
+            self._rss.sample(tree)
+        try:
+            await asyncio.wait_for(self.browser.close(), self.LOW_MEMORY_CLOSE_TIMEOUT)
+        except Exception as e:
+            LOG.debug(f"Browser did not close cleanly: {e!r}")
+        await self._reap(process)
+        descendants = [pid for pid in tree if pid != process.pid]
+        killed = await loop.run_in_executor(None, kill_processes, descendants, start_times)
+
+        if self._rss:
+            s.attributes.update(rss_peak=self._rss.peak, rss_steady=self._rss.steady)
+            LOG.info(f"Browser memory: {self._rss.summary()}.")
+            self._rss = None
+        if killed:
+            LOG.info(f"Killed {killed} leftover browser processes.")
+
+    @staticmethod
+    async def _reap(process: Union[asyncio.subprocess.Process, subprocess.Popen]):
+        """ Reaps the browser process, which is the only one that is our child, and kills it first if it is running. """
+        if isinstance(process, subprocess.Popen):
+            if process.poll() is None:
+                process.kill()
+            process.wait()
+        else:
+            if process.returncode is None:
+                try:
+                    process.kill()
+                except ProcessLookupError:
+                    pass
+            await process.wait()
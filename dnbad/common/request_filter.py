@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import *
+from urllib.parse import urlparse
+
+if TYPE_CHECKING:
+    from pyppeteer.network_manager import Request, Response
+    from pyppeteer.page import Page
+
+__all__ = ["RequestFilter"]
+
+LOG = logging.getLogger(__name__)
+
+
+@dataclass
+class RequestFilter:
+    """
+    Skips requests that are not needed to complete the login, when nobody is looking at the page.
+    Stylesheets are kept, since the auth handler depends on them to tell which heading is visible.
+    A request is skipped if its resource type or host is denied, unless its host is allowed.
+    """
+    deny_resource_types: FrozenSet[str] = frozenset({"image", "media", "font", "ping", "texttrack", "manifest"})
+    deny_hosts: Tuple[str, ...] = (
+        "browser.events.data.microsoft.com",
+        "browser.pipe.aria.microsoft.com",
+        "dc.services.visualstudio.com",
+        "js.monitor.azure.com",
+        "aadcdn.msftauthimages.net",
+    )
+    allow_hosts: Tuple[str, ...] = ()
+
+    skipped: Counter = field(default_factory=Counter)
+    loaded_requests: int = 0
+    loaded_bytes: int = 0
+
+    @staticmethod
+    def _host_matches(host: str, hosts: Tuple[str, ...]) -> bool:
+        return any(host == h or host.endswith(f".{h}") for h in hosts)
+
+    def is_allowed(self, resource_type: str, url: str) -> bool:
+        host = urlparse(url).hostname or ""
+        if self._host_matches(host, self.allow_hosts):
+            return True
+        return resource_type not in self.deny_resource_types and not self._host_matches(host, self.deny_hosts)
+
+    async def install(self, page: Page):
+        await page.setRequestInterception(True)
+        page.on("request", self._on_request)
+        page.on("response", self._on_response)
+
+    def _on_request(self, request: Request):
+        if self.is_allowed(request.resourceType, request.url):
+            asyncio.ensure_future(request.continue_())
+        else:
+            self.skipped[request.resourceType] += 1
+            asyncio.ensure_future(request.abort())
+
+    def _on_response(self, response: Response):
+        self.loaded_requests += 1
+        self.loaded_bytes += int(response.headers.get("content-length", 0))
+
+    def summary(self) -> str:
+        skipped = ", ".join(f"{t}: {n}" for t, n in self.skipped.most_common()) or "none"
+        return (f"Skipped {sum(self.skipped.values())} requests ({skipped}). "
+                f"Loaded {self.loaded_requests} requests, {self.loaded_bytes / 1024:.0f} KiB.")
@@ -0,0 +1,203 @@
+"""
+Caches secrets read from the OS keyring, which can take seconds with Secret Service over D-Bus.
+
+SecretCache memoizes in the process. SecretHelper is an optional short-lived process holding the secrets in memory for
+other processes of the user, over a Unix socket only the user can access. It exits when its secrets have expired.
+
+    $ python -m dnbad.common.secret_cache [--ttl <seconds>]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from typing import *
+
+from . import get_data_file_path
+from .utils import is_private_socket, start_private_unix_server
+
+__all__ = ["SecretCache", "SecretHelper", "SecretHelperClient"]
+
+LOG = logging.getLogger(__name__)
+
+
+class SecretCache:
+    """ Secrets per key, kept for ttl seconds. Missing secrets (None) are cached as well. Thread safe. """
+    TTL = 10 * 60
+
+    def __init__(self, ttl: float = TTL):
+        self.ttl = ttl
+        self._entries: Dict[str, Tuple[float, Optional[str]]] = {}
+        self._lock = threading.RLock()
+
+    def get(self, key: str) -> Tuple[bool, Optional[str]]:
+        """ Returns (hit, secret). """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            if entry[0] < time.time():
+                del self._entries[key]
+                return False, None
+            return True, entry[1]
+
+    def put(self, key: str, secret: Optional[str], ttl: Optional[float] = None):
+        with self._lock:
+            self._entries[key] = (time.time() + (self.ttl if ttl is None else ttl), secret)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def get_or_load(self, key: str, loader: Callable[[], Optional[str]]) -> Optional[str]:
+        """ Concurrent misses wait for one load, such that the keyring is read once. """
+        with self._lock:
+            hit, secret = self.get(key)
+            if not hit:
+                secret = loader()
+                self.put(key, secret)
+            return secret
+
+    def purge(self) -> int:
+        """ Drops the expired secrets. Returns the number of secrets left. """
+        with self._lock:
+            now = time.time()
+            self._entries = {k: e for k, e in self._entries.items() if e[0] >= now}
+            return len(self._entries)
+
+
+def _socket_path() -> str:
+    return get_data_file_path("secret_cache.sock")
+
+
+class SecretHelper:
+    """
+    Serves a SecretCache over a Unix socket, with one JSON request and response per line:
+    {"op": "get"|"put"|"delete", "key": str, "secret": str|null}
+    """
+    POLL_TIME = 5
+
+    def __init__(self, ttl: float = SecretCache.TTL, socket_path: Optional[str] = None):
+        self.cache = SecretCache(ttl)
+        self.socket_path = socket_path or _socket_path()
+        self.started = time.time()
+
+    def run_sync(self):
+        asyncio.run(self.run())
+
+    async def run(self):
+        server = await start_private_unix_server(self._handle, self.socket_path)
+        LOG.info(f"Secret helper listening on {self.socket_path}")
+        try:
+            while self.cache.purge() > 0 or time.time() - self.started < self.cache.ttl:
+                await asyncio.sleep(self.POLL_TIME)
+        finally:
+            server.close()
+            await server.wait_closed()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+            LOG.info("Secret helper stopped.")
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                writer.write(json.dumps(self.handle_request(json.loads(line))).encode() + b"\n")
+                await writer.drain()
+        except (ValueError, ConnectionError) as e:
+            LOG.debug(f"Secret helper request failed: {e!r}")
+        finally:
+            writer.close()
+
+    def handle_request(self, request: dict) -> dict:
+        op, key = request.get("op"), request.get("key")
+        if op == "get":
+            hit, secret = self.cache.get(key)
+            return {"hit": hit, "secret": secret}
+        if op == "put":
+            self.cache.put(key, request.get("secret"))
+        elif op == "delete":
+            self.cache.delete(key)
+        else:
+            return {"error": f"Unknown op '{op}'"}
+        return {}
+
+
+class SecretHelperClient:
+    """ Client of the SecretHelper. Every failure is treated as a cache miss, falling back to the keyring. """
+    TIMEOUT = 0.5
+    START_TIMEOUT = 2
+    # Seconds to keep secrets in the helper. The helper is used when set.
+    TTL_ENVIRONMENT_VARIABLE = "DNBAD_SECRET_CACHE_TTL"
+
+    def __init__(self, ttl: float, socket_path: Optional[str] = None):
+        self.ttl = ttl
+        self.socket_path = socket_path or _socket_path()
+
+    @classmethod
+    def from_environment(cls) -> Optional["SecretHelperClient"]:
+        try:
+            ttl = float(os.environ.get(cls.TTL_ENVIRONMENT_VARIABLE, 0))
+        except ValueError:
+            return None
+        return cls(ttl) if ttl > 0 else None
+
+    def _request(self, request: dict) -> Optional[dict]:
+        if not is_private_socket(self.socket_path):
+            return None
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+                s.settimeout(self.TIMEOUT)
+                s.connect(self.socket_path)
+                s.sendall(json.dumps(request).encode() + b"\n")
+                with s.makefile("rb") as f:
+                    return json.loads(f.readline())
+        except (OSError, ValueError) as e:
+            LOG.debug(f"Secret helper not available: {e!r}")
+            return None
+
+    def get(self, key: str) -> Tuple[bool, Optional[str]]:
+        response = self._request({"op": "get", "key": key})
+        if response is None:
+            return False, None
+        return response.get("hit", False), response.get("secret")
+
+    def put(self, key: str, secret: Optional[str]):
+        if self._request({"op": "put", "key": key, "secret": secret}) is None and self.start():
+            self._request({"op": "put", "key": key, "secret": secret})
+
+    def delete(self, key: str):
+        self._request({"op": "delete", "key": key})
+
+    def start(self) -> bool:
+        """ Starts a helper in the background. Returns True when it is listening. """
+        subprocess.Popen(
+            [sys.executable, "-m", __name__, "--ttl", str(self.ttl)],
+            stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            start_new_session=True
+        )
+        deadline = time.time() + self.START_TIMEOUT
+        while time.time() < deadline:
+            if self._request({"op": "get", "key": ""}) is not None:
+                return True
+            time.sleep(0.05)
+        LOG.debug("Secret helper did not start.")
+        return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Holds keyring secrets in memory for other dnbad processes.")
+    parser.add_argument("--ttl", type=float, default=SecretCache.TTL, help="Seconds to keep each secret")
+    args = parser.parse_args()
+    SecretHelper(args.ttl).run_sync()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+import contextvars
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import *
+
+__all__ = ["Span", "span", "record", "add_hook", "remove_hook", "JsonLinesExporter", "SpanCollector", "export"]
+
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str]
+    start: float
+    end: Optional[float] = None
+    attributes: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def duration(self) -> float:
+        return (self.end or time.time()) - self.start
+
+    def to_otlp(self) -> dict:
+        """ The span in the field layout of OTLP JSON spans. """
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id or "",
+            "name": self.name,
+            "startTimeUnixNano": int(self.start * 1e9),
+            "endTimeUnixNano": int(self.end * 1e9),
+            "attributes": [{"key": k, "value": {"stringValue": str(v)}} for k, v in self.attributes.items()]
+        }
+
+
+_CURRENT = contextvars.ContextVar("dnbad_span", default=None)
+_HOOKS: List[Callable[[Span], None]] = []
+
+
+def add_hook(hook: Callable[[Span], None]):
+    """ The hook is called with every span when it ends. """
+    _HOOKS.append(hook)
+
+
+def remove_hook(hook: Callable[[Span], None]):
+    _HOOKS.remove(hook)
+
+
+def _new_span(name: str, start: float, attributes: dict) -> Span:
+    parent = _CURRENT.get()
+    return Span(
+        name=name,
+        trace_id=parent.trace_id if parent else os.urandom(16).hex(),
+        span_id=os.urandom(8).hex(),
+        parent_id=parent.span_id if parent else None,
+        start=start,
+        attributes=attributes
+    )
+
+
+def _end(s: Span):
+    for hook in _HOOKS:
+        hook(s)
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Span]:
+    """ Times the block as a span. Spans opened inside the block, also in tasks created there, become children. """
+    s = _new_span(name, time.time(), attributes)
+    token = _CURRENT.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.attributes["error"] = type(e).__name__
+        raise
+    finally:
+        _CURRENT.reset(token)
+        s.end = time.time()
+        _end(s)
+
+
+def record(name: str, start: float, end: float, **attributes):
+    """ Records a span that has already ended. """
+    s = _new_span(name, start, attributes)
+    s.end = end
+    _end(s)
+
+
+class JsonLinesExporter:
+    """ Writes each span as a line of OTLP style JSON. """
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+
+    def __call__(self, s: Span):
+        with open(self.file_path, "a") as f:
+            f.write(json.dumps(s.to_otlp()) + "\n")
+
+
+class SpanCollector:
+    def __init__(self):
+        self.spans: List[Span] = []
+
+    def __call__(self, s: Span):
+        self.spans.append(s)
+
+    def summary(self) -> str:
+        """ A table of the time spent per phase, in the order the phases started. """
+        phases: Dict[str, List[Span]] = defaultdict(list)
+        for s in sorted(self.spans, key=lambda x: x.start):
+            phases[s.name].append(s)
+        width = max([len("Phase")] + [len(name) for name in phases])
+        lines = [f"{'Phase':<{width}}  {'Count':>5}  {'Total (s)':>9}"]
+        for name, spans in phases.items():
+            lines.append(f"{name:<{width}}  {len(spans):>5}  {sum(s.duration for s in spans):>9.3f}")
+        return "\n".join(lines)
+
+
+@contextmanager
+def export(file_path: str, name: str, summary_file: TextIO = sys.stdout):
+    """ Writes the spans within a root span of the name to the file, and prints a summary of them at the end. """
+    exporter = JsonLinesExporter(file_path)
+    collector = SpanCollector()
+    add_hook(exporter)
+    add_hook(collector)
+    try:
+        with span(name):
+            yield
+    finally:
+        remove_hook(exporter)
+        remove_hook(collector)
+        print(f"\nTiming summary (spans written to {file_path}):\n{collector.summary()}", file=summary_file)
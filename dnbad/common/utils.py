@@ -1,8 +1,16 @@
+import asyncio
+import concurrent.futures
+import contextvars
 import itertools
+import os
 import socket
+import tempfile
 from typing import *
 
-__all__ = ["show_line_diff", "show_file", "format_list", "check_host"]
+__all__ = ["show_line_diff", "show_file", "format_list", "check_host", "atomic_write", "run_sync",
+           "start_private_unix_server", "is_private_socket"]
+
+T = TypeVar("T")
 
 _MIN_HEADER_OLD = "--OLD--"
 _MIN_HEADER_NEW = "--NEW--"
@@ -57,3 +65,50 @@ def check_host(hostname: str, port: int):
         return False
     finally:
         s.close()
+
+
+def atomic_write(file_path: str, data: str, mode: int = 0o600):
+    """ Writes to a temporary file which replaces the file, such that readers never see a partial file. """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(file_path), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(data)
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def run_sync(coroutine: Coroutine[Any, Any, T]) -> T:
+    """
+    Runs the coroutine on a new event loop, for the sync API.
+    Inside a running event loop (e.g. Jupyter), the new loop runs in another thread, since the running one cannot block.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+    context = contextvars.copy_context()
+    with concurrent.futures.ThreadPoolExecutor(1) as executor:
+        return executor.submit(context.run, asyncio.run, coroutine).result()
+
+
+async def start_private_unix_server(handler: Callable, path: str) -> asyncio.AbstractServer:
+    """ Listens on a Unix socket which only the user can access. A stale socket file is replaced. """
+    if os.path.exists(path):
+        os.remove(path)
+    umask = os.umask(0o077)
+    try:
+        return await asyncio.start_unix_server(handler, path=path)
+    finally:
+        os.umask(umask)
+
+
+def is_private_socket(path: str) -> bool:
+    """ True if the socket is owned by the user, and not accessible by others. """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return False
+    return stat.st_uid == os.getuid() and stat.st_mode & 0o077 == 0
@@ -13,8 +13,11 @@ GPROXY_PORT = "443"
 GPROXY_FINGERPRINT = "SHA256:PSGDmbx+ZSyXXZh2PM83FjAaVs1riuG3hyYhwsbh55A"
 
 TIMEOUT_CHECK_CONNECTION = 2
+# SSH still running after this many seconds is negotiating a new connection, and the browser of the login is started.
+SSH_NEGOTIATION_DELAY = 0.1
 PERSIST_POLL_TIME = 10
 PERSIST_RETRY_TIME = 30
+PERSIST_KEEP_ALIVE_TIME = 30 * 60
 
 
 @dataclasses.dataclass
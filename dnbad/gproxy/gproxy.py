@@ -1,14 +1,20 @@
 import asyncio
+import functools
 import logging
 import re
 import subprocess
+import time
+from typing import *
 
 import pexpect
 from sshconf import read_ssh_config
 
+from dnbad.agent.client import AgentClient
+from dnbad.common import trace
 from dnbad.common.azure_auth import AuthConfig
 from dnbad.common.local_config import LocalConfig
 from dnbad.common.password_manager import PasswordManager
+from dnbad.common.utils import run_sync
 from .constants import *
 from .gproxy_ad_login import GProxyAdLogin
 
@@ -50,20 +56,67 @@ class GProxy:
         return options + [self._host()]
 
     def connect(self, password_manager: PasswordManager, azure_ad_config: AuthConfig):
+        run_sync(self.connect_async(password_manager, azure_ad_config))
+
+    async def connect_async(self, password_manager: PasswordManager, azure_ad_config: AuthConfig):
         args = self._connect_args()
         LOG.debug(f"SSH connection args: {args}")
-        p: pexpect.spawn = pexpect.spawn("ssh", args, encoding="utf-8")
-        self._wait_connect(p, password_manager, azure_ad_config)
+        with trace.span("gproxy.connect"):
+            p: pexpect.spawn = pexpect.spawn("ssh", args, encoding="utf-8")
+            gproxy_login = GProxyAdLogin(
+                code=None, password_manager=password_manager, config=azure_ad_config, agent=self._agent(azure_ad_config)
+            )
+            login_tasks: List[asyncio.Future] = []
+
+            def start_login() -> asyncio.Future:
+                if not login_tasks:
+                    login_tasks.append(asyncio.ensure_future(gproxy_login.login()))
+                return login_tasks[0]
+
+            try:
+                # The browser launch and the navigation to the login page do not need the device code. They run while
+                # SSH negotiates, and the code is submitted as soon as SSH prints it. SSH reusing the control socket,
+                # or failing at once, exits before the browser is started. In low memory mode (e.g. persist, which
+                # retries all day), the browser is only started for a prompt of SSH.
+                if not azure_ad_config.low_memory and await self._ssh_negotiates(p):
+                    start_login()
+                await self._wait_connect(p, gproxy_login, start_login)
+            finally:
+                for login_task in login_tasks:
+                    if not login_task.done():
+                        login_task.cancel()
+                        await asyncio.gather(login_task, return_exceptions=True)
 
-    def _wait_connect(self, p: pexpect.spawn, password_manager: PasswordManager, azure_ad_config: AuthConfig):
-        i = p.expect([
-            pexpect.EOF,
-            re.compile(r"continue connecting \(yes/no(/\[fingerprint])?\)\? "),
-            re.compile(r"authenticate\.")
-        ])
+    @staticmethod
+    def _agent(azure_ad_config: AuthConfig) -> Optional[AgentClient]:
+        if not azure_ad_config.use_agent:
+            return None
+        agent = AgentClient()
+        return agent if agent.available() else None
+
+    @staticmethod
+    async def _in_executor(func: Callable, *args, **kwargs):
+        """ Runs a blocking call (pexpect, ssh) in the default executor, such that the event loop is not blocked. """
+        return await asyncio.get_running_loop().run_in_executor(None, functools.partial(func, *args, **kwargs))
+
+    @staticmethod
+    async def _ssh_negotiates(p: pexpect.spawn) -> bool:
+        """ Whether SSH is still running after SSH_NEGOTIATION_DELAY, leaving its output to _wait_connect. """
+        await asyncio.sleep(SSH_NEGOTIATION_DELAY)
+        return p.isalive()
+
+    async def _wait_connect(
+            self, p: pexpect.spawn, gproxy_login: GProxyAdLogin, start_login: Callable[[], asyncio.Future]
+    ):
+        with trace.span("gproxy.ssh_prompt"):
+            i = await self._in_executor(p.expect, [
+                pexpect.EOF,
+                re.compile(r"continue connecting \(yes/no(/\[fingerprint])?\)\? "),
+                re.compile(r"authenticate\.")
+            ])
 
         if i == 0:
-            if self.is_connected():
+            if await self._in_executor(self.is_connected):
                 return
             else:
                 raise GProxyError(f"Error when initializing SSH: {p.before}")
@@ -76,7 +129,9 @@ class GProxy:
                 )
             LOG.info("Confirming host! Fingerprint is matching expected.")
             p.send("yes\r")
-            self._wait_connect(p, password_manager, azure_ad_config)
+            # SSH has reached the proxy, and the device code follows:
+            start_login()
+            await self._wait_connect(p, gproxy_login, start_login)
             return
 
         p.send("\r")
@@ -87,13 +142,23 @@ class GProxy:
         if url != GProxyAdLogin.URL:
             raise GProxyError(f"Url does not match expected login-url. !={GProxyAdLogin.URL}")
 
-        gproxy_login = GProxyAdLogin(
-            code=code,
-            password_manager=password_manager,
-            config=azure_ad_config
-        )
-        asyncio.get_event_loop().run_until_complete(gproxy_login.login())
-        p.expect(pexpect.EOF, timeout=30)
+        code_at = time.time()
+        gproxy_login.set_code(code)
+        login_task = start_login()
+        with trace.span("gproxy.ad_login") as s:
+            await login_task
+            s.attributes["overlap"] = self._report_overlap(gproxy_login, code_at)
+        with trace.span("gproxy.ssh_established"):
+            await self._in_executor(p.expect, pexpect.EOF, timeout=30)
+
+    @staticmethod
+    def _report_overlap(gproxy_login: GProxyAdLogin, code_at: float) -> float:
+        """ Logs the browser start-up time that ran while waiting for SSH, which a sequential connect would spend. """
+        started_at = gproxy_login.started_at
+        ready_at = gproxy_login.page_ready_at or code_at
+        overlap = max(0.0, min(ready_at, code_at) - started_at)
+        LOG.info(f"Browser start overlapped with the SSH handshake, saving {overlap:.2f}s.")
+        return overlap
 
     @staticmethod
     def _extract_code(s):
@@ -1,11 +1,18 @@
+from __future__ import annotations
+
 import asyncio
 import logging
+import time
+from typing import *
 
-from pyppeteer.page import Page
-
+from dnbad.agent.client import AgentClient
 from dnbad.common.azure_auth import *
-from dnbad.common.azure_auth_handler import AzureAuthHandler, AuthState
+from dnbad.common.azure_auth_handler import AzureAuthHandler, AuthState, on_state
 from dnbad.common.password_manager import PasswordManager
+from dnbad.common.utils import run_sync
+
+if TYPE_CHECKING:
+    from pyppeteer.page import Page
 
 LOG = logging.getLogger(__name__)
 
@@ -13,17 +20,43 @@ LOG = logging.getLogger(__name__)
 class GProxyAdLogin:
     URL = "https://microsoft.com/devicelogin"
 
-    def __init__(self, code: str, password_manager: PasswordManager, config: AuthConfig):
+    def __init__(
+            self,
+            code: Optional[str],
+            password_manager: PasswordManager,
+            config: AuthConfig,
+            agent: Optional[AgentClient] = None
+    ):
+        """
+        The code may be given later with set_code, such that the browser can start before the code is known.
+        With an agent, the code is completed in the browser of the dnbad agent instead.
+        """
         self.auth_handler = GProxyAzureAuthHandler(code, password_manager)
         self.config = config
+        self.agent = agent
+        # When the login started, and when the login page was loaded:
+        self.started_at: Optional[float] = None
+        self.page_ready_at: Optional[float] = None
+
+    def set_code(self, code: str):
+        self.auth_handler.set_code(code)
 
     def login_sync(self) -> bool:
-        return asyncio.get_event_loop().run_until_complete(self.login())
+        return run_sync(self.login())
 
     async def login(self):
+        self.started_at = time.time()
+        if self.agent:
+            # The browser of the agent is warm, and the page is loaded when the code is sent:
+            self.page_ready_at = self.started_at
+            code = await self.auth_handler._wait_for_code()
+            LOG.info("Completing the GProxy code in the dnbad agent.")
+            await self.agent.device_code_async(code)
+            return
         async with single_auth_page(self.auth_handler, self.config) as auth_page:
             LOG.info(f"Navigating to: {self.URL}")
-            await auth_page.page.goto(self.URL)
+            await auth_page.goto(self.URL)
+            self.page_ready_at = time.time()
             await auth_page.await_auth()
 
 
@@ -33,18 +66,34 @@ class GProxyAzureAuthHandler(AzureAuthHandler):
     STATE_GPROXY = AuthState("GitProxy")
     END_STATES = (STATE_GPROXY,)
 
-    def __init__(self, code, password_manager: PasswordManager):
+    def __init__(self, code: Optional[str], password_manager: PasswordManager):
         super().__init__(password_manager)
         self.code = code
         self.code_submitted = False
+        self._code_set: Optional[asyncio.Event] = None
+
+    def set_code(self, code: str):
+        self.code = code
+        if self._code_set:
+            self._code_set.set()
+
+    async def _wait_for_code(self) -> str:
+        if self.code is None:
+            LOG.info("Waiting for the GProxy code from SSH.")
+            self._code_set = asyncio.Event()
+            await self._code_set.wait()
+        return self.code
 
-    async def _on_state_changed(self, page: Page, s: AuthState):
+    @on_state(AzureAuthHandler.STATE_OTC_CODE)
+    async def _submit_gproxy_code(self, page: Page):
         """ The first OTC is the GProxy code """
-        if s == self.STATE_OTC_CODE and not self.code_submitted:
-            await self._submit_value(page, "input[name=otc]", self.code)
+        if self.code_submitted:
+            await self._submit_otc(page)
+        else:
+            await self._submit_value(page, "input[name=otc]", await self._wait_for_code())
             self.code_submitted = True
             LOG.info("GProxy code submitted")
-        elif s == self.STATE_TRYING_TO_SIGN_GIT_PROXY:
-            await page.keyboard.press("Enter")
-        else:
-            await super()._on_state_changed(page, s)
+
+    @on_state(AzureAuthHandler.STATE_TRYING_TO_SIGN_GIT_PROXY)
+    async def _confirm_gproxy(self, page: Page):
+        await page.keyboard.press("Enter")
@@ -19,20 +19,24 @@ setup(
     include_package_data=True,
     install_requires=[
         "boto3==1.24.*",
-        "pyppeteer==1.0.2",
         "python-dateutil",
         "awscli",
         "pexpect",
         "setuptools",
-        "sshconf"
+        "sshconf",
+        "websockets>=10.0"
     ],
     extras_require={
-        'keyring': ['keyring']
+        'keyring': ['keyring'],
+        'pyppeteer': ['pyppeteer==1.0.2'],
+        'saml-cache': ['cryptography', 'keyring']
     },
     entry_points={
         "console_scripts": [
-            "awsad = dnbad.cli_awsad:main",
-            "gproxy = dnbad.cli_gproxy:main"
+            "awsad = dnbad.awsad.credential_process:awsad_main",
+            "gproxy = dnbad.cli_gproxy:main",
+            "dnbad-broker = dnbad.cli_broker:main",
+            "dnbad-agent = dnbad.cli_agent:main"
         ],
     },
     python_requires='>=3.7'
@@ -0,0 +1,63 @@
+import asyncio
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from dnbad.agent.agent import DnbadAgent
+from dnbad.agent.client import AgentClient, AgentError
+from dnbad.common.password_manager import PasswordManager
+
+
+class TestDnbadAgent(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.agent = DnbadAgent(
+            socket_path=os.path.join(self.dir.name, "agent.sock"),
+            password_manager=PasswordManager("user")
+        )
+        self.agent.POLL_TIME = 0.05
+        self.thread = threading.Thread(target=self.agent.run_sync, daemon=True)
+        self.thread.start()
+        self.client = AgentClient(self.agent.socket_path)
+        for _ in range(100):
+            if os.path.exists(self.agent.socket_path):
+                break
+            time.sleep(0.01)
+
+    def tearDown(self):
+        self.client.stop()
+        self.thread.join(2)
+        self.assertFalse(os.path.exists(self.agent.socket_path))
+        self.dir.cleanup()
+
+    def test_concurrent_requests_are_coalesced(self):
+        logins = []
+
+        async def saml(tenant_id: str, app_id: str) -> str:
+            logins.append((tenant_id, app_id))
+            await asyncio.sleep(0.1)
+            return f"saml-{app_id}"
+
+        async def requests():
+            return await asyncio.gather(
+                self.client.saml_async("tenant", "app"),
+                self.client.saml_async("tenant", "app"),
+                self.client.saml_async("tenant", "other")
+            )
+
+        with mock.patch.object(self.agent, "saml", saml):
+            self.assertTrue(self.client.available())
+            self.assertEqual(["saml-app", "saml-app", "saml-other"], asyncio.run(requests()))
+        self.assertEqual([("tenant", "app"), ("tenant", "other")], sorted(logins))
+        self.assertEqual(0, self.client.status()["in_flight"])
+
+    def test_errors_are_returned_to_the_client(self):
+        async def device_code(code: str):
+            raise RuntimeError(f"bad code {code}")
+
+        with mock.patch.object(self.agent, "device_code", device_code):
+            with self.assertRaisesRegex(AgentError, "bad code ABC"):
+                asyncio.run(self.client.device_code_async("ABC"))
@@ -0,0 +1,50 @@
+import multiprocessing
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from awscli.customizations.configure.writer import ConfigFileWriter
+
+from dnbad.awsad.aws_config import AwsConfig
+
+
+def save_profiles(worker: int, count: int):
+    update_config = ConfigFileWriter.update_config
+
+    def slow_update_config(self, *args, **kwargs):
+        # Widens the window between reading and replacing the file:
+        update_config(self, *args, **kwargs)
+        time.sleep(0.05)
+
+    ConfigFileWriter.update_config = slow_update_config
+    for i in range(count):
+        # noinspection PyTypeChecker
+        AwsConfig(
+            profile=f"profile-{worker}-{i}", azure_tenant_id="tenant", azure_app_id="app", azure_app_title="App",
+            aws_default_role_arn=None, aws_session_duration=None, aws_access_key_id=f"key-{worker}-{i}",
+            aws_secret_access_key="secret", aws_session_token="token", aws_expiration_time=None
+        ).save()
+
+
+class TestAwsConfig(unittest.TestCase):
+    def test_concurrent_saves_keep_all_profiles(self):
+        # E.g. logins of other profiles, while the refresh daemon saves credentials:
+        workers, count = 4, 3
+        with tempfile.TemporaryDirectory() as d, mock.patch.dict(os.environ, {
+            "AWS_CONFIG_FILE": os.path.join(d, "aws", "config"),
+            "AWS_SHARED_CREDENTIALS_FILE": os.path.join(d, "aws", "credentials"),
+        }):
+            os.makedirs(os.path.join(d, "aws"))
+            context = multiprocessing.get_context("fork")
+            processes = [context.Process(target=save_profiles, args=(w, count)) for w in range(workers)]
+            for p in processes:
+                p.start()
+            for p in processes:
+                p.join(30)
+                self.assertEqual(0, p.exitcode)
+
+            for w in range(workers):
+                for i in range(count):
+                    self.assertEqual(f"key-{w}-{i}", AwsConfig.load(f"profile-{w}-{i}").aws_access_key_id)
@@ -0,0 +1,93 @@
+import asyncio
+import os
+import subprocess
+import threading
+import time
+import unittest
+from unittest import mock
+
+import pytest
+
+from dnbad.awsad.aws_config import AwsConfig, MissingAwsConfigException
+from dnbad.awsad.awsad import AwsAd
+from dnbad.awsad.saml_http import HttpSamlLogin
+from dnbad.common import get_data_file_path
+from dnbad.common.file_lock import FileLock
+
+
+@pytest.mark.usefixtures("fake_env")
+class TestAwsAd(unittest.TestCase):
+    def test_login_many_gets_one_saml_response_per_app(self):
+        self.env.add_profile("sibling", "fake-app-prod", self.env.APPS["fake-app-prod"][1][1])
+        profiles = AwsConfig.configured_profiles()
+        self.assertEqual(["fake-app-dev", "fake-app-prod", "sibling"], profiles)
+
+        with mock.patch.object(HttpSamlLogin, "login", autospec=True, side_effect=HttpSamlLogin.login) as m:
+            results = AwsAd.login_many(profiles + ["missing"])
+        self.assertEqual(2, m.call_count)
+
+        self.assertEqual(["Developer", "ReadOnly", "Admin"], [r.role.role_name() for r in results[:3]])
+        self.assertIsInstance(results[3].error, MissingAwsConfigException)
+        for profile in profiles:
+            self.assertTrue(AwsAd(profile).has_valid_credentials())
+        self.assertEqual(6, self.env.sts_calls.count("AssumeRoleWithSAML"))
+
+    def test_concurrent_logins_to_a_profile_log_in_once(self):
+        async def login_all():
+            await asyncio.gather(*(AwsAd("fake-app-dev").login_if_invalid_credentials_async() for _ in range(8)))
+
+        asyncio.run(login_all())
+        self.assertTrue(AwsAd("fake-app-dev").has_valid_credentials())
+        self.assertEqual(["AssumeRoleWithSAML", "GetRole", "AssumeRoleWithSAML"], self.env.sts_calls)
+
+    def test_processes_log_in_to_a_profile_once(self):
+        go = os.path.join(self.env.data_dir, "go")
+        code = (
+            "import os, time\n"
+            "from dnbad.awsad.awsad import AwsAd\n"
+            f"while not os.path.exists({go!r}):\n"
+            "    time.sleep(0.01)\n"
+            "print(AwsAd('fake-app-dev').login_if_invalid_credentials().credentials()['AccessKeyId'])\n"
+        )
+        processes = [self.env.popen_attached(code, stdout=subprocess.PIPE, text=True) for _ in range(4)]
+        open(go, "w").close()
+        access_keys = set()
+        for process in processes:
+            stdout, _ = process.communicate(timeout=60)
+            self.assertEqual(0, process.returncode)
+            access_keys.add(stdout.strip().splitlines()[-1])
+        self.assertEqual({AwsConfig.load("fake-app-dev").aws_access_key_id}, access_keys)
+        self.assertEqual(["AssumeRoleWithSAML", "GetRole", "AssumeRoleWithSAML"], self.env.sts_calls)
+
+    def test_login_many_uses_a_login_in_progress(self):
+        lock = FileLock(get_data_file_path("login_fake-app-dev.lock"))
+        lock.acquire()
+
+        def other_login():
+            time.sleep(0.5)
+            AwsAd("fake-app-dev").login()
+            lock.release()
+
+        thread = threading.Thread(target=other_login)
+        thread.start()
+        results = AwsAd.login_many(["fake-app-dev", "fake-app-prod"])
+        thread.join()
+        self.assertEqual([None, None], [result.error for result in results])
+        self.assertEqual(AwsConfig.load("fake-app-dev").aws_access_key_id, results[0].credentials["AccessKeyId"])
+        # The other login, and the login to the prod profile:
+        self.assertEqual(4, self.env.sts_calls.count("AssumeRoleWithSAML"))
+
+    def test_login_many_replaces_a_rejected_cached_saml_response(self):
+        self.env.add_profile("sibling", "fake-app-prod", self.env.APPS["fake-app-prod"][1][1])
+        profiles = AwsConfig.configured_profiles()
+        AwsAd.login_many(profiles)
+        self.env.aws_handler.revoked.add(AwsAd._SAML_CACHE.get(self.env.TENANT_ID, "fake-app-prod"))
+        self.env.reset_profiles()
+
+        with mock.patch.object(HttpSamlLogin, "login", autospec=True, side_effect=HttpSamlLogin.login) as m:
+            results = AwsAd.login_many(profiles)
+        # One new response for both profiles of the prod app, and the cached response of the dev app:
+        self.assertEqual(1, m.call_count)
+        self.assertEqual([None, None, None], [result.error for result in results])
+        for profile in profiles:
+            self.assertTrue(AwsAd(profile).has_valid_credentials())
@@ -0,0 +1,18 @@
+import unittest
+from unittest import mock
+
+from dnbad.cli_awsad import AwsAdCli
+
+
+class TestAwsAdCli(unittest.TestCase):
+    def _served_profiles(self, *argv: str) -> list:
+        cli = AwsAdCli()
+        with mock.patch("dnbad.cli_awsad.serve", return_value=True) as serve:
+            cli._handle_cmd("serve", cli.parser.parse_args(["serve", *argv]))
+        return serve.call_args.args[0]
+
+    def test_serve_default_profile(self):
+        self.assertEqual([None], self._served_profiles("-p", "default"))
+        self.assertEqual([None], self._served_profiles())
+        self.assertEqual([None, "dev"], self._served_profiles("--profiles", "default,dev"))
+        self.assertEqual(["dev"], self._served_profiles("-p", "dev"))
@@ -0,0 +1,102 @@
+import datetime
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+
+import pytest
+
+from dnbad.awsad import credential_process
+from dnbad.awsad.aws_config import AwsConfig
+from dnbad.awsad.credential_process import CredentialCache
+
+# Serves a cache hit, and prints the heavy modules which were imported to stderr.
+SERVE_CACHE_HIT = """
+import sys
+sys.argv = ["awsad", "credentials", "-p", "dev"]
+from dnbad.awsad.credential_process import awsad_main
+code = awsad_main()
+print(sorted(m for m in ("boto3", "botocore", "awscli", "pyppeteer", "websockets", "asyncio") if m in sys.modules),
+      file=sys.stderr)
+sys.exit(code)
+"""
+
+
+def credentials(expires_in: float) -> dict:
+    expiration = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=expires_in)
+    return {"AccessKeyId": "ASIA", "SecretAccessKey": "secret", "SessionToken": "token",
+            "Expiration": expiration.isoformat()}
+
+
+class TestCredentialProcess(unittest.TestCase):
+    def test_is_fresh_with_margin(self):
+        self.assertTrue(CredentialCache.is_fresh(credentials(3600), margin=1200))
+        self.assertFalse(CredentialCache.is_fresh(credentials(600), margin=1200))
+        self.assertFalse(CredentialCache.is_fresh(None, margin=0))
+        self.assertFalse(CredentialCache.is_fresh({"Expiration": "never"}, margin=0))
+
+    def test_margin_is_clamped_to_the_lifetime(self):
+        with tempfile.TemporaryDirectory() as d:
+            cache = CredentialCache("dev")
+            cache.path = os.path.join(d, "credentials_dev.json")
+            with open(cache.path, "w") as f:
+                json.dump(credentials(900), f)
+            lifetime = cache.lifetime(credentials(900))
+        self.assertAlmostEqual(900, lifetime, delta=5)
+        self.assertEqual(lifetime / 2, credential_process.clamp_refresh_margin(1200, lifetime))
+        self.assertEqual(1200, credential_process.clamp_refresh_margin(1200, None))
+
+    def test_cache_hit_only_imports_the_standard_library(self):
+        with tempfile.TemporaryDirectory() as home:
+            os.mkdir(os.path.join(home, ".dnb-ad-utils"))
+            with open(os.path.join(home, ".dnb-ad-utils", "credentials_dev.json"), "w") as f:
+                json.dump({"Version": 1, **credentials(3600)}, f)
+            p = subprocess.run([sys.executable, "-c", SERVE_CACHE_HIT], capture_output=True, text=True,
+                               env={**os.environ, "HOME": home})
+        self.assertEqual(0, p.returncode, p.stderr)
+        self.assertEqual("ASIA", json.loads(p.stdout)["AccessKeyId"])
+        self.assertEqual(1, json.loads(p.stdout)["Version"])
+        self.assertEqual("[]", p.stderr.strip())
+
+    def test_trace(self):
+        with tempfile.TemporaryDirectory() as home:
+            os.mkdir(os.path.join(home, ".dnb-ad-utils"))
+            with open(os.path.join(home, ".dnb-ad-utils", "credentials_dev.json"), "w") as f:
+                json.dump({"Version": 1, **credentials(3600)}, f)
+            trace_path = os.path.join(home, "trace.jsonl")
+            p = subprocess.run(
+                [sys.executable, "-c", "from dnbad.awsad.credential_process import awsad_main; exit(awsad_main())",
+                 "credentials", "-p", "dev", "--trace", trace_path],
+                capture_output=True, text=True, env={**os.environ, "HOME": home}
+            )
+            self.assertEqual(0, p.returncode, p.stderr)
+            # The summary must not be mixed with the credentials, which the AWS CLI reads from stdout:
+            self.assertEqual("ASIA", json.loads(p.stdout)["AccessKeyId"])
+            self.assertIn("Timing summary", p.stderr)
+            with open(trace_path) as f:
+                self.assertEqual(["awsad.credentials"], [json.loads(line)["name"] for line in f])
+
+
+@pytest.mark.usefixtures("fake_env")
+class TestCredentialProcessLogin(unittest.TestCase):
+    def test_serve_logs_in_once(self):
+        outputs = []
+        for _ in range(2):
+            with redirect_stdout(io.StringIO()) as stdout:
+                self.assertEqual(0, credential_process.serve("fake-app-dev"))
+            outputs.append(json.loads(stdout.getvalue()))
+        self.assertEqual(outputs[0], outputs[1])
+        self.assertEqual(1, outputs[0]["Version"])
+        self.assertEqual(AwsConfig.load("fake-app-dev").aws_access_key_id, outputs[0]["AccessKeyId"])
+        self.assertEqual(2, self.env.sts_calls.count("AssumeRoleWithSAML"))
+
+    def test_serve_uses_credentials_of_short_sessions(self):
+        credential_process.CredentialCache("fake-app-dev").save(credentials(900))
+        with redirect_stdout(io.StringIO()) as stdout:
+            self.assertEqual(0, credential_process.serve("fake-app-dev"))
+        self.assertEqual("ASIA", json.loads(stdout.getvalue())["AccessKeyId"])
+        self.assertEqual([], self.env.sts_calls)
@@ -0,0 +1,74 @@
+import threading
+import time
+import unittest
+import urllib.error
+import urllib.request
+from unittest import mock
+
+import pytest
+from botocore.credentials import ContainerProvider
+
+from dnbad.awsad.aws_config import AwsConfig
+from dnbad.awsad.awsad import AwsAd
+from dnbad.awsad.credential_server import CredentialServer
+
+
+@pytest.mark.usefixtures("fake_env")
+class TestCredentialServer(unittest.TestCase):
+    def test_serves_the_container_provider(self):
+        server = CredentialServer(["fake-app-dev"])
+        started = threading.Event()
+        thread = threading.Thread(target=server.run_sync, args=(started.set,), daemon=True)
+        thread.start()
+        self.assertTrue(started.wait(10))
+        try:
+            provider = ContainerProvider(environ={
+                "AWS_CONTAINER_CREDENTIALS_FULL_URI": server.url("fake-app-dev"),
+                "AWS_CONTAINER_AUTHORIZATION_TOKEN": server.token
+            })
+            credentials = provider.load().get_frozen_credentials()
+            self.assertEqual(AwsConfig.load("fake-app-dev").aws_access_key_id, credentials.access_key)
+            self.assertEqual("token", credentials.token)
+
+            with self.assertRaises(urllib.error.HTTPError) as e:
+                urllib.request.urlopen(urllib.request.Request(
+                    server.url("fake-app-dev"), headers={"Authorization": "wrong"}
+                ))
+            self.assertEqual(401, e.exception.code)
+        finally:
+            server.stop()
+            thread.join(5)
+        # The refresh at start and the first request share one login:
+        self.assertEqual(["AssumeRoleWithSAML", "GetRole", "AssumeRoleWithSAML"], self.env.sts_calls)
+
+    def test_requests_wait_for_the_retry_time_after_a_failure(self):
+        server = CredentialServer(["fake-app-dev"])
+        started = threading.Event()
+        with mock.patch.object(AwsAd, "login_many_async", side_effect=Exception("No network")) as login:
+            thread = threading.Thread(target=server.run_sync, args=(started.set,), daemon=True)
+            thread.start()
+            self.assertTrue(started.wait(10))
+            try:
+                for _ in range(3):
+                    with self.assertRaises(urllib.error.HTTPError) as e:
+                        urllib.request.urlopen(urllib.request.Request(
+                            server.url("fake-app-dev"), headers={"Authorization": server.token}
+                        ))
+                    self.assertEqual(503, e.exception.code)
+            finally:
+                server.stop()
+                thread.join(5)
+        # Only the refresh at start logged in:
+        self.assertEqual(1, login.call_count)
+
+    @pytest.mark.fake_env(session_duration=900)
+    def test_short_sessions_are_not_refreshed_at_once(self):
+        server = CredentialServer(["fake-app-dev"])
+        started = threading.Event()
+        thread = threading.Thread(target=server.run_sync, args=(started.set,), daemon=True)
+        thread.start()
+        self.assertTrue(started.wait(10))
+        time.sleep(3)
+        server.stop()
+        thread.join(5)
+        self.assertEqual(["AssumeRoleWithSAML"], self.env.sts_calls)
@@ -0,0 +1,45 @@
+import asyncio
+import datetime
+import unittest
+from unittest import mock
+
+import pytest
+from dateutil import tz
+
+from dnbad.awsad.aws_config import AwsConfig
+from dnbad.awsad.awsad import AwsAd
+from dnbad.awsad.refresh_daemon import RefreshDaemon
+
+
+@pytest.mark.usefixtures("fake_env")
+class TestRefreshDaemon(unittest.TestCase):
+    def test_batches_profiles_of_an_app(self):
+        self.env.add_profile("sibling", "fake-app-prod", self.env.APPS["fake-app-prod"][1][1])
+        profiles = AwsConfig.configured_profiles()
+        AwsAd.login_many(profiles)
+        self.env.expire_in("sibling", 60)
+        self.env.expire_in("fake-app-prod", RefreshDaemon.REFRESH_MARGIN + 5 * 60)
+        self.env.expire_in("fake-app-dev", RefreshDaemon.REFRESH_MARGIN + 5 * 60)
+
+        daemon = RefreshDaemon(profiles)
+        daemon.schedule_all()
+        self.assertEqual("sibling", daemon.next_refresh()[1])
+        with mock.patch.object(AwsAd, "login_many_async", side_effect=AwsAd.login_many_async) as m:
+            results = asyncio.run(daemon.refresh_due())
+        # The prod profile shares the app of the due profile, the dev profile does not:
+        m.assert_called_once_with(["sibling", "fake-app-prod"], daemon.auth_config)
+        self.assertTrue(all(result.error is None for result in results))
+        self.assertEqual("fake-app-dev", daemon.next_refresh()[1])
+        self.assertEqual(8, self.env.sts_calls.count("AssumeRoleWithSAML"))
+
+    def test_backs_off_on_failure(self):
+        daemon = RefreshDaemon(["fake-app-dev"])
+        daemon.schedule_all()
+        with mock.patch.object(AwsAd, "login_many_async", side_effect=Exception("No network")):
+            results = asyncio.run(daemon.refresh_due())
+        self.assertEqual("No network", str(results[0].error))
+        retry_in = (daemon.next_refresh()[0] - datetime.datetime.now(tz.UTC)).total_seconds()
+        self.assertAlmostEqual(RefreshDaemon.MIN_BACKOFF, retry_in, delta=5)
+        # Not due yet:
+        self.assertEqual([], asyncio.run(daemon.refresh_due()))
+        self.assertEqual([], self.env.sts_calls)
@@ -0,0 +1,42 @@
+import threading
+import time
+import unittest
+
+import pytest
+
+from dnbad.awsad.aws_config import AwsConfig
+from dnbad.awsad.awsad import AwsAd
+
+
+@pytest.mark.usefixtures("fake_env")
+class TestRefreshingSession(unittest.TestCase):
+    def test_refreshes_once_for_all_threads(self):
+        AwsAd("fake-app-dev").login()
+        self.env.expire_in("fake-app-dev", 5)
+        credentials = AwsAd("fake-app-dev").refreshing_session(refresh_margin=3).get_credentials()
+        access_key = credentials.access_key
+        self.assertEqual(AwsConfig.load("fake-app-dev").aws_access_key_id, access_key)
+
+        # In the margin, all threads wait for the refresh:
+        time.sleep(2.5)
+        frozen = []
+        threads = [
+            threading.Thread(target=lambda: frozen.append(credentials.get_frozen_credentials())) for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+
+        self.assertEqual(8, len(frozen))
+        self.assertEqual({AwsConfig.load("fake-app-dev").aws_access_key_id}, {f.access_key for f in frozen})
+        self.assertNotEqual(access_key, frozen[0].access_key)
+        self.assertEqual(3, self.env.sts_calls.count("AssumeRoleWithSAML"))
+
+    @pytest.mark.fake_env(session_duration=900)
+    def test_margin_is_clamped_to_the_session_duration(self):
+        credentials = AwsAd("fake-app-dev").refreshing_session(refresh_margin=900).get_credentials()
+        for _ in range(3):
+            credentials.get_frozen_credentials()
+        AwsAd("fake-app-dev").login_if_invalid_credentials(margin=900)
+        self.assertEqual(["AssumeRoleWithSAML"], self.env.sts_calls)
@@ -0,0 +1,32 @@
+import unittest
+
+import pytest
+
+from dnbad.awsad.aws_config import AwsConfig
+from dnbad.awsad.awsad import AwsAd
+
+
+@pytest.mark.usefixtures("fake_env")
+class TestSessionDuration(unittest.TestCase):
+    @pytest.mark.fake_env(session_duration=3600)
+    def test_session_duration_from_saml_response(self):
+        AwsAd("fake-app-dev").login()
+        self.assertEqual(3600, AwsConfig.load("fake-app-dev").aws_session_duration)
+        self.assertEqual(["AssumeRoleWithSAML"], self.env.sts_calls)
+
+    def test_session_duration_from_role_metadata_cache(self):
+        AwsAd("fake-app-dev").login()
+        # A new profile of the same role:
+        self.env.reset_profiles()
+        AwsAd("fake-app-dev").login()
+        self.assertEqual(self.env.MAX_SESSION_DURATION, AwsConfig.load("fake-app-dev").aws_session_duration)
+        self.assertEqual(["AssumeRoleWithSAML", "GetRole", "AssumeRoleWithSAML", "AssumeRoleWithSAML"],
+                         self.env.sts_calls)
+
+    # More than the MaxSessionDuration of the fake roles:
+    @pytest.mark.fake_env(session_duration=43200 + 1)
+    def test_rejected_session_duration_is_looked_up(self):
+        AwsAd("fake-app-dev").login()
+        self.assertEqual(self.env.MAX_SESSION_DURATION, AwsConfig.load("fake-app-dev").aws_session_duration)
+        self.assertEqual(["AssumeRoleWithSAML", "AssumeRoleWithSAML", "GetRole", "AssumeRoleWithSAML"],
+                         self.env.sts_calls)
@@ -0,0 +1,69 @@
+import base64
+import datetime
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import pytest
+
+from dnbad.awsad.awsad import AwsAd
+from dnbad.awsad.saml import Saml
+from dnbad.awsad.saml_cache import EncryptedFile, SamlCache
+from dnbad.awsad.saml_http import HttpSamlLogin
+
+
+def build_saml_response(lifetime: int = 300) -> str:
+    not_on_or_after = datetime.datetime.utcnow() + datetime.timedelta(seconds=lifetime)
+    return base64.b64encode(
+        f'<Response xmlns="urn:oasis:names:tc:SAML:2.0:assertion"><Assertion><Subject><SubjectConfirmation>'
+        f'<SubjectConfirmationData NotOnOrAfter="{not_on_or_after:%Y-%m-%dT%H:%M:%S.000Z}"/>'
+        f'</SubjectConfirmation></Subject><Conditions NotOnOrAfter="{not_on_or_after:%Y-%m-%dT%H:%M:%SZ}"/>'
+        f'</Assertion></Response>'.encode()
+    ).decode()
+
+
+class TestSamlCache(unittest.TestCase):
+    def test_not_on_or_after(self):
+        before = datetime.datetime.now(datetime.timezone.utc)
+        not_on_or_after = Saml.get_not_on_or_after(Saml.response_to_xml(build_saml_response(300)))
+        self.assertAlmostEqual(300, (not_on_or_after - before).total_seconds(), delta=2)
+
+    def test_expired_assertions_are_not_used(self):
+        cache = SamlCache()
+        cache.put("tenant", "app", build_saml_response(lifetime=300))
+        cache.put("tenant", "old", build_saml_response(lifetime=SamlCache.MARGIN - 1))
+        self.assertIsNotNone(cache.get("tenant", "app"))
+        self.assertIsNone(cache.get("tenant", "old"))
+        self.assertIsNone(cache.get("other-tenant", "app"))
+
+    def test_encrypted_file_shared_between_caches(self):
+        keys = {}
+        with tempfile.TemporaryDirectory() as d, \
+                mock.patch.dict(os.environ, {SamlCache.FILE_ENVIRONMENT_VARIABLE: "1"}), \
+                mock.patch("dnbad.awsad.saml_cache.get_data_file_path", lambda name: os.path.join(d, name)), \
+                mock.patch("keyring.get_password", lambda service, user: keys.get(user)), \
+                mock.patch("keyring.set_password", lambda service, user, key: keys.__setitem__(user, key)):
+            saml_response = build_saml_response()
+            SamlCache().put("tenant", "app", saml_response)
+
+            path = os.path.join(d, "saml_cache.bin")
+            self.assertEqual(0, os.stat(path).st_mode & 0o077)
+            with open(path, "rb") as f:
+                self.assertNotIn(saml_response.encode(), f.read())
+            self.assertEqual(saml_response, SamlCache().get("tenant", "app"))
+
+            SamlCache().delete("tenant", "app")
+            self.assertEqual({}, EncryptedFile(path).load())
+
+
+@pytest.mark.usefixtures("fake_env")
+class TestSamlCacheLogin(unittest.TestCase):
+    def test_sibling_profile_reuses_cached_saml_response(self):
+        self.env.add_profile("sibling", "fake-app-prod", self.env.APPS["fake-app-prod"][1][1])
+        with mock.patch.object(HttpSamlLogin, "login", autospec=True, side_effect=HttpSamlLogin.login) as m:
+            AwsAd("fake-app-prod").login()
+            AwsAd("sibling").login()
+        self.assertEqual(1, m.call_count)
+        self.assertTrue(AwsAd("sibling").has_valid_credentials())
+        self.assertEqual(4, self.env.sts_calls.count("AssumeRoleWithSAML"))
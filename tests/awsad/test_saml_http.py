@@ -0,0 +1,81 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from dnbad.awsad.saml import Saml
+from dnbad.awsad.saml_http import HttpSamlLogin
+from dnbad.common.cookie_store import CookieStore
+
+SAML_RESPONSE = "c2FtbC1yZXNwb25zZQ=="
+
+
+class FakeLoginHandler(BaseHTTPRequestHandler):
+    """ Redirects to an auto-submitting form when the session cookie is present, else shows the password page. """
+
+    def do_GET(self):
+        if self.path.startswith("/saml2"):
+            if "ESTSAUTH=valid" in self.headers.get("Cookie", ""):
+                self.send_response(302)
+                self.send_header("Location", "/kmsi")
+                self.end_headers()
+            else:
+                self._page('<div role="heading">Enter password</div>')
+        elif self.path == "/kmsi":
+            self._page('<form method="post" action="/login.srf"><input type="hidden" name="code" value="abc"/></form>'
+                       '<script>document.forms[0].submit()</script>')
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"])).decode()
+        if self.path == "/login.srf" and body == "code=abc":
+            self._page(f'<form method="post" action="{Saml.SAML_COMPLETE_URL}">'
+                       f'<input type="hidden" name="SAMLResponse" value="{SAML_RESPONSE}"/></form>')
+        else:
+            self.send_error(400)
+
+    def _page(self, body: str):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.end_headers()
+        self.wfile.write(f"<html><body>{body}</body></html>".encode())
+
+    def log_message(self, *args):
+        pass
+
+
+class TestHttpSamlLogin(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), FakeLoginHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = f"http://127.0.0.1:{cls.server.server_port}/saml2?SAMLRequest=x"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def _login(self, cookies: list):
+        with tempfile.TemporaryDirectory() as d:
+            cookie_path = os.path.join(d, "cookies.json")
+            with open(cookie_path, "w") as f:
+                json.dump(cookies, f)
+            return HttpSamlLogin(CookieStore(cookie_path), self.url).login()
+
+    @staticmethod
+    def _cookie(value: str, expires: float):
+        return {"name": "ESTSAUTH", "value": value, "domain": "127.0.0.1", "path": "/", "expires": expires}
+
+    def test_valid_session(self):
+        self.assertEqual(SAML_RESPONSE, self._login([self._cookie("valid", time.time() + 3600)]))
+
+    def test_session_cookie(self):
+        self.assertEqual(SAML_RESPONSE, self._login([self._cookie("valid", -1)]))
+
+    def test_expired_session(self):
+        self.assertIsNone(self._login([self._cookie("valid", time.time() - 10)]))
+
+    def test_interaction_required(self):
+        self.assertIsNone(self._login([self._cookie("invalid", -1)]))
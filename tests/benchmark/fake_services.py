@@ -0,0 +1,352 @@
+"""
+Local stand-ins for Azure AD and AWS STS/IAM, such that the login flows can be run and timed offline.
+
+FakeEnvironment starts both servers, points dnbad at them and isolates all state in a temporary directory.
+"""
+import base64
+import datetime
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import uuid
+import zlib
+from contextlib import ExitStack
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import *
+from unittest import mock
+from urllib.parse import parse_qs, urlparse, quote
+from xml.etree import ElementTree
+
+from dateutil import tz
+
+import dnbad
+import dnbad.common
+from dnbad.awsad.aws_config import AwsConfig
+from dnbad.awsad.awsad import AwsAd
+from dnbad.awsad.find_apps import AzureAppsFinder
+from dnbad.awsad.saml import Saml
+from dnbad.awsad.saml_cache import SamlCache
+from dnbad.common.cookie_store import CookieStore
+from dnbad.common.local_config import LocalConfig
+from dnbad.common.password_manager import PasswordManager
+from dnbad.gproxy.gproxy_ad_login import GProxyAdLogin
+
+USERNAME = "first.last@tech-01.net"
+PASSWORD = "password"
+TENANT_ID = "fake-tenant"
+ACCOUNT_ID = "123456789012"
+APPS = {
+    "fake-app-dev": ("AWS - Dev", [f"arn:aws:iam::{ACCOUNT_ID}:role/Developer"]),
+    "fake-app-prod": ("AWS - Prod", [f"arn:aws:iam::{ACCOUNT_ID}:role/ReadOnly",
+                                     f"arn:aws:iam::{ACCOUNT_ID}:role/Admin"]),
+}
+SAML_PROVIDER = f"arn:aws:iam::{ACCOUNT_ID}:saml-provider/AzureAD"
+MAX_SESSION_DURATION = 43200
+SESSION_COOKIE = "ESTSAUTH"
+
+
+def build_saml_response(app_id: str, lifetime: int = 300, session_duration: Optional[int] = None) -> str:
+    now = datetime.datetime.utcnow()
+    not_on_or_after = (now + datetime.timedelta(seconds=lifetime)).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+    roles = "".join(f"<AttributeValue>{role},{SAML_PROVIDER}</AttributeValue>" for role in APPS[app_id][1])
+    duration = "" if session_duration is None else (
+        f'<Attribute Name="https://aws.amazon.com/SAML/Attributes/SessionDuration">'
+        f'<AttributeValue>{session_duration}</AttributeValue></Attribute>'
+    )
+    xml = (
+        f'<samlp:Response xmlns:samlp="urn:oasis:names:tc:SAML:2.0:protocol" '
+        f'xmlns="urn:oasis:names:tc:SAML:2.0:assertion" ID="_{uuid.uuid4()}">'
+        f'<Assertion><Subject><NameID>{USERNAME}</NameID>'
+        f'<SubjectConfirmation Method="urn:oasis:names:tc:SAML:2.0:cm:bearer">'
+        f'<SubjectConfirmationData NotOnOrAfter="{not_on_or_after}" Recipient="{Saml.SAML_COMPLETE_URL}"/>'
+        f'</SubjectConfirmation></Subject>'
+        f'<Conditions NotOnOrAfter="{not_on_or_after}"/>'
+        f'<AttributeStatement><Attribute Name="https://aws.amazon.com/SAML/Attributes/Role">{roles}</Attribute>'
+        f'{duration}</AttributeStatement></Assertion></samlp:Response>'
+    )
+    return base64.b64encode(xml.encode()).decode()
+
+
+class FakeAzureHandler(BaseHTTPRequestHandler):
+    """
+    Serves the pages the auth handler reacts to. Without a session cookie every flow goes through
+    'Sign in', 'Enter password' and 'Approve sign in request', which is approved after `mfa_delay` seconds.
+    """
+    mfa_delay = 0.1
+    session_duration: Optional[int] = None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        if url.path == f"/{TENANT_ID}/saml2":
+            app_id = self._app_id_from_request(query["SAMLRequest"])
+            if self._has_session():
+                # Azure passes the session on with auto-submitting forms:
+                self._page(None, f'<form method="post" action="/sso"><input type="hidden" name="app_id" '
+                                 f'value="{app_id}"/></form><script>document.forms[0].submit()</script>')
+            else:
+                self._sign_in(f"/sso?app_id={app_id}")
+        elif url.path == "/sso":
+            if self._has_session():
+                self._saml_form(query["app_id"])
+            else:
+                self._sign_in(self.path)
+        elif url.path == "/approved":
+            self.send_response(302)
+            self.send_header("Set-Cookie", f"{SESSION_COOKIE}=valid; Path=/; Max-Age=3600")
+            self.send_header("Location", query["next"])
+            self.end_headers()
+        elif url.path == "/apps":
+            if self._has_session():
+                self._page(None, "".join(
+                    f'<img alt="{title}" src="/logo.png?tenantId={TENANT_ID}&appId={app_id}" width="50" height="50"/>'
+                    for app_id, (title, _) in APPS.items()
+                ))
+            else:
+                self._sign_in("/apps")
+        elif url.path == "/devicelogin":
+            self._heading_form("Enter code", "/devicelogin", '<input name="otc" autofocus/>')
+        elif url.path == "/devicelogin/consent":
+            if self._has_session():
+                self._heading_form("Are you trying to sign in to GitProxy?", "/devicelogin/confirm",
+                                   '<input type="submit" value="Continue" autofocus/>')
+            else:
+                self._sign_in(self.path)
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        form = {k: v[0] for k, v in parse_qs(self.rfile.read(int(self.headers["Content-Length"])).decode()).items()}
+        if self.path == "/login" and form.get("loginfmt") == USERNAME:
+            self._heading_form("Enter password", "/password", '<input name="passwd" type="password" autofocus/>',
+                               form["next"])
+        elif self.path == "/password" and form.get("passwd") == PASSWORD:
+            target = f"/approved?next={quote(form['next'])}"
+            self._page("Approve sign in request",
+                       f'<script>setTimeout(() => location.href = "{target}", {int(self.mfa_delay * 1000)})</script>')
+        elif self.path == "/sso" and self._has_session():
+            self._saml_form(form["app_id"])
+        elif self.path == "/devicelogin" and form.get("otc"):
+            self.send_response(302)
+            self.send_header("Location", "/devicelogin/consent")
+            self.end_headers()
+        elif self.path == "/devicelogin/confirm":
+            self._page("GitProxy", "You have signed in to the GitProxy application on your device.")
+        else:
+            self.send_error(400)
+
+    @staticmethod
+    def _app_id_from_request(saml_request: str) -> str:
+        xml = ElementTree.XML(zlib.decompress(base64.b64decode(saml_request), -15))
+        return xml.find("{urn:oasis:names:tc:SAML:2.0:assertion}Issuer").text
+
+    def _has_session(self) -> bool:
+        return f"{SESSION_COOKIE}=valid" in self.headers.get("Cookie", "")
+
+    def _sign_in(self, next_url: str):
+        self._heading_form("Sign in", "/login", '<input name="loginfmt" type="email" autofocus/>', next_url)
+
+    def _saml_form(self, app_id: str):
+        saml_response = build_saml_response(app_id, session_duration=self.session_duration)
+        self._page(None, f'<form method="post" action="{Saml.SAML_COMPLETE_URL}">'
+                         f'<input type="hidden" name="SAMLResponse" value="{saml_response}"/></form>'
+                         f'<script>document.forms[0].submit()</script>')
+
+    def _heading_form(self, heading: str, action: str, inputs: str, next_url: str = ""):
+        self._page(heading, f'<form method="post" action="{action}">{inputs}'
+                            f'<input type="hidden" name="next" value="{next_url}"/></form>')
+
+    def _page(self, heading: Optional[str], body: str):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.end_headers()
+        heading = f'<div role="heading">{heading}</div>' if heading else ""
+        self.wfile.write(f"<html><body>{heading}{body}</body></html>".encode())
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeAwsHandler(BaseHTTPRequestHandler):
+    """ Answers AssumeRoleWithSAML (STS) and GetRole (IAM) in the AWS query protocol. """
+    calls: List[str] = []
+    # SAML Responses which STS rejects, e.g. since the user has been signed out.
+    revoked: Set[str] = set()
+
+    def do_POST(self):
+        form = {k: v[0] for k, v in parse_qs(self.rfile.read(int(self.headers["Content-Length"])).decode()).items()}
+        action = form.get("Action")
+        self.calls.append(action)
+        if action == "AssumeRoleWithSAML" and form.get("SAMLAssertion") in self.revoked:
+            self._error("InvalidIdentityToken", "The SAML assertion has been revoked.")
+        elif action == "AssumeRoleWithSAML" and int(form.get("DurationSeconds", 3600)) > MAX_SESSION_DURATION:
+            self._error("ValidationError",
+                        "The requested DurationSeconds exceeds the MaxSessionDuration set for this role.")
+        elif action == "AssumeRoleWithSAML":
+            expiration = datetime.datetime.utcnow() + datetime.timedelta(seconds=int(form.get("DurationSeconds", 3600)))
+            self._xml("AssumeRoleWithSAML", "https://sts.amazonaws.com/doc/2011-06-15/",
+                      f"<Credentials><AccessKeyId>ASIA{uuid.uuid4().hex[:16].upper()}</AccessKeyId>"
+                      f"<SecretAccessKey>secret</SecretAccessKey><SessionToken>token</SessionToken>"
+                      f"<Expiration>{expiration:%Y-%m-%dT%H:%M:%SZ}</Expiration></Credentials>")
+        elif action == "GetRole":
+            name = form["RoleName"]
+            self._xml("GetRole", "https://iam.amazonaws.com/doc/2010-05-08/",
+                      f"<Role><Path>/</Path><RoleName>{name}</RoleName><RoleId>AROAFAKE</RoleId>"
+                      f"<Arn>arn:aws:iam::{ACCOUNT_ID}:role/{name}</Arn><CreateDate>2020-01-01T00:00:00Z</CreateDate>"
+                      f"<MaxSessionDuration>{MAX_SESSION_DURATION}</MaxSessionDuration></Role>")
+        else:
+            self.send_error(400)
+
+    def _error(self, code: str, message: str):
+        self.send_response(400)
+        self.send_header("Content-Type", "text/xml")
+        self.end_headers()
+        self.wfile.write(
+            f'<ErrorResponse xmlns="https://sts.amazonaws.com/doc/2011-06-15/"><Error><Type>Sender</Type>'
+            f'<Code>{code}</Code><Message>{message}</Message></Error><RequestId>{uuid.uuid4()}</RequestId>'
+            f'</ErrorResponse>'.encode()
+        )
+
+    def _xml(self, action: str, namespace: str, result: str):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/xml")
+        self.end_headers()
+        self.wfile.write(
+            f'<{action}Response xmlns="{namespace}"><{action}Result>{result}</{action}Result>'
+            f'<ResponseMetadata><RequestId>{uuid.uuid4()}</RequestId></ResponseMetadata></{action}Response>'.encode()
+        )
+
+    def log_message(self, *args):
+        pass
+
+
+def _serve(handler: type) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class FakeEnvironment:
+    """ Runs the fakes, with one configured AWS profile per fake app, named after the app id. """
+    APPS = APPS
+    TENANT_ID = TENANT_ID
+    MAX_SESSION_DURATION = MAX_SESSION_DURATION
+
+    def __init__(self, mfa_delay: float = 0.1, session_duration: Optional[int] = None):
+        self.azure_handler = type("Handler", (FakeAzureHandler,), {
+            "mfa_delay": mfa_delay, "session_duration": session_duration
+        })
+        self.aws_handler = type("Handler", (FakeAwsHandler,), {"calls": [], "revoked": set()})
+        self._stack = ExitStack()
+
+    @property
+    def sts_calls(self) -> List[str]:
+        return self.aws_handler.calls
+
+    def __enter__(self):
+        azure = _serve(self.azure_handler)
+        aws = _serve(self.aws_handler)
+        self._stack.callback(azure.shutdown)
+        self._stack.callback(aws.shutdown)
+        self._patch(
+            azure_url=f"http://127.0.0.1:{azure.server_port}",
+            aws_url=f"http://127.0.0.1:{aws.server_port}",
+            data_dir=self._stack.enter_context(tempfile.TemporaryDirectory())
+        )
+        LocalConfig(USERNAME).save()
+        self.reset_profiles()
+        return self
+
+    def popen_attached(self, code: str, **kwargs) -> subprocess.Popen:
+        """ Runs Python code in a child process pointed at the fakes of this environment, e.g. to test locking. """
+        root = os.path.dirname(os.path.dirname(dnbad.__file__))
+        return subprocess.Popen(
+            [sys.executable, __file__, "attach", self.azure_url, self.aws_url, self.data_dir, code],
+            env={**os.environ, "PYTHONPATH": os.pathsep.join([root, os.environ.get("PYTHONPATH", "")])},
+            **kwargs
+        )
+
+    def _patch(self, azure_url: str, aws_url: str, data_dir: str):
+        self.azure_url = azure_url
+        self.aws_url = aws_url
+        self.data_dir = data_dir
+        self._stack.enter_context(mock.patch.dict(os.environ, {
+            "AWS_CONFIG_FILE": os.path.join(self.data_dir, "aws_config"),
+            "AWS_SHARED_CREDENTIALS_FILE": os.path.join(self.data_dir, "aws_credentials"),
+            "AWS_DEFAULT_REGION": "eu-west-1",
+        }))
+        os.environ.pop("AWS_PROFILE", None)
+        for target, attribute, value in [
+            (dnbad.common, "_DATA_ROOT", self.data_dir),
+            (Saml, "_SAML_URL", self.azure_url + "/{tenant_id}/saml2?SAMLRequest={saml_request}"),
+            (AzureAppsFinder, "APPS_URL", f"{self.azure_url}/apps"),
+            (GProxyAdLogin, "URL", f"{self.azure_url}/devicelogin"),
+            (CookieStore, "DOMAINS", ("127.0.0.1",)),
+            (AwsAd, "ENDPOINT_URLS", {"sts": aws_url, "iam": aws_url}),
+            (AwsAd, "_SAML_CACHE", SamlCache()),
+            (PasswordManager, "fetch_password", lambda pm: setattr(pm, "_password", PASSWORD)),
+            (PasswordManager, "has_password", lambda pm: True),
+        ]:
+            self._stack.enter_context(mock.patch.object(target, attribute, value))
+
+    @staticmethod
+    def reset_profiles():
+        for app_id, (title, _) in APPS.items():
+            # noinspection PyTypeChecker
+            AwsConfig(
+                profile=app_id,
+                azure_tenant_id=TENANT_ID, azure_app_id=app_id, azure_app_title=title,
+                aws_default_role_arn=APPS[app_id][1][0], aws_session_duration=None,
+                aws_access_key_id=None, aws_secret_access_key=None, aws_session_token=None, aws_expiration_time=None
+            ).save()
+
+    @staticmethod
+    def add_profile(profile: str, app_id: str, role_arn: str):
+        """ Another profile of a fake app, e.g. with another role. """
+        # noinspection PyTypeChecker
+        AwsConfig(
+            profile=profile, azure_tenant_id=TENANT_ID, azure_app_id=app_id, azure_app_title=APPS[app_id][0],
+            aws_default_role_arn=role_arn, aws_session_duration=None,
+            aws_access_key_id=None, aws_secret_access_key=None, aws_session_token=None, aws_expiration_time=None
+        ).save()
+
+    @staticmethod
+    def expire_in(profile: str, seconds: float):
+        """ Moves the expiration of the stored credentials of the profile. """
+        config = AwsConfig.load(profile)
+        config.aws_expiration_time = datetime.datetime.now(tz.UTC) + datetime.timedelta(seconds=seconds)
+        config.save()
+
+    def seed_session(self):
+        """ Stores a valid session cookie, as left by a previous login. """
+        CookieStore(self._cookie_path()).write([
+            {"name": SESSION_COOKIE, "value": "valid", "domain": "127.0.0.1", "path": "/", "expires": -1}
+        ])
+
+    def _cookie_path(self) -> str:
+        return os.path.join(self.data_dir, f"cookies_{USERNAME}.json")
+
+    def clear_cookies(self):
+        if os.path.exists(self._cookie_path()):
+            os.remove(self._cookie_path())
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._stack.close()
+        return False
+
+
+def _attach(azure_url: str, aws_url: str, data_dir: str, code: str):
+    """ Runs Python code in the FakeEnvironment of the parent process. """
+    env = FakeEnvironment()
+    env._patch(azure_url, aws_url, data_dir)
+    try:
+        exec(code, {})
+    finally:
+        env._stack.close()
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ["attach"]:
+        _attach(*sys.argv[2:6])
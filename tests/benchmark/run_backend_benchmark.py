@@ -0,0 +1,77 @@
+"""
+Compares the browser backends: import time and RSS of the Python process, and browser login latency against the fakes.
+
+    $ python tests/benchmark/run_backend_benchmark.py [-r <repeat>]
+
+Import time and RSS are measured in a fresh interpreter per backend, importing the login code and the driver.
+"""
+import argparse
+import contextlib
+import io
+import os
+import statistics
+import subprocess
+import sys
+
+from fake_services import FakeEnvironment
+from run_benchmark import print_rows, run, scenarios
+
+from dnbad.common.azure_auth import AuthConfig
+
+_PROBE = """
+import resource, sys, time
+start = time.perf_counter()
+import dnbad.awsad.saml_login
+import {module}
+elapsed = time.perf_counter() - start
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(elapsed, rss if sys.platform == "darwin" else rss * 1024)
+"""
+# The modules each backend imports when it launches a browser:
+DRIVER_MODULES = {"cdp": "dnbad.common.cdp", "pyppeteer": "pyppeteer"}
+LATENCY_SCENARIOS = ("awsad login (browser only)", "gproxy device-code login")
+
+
+def probe_import(module: str, repeat: int):
+    times, rss = [], []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", _PROBE.format(module=module)],
+            capture_output=True, text=True, check=True, env={**os.environ, "PYTHONPATH": os.getcwd()}
+        ).stdout.split()
+        times.append(float(output[0]))
+        rss.append(int(output[1]))
+    return statistics.median(times), statistics.median(rss)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-r", "--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'Backend':<10}  {'import (ms)':>11}  {'RSS (MiB)':>9}")
+    for backend, module in DRIVER_MODULES.items():
+        try:
+            elapsed, rss = probe_import(module, args.repeat)
+        except subprocess.CalledProcessError as e:
+            print(f"{backend:<10}  failed: {e.stderr.strip().splitlines()[-1]}")
+            continue
+        print(f"{backend:<10}  {elapsed * 1000:>11.0f}  {rss / 1024 / 1024:>9.1f}")
+    print()
+
+    rows = []
+    with FakeEnvironment(mfa_delay=0.1) as env:
+        for backend in DRIVER_MODULES:
+            config = AuthConfig(headless=True, backend=backend)
+            for name, func in scenarios(config).items():
+                if name not in LATENCY_SCENARIOS:
+                    continue
+                for warm in (False, True):
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        timings, error = run(env, func, warm, args.repeat)
+                    rows.append((f"{backend}: {name} ({'warm' if warm else 'cold'})", timings, error))
+    print_rows(rows)
+
+
+if __name__ == '__main__':
+    main()
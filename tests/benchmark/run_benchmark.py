@@ -0,0 +1,84 @@
+"""
+Times the login flows against the local fakes, cold (no cookies) and warm (a valid session cookie).
+
+    $ python tests/benchmark/run_benchmark.py [-r <repeat>] [--lean] [--broker] [--backend <backend>]
+
+The browser scenarios need Chromium (installed, or pyppeteer-install). Failing scenarios are reported, not raised.
+"""
+import argparse
+import contextlib
+import io
+import statistics
+import time
+from typing import *
+
+from fake_services import FakeEnvironment, USERNAME
+
+from dnbad.awsad.awsad import AwsAd
+from dnbad.awsad.find_apps import AzureAppsFinder
+from dnbad.common.azure_auth import AuthConfig
+from dnbad.common.browser_backend import BACKENDS
+from dnbad.common.password_manager import PasswordManager
+from dnbad.gproxy.gproxy_ad_login import GProxyAdLogin
+
+
+def scenarios(config: AuthConfig) -> Dict[str, Callable[[], Any]]:
+    browser_only = AuthConfig(**{**config.__dict__, "http_fast_path": False})
+    return {
+        "awsad login": lambda: AwsAd("fake-app-dev").login(config),
+        "awsad login (browser only)": lambda: AwsAd("fake-app-dev").login(browser_only),
+        "awsad configure app discovery":
+            lambda: AzureAppsFinder(config, PasswordManager(USERNAME)).find_aws_apps_sync(),
+        "gproxy device-code login": lambda: GProxyAdLogin("ABCDEFGHI", PasswordManager(USERNAME), config).login_sync(),
+    }
+
+
+def run(env: FakeEnvironment, func: Callable[[], Any], warm: bool, repeat: int) -> Tuple[List[float], Optional[str]]:
+    timings = []
+    try:
+        for _ in range(repeat):
+            env.reset_profiles()
+            if warm:
+                env.seed_session()
+            else:
+                env.clear_cookies()
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+    except Exception as e:
+        return timings, f"{type(e).__name__}: {str(e)[:80]}"
+    return timings, None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-r", "--repeat", type=int, default=3)
+    parser.add_argument("--mfa-delay", type=float, default=0.1, help="Seconds before the fake MFA is approved")
+    parser.add_argument("--lean", action="store_true")
+    parser.add_argument("--broker", action="store_true")
+    parser.add_argument("--backend", choices=BACKENDS, default="auto")
+    args = parser.parse_args()
+    config = AuthConfig(headless=True, lean=args.lean, use_broker=args.broker, backend=args.backend)
+
+    rows = []
+    with FakeEnvironment(mfa_delay=args.mfa_delay) as env:
+        for name, func in scenarios(config).items():
+            for warm in (False, True):
+                with contextlib.redirect_stdout(io.StringIO()):
+                    timings, error = run(env, func, warm, args.repeat)
+                rows.append((f"{name} ({'warm' if warm else 'cold'})", timings, error))
+    print_rows(rows)
+
+
+def print_rows(rows: List[Tuple[str, List[float], Optional[str]]]):
+    width = max(len(name) for name, _, _ in rows)
+    print(f"{'Scenario':<{width}}  {'min (s)':>8}  {'median (s)':>10}  {'max (s)':>8}")
+    for name, timings, error in rows:
+        if error:
+            print(f"{name:<{width}}  failed: {error}")
+        else:
+            print(f"{name:<{width}}  {min(timings):>8.3f}  {statistics.median(timings):>10.3f}  {max(timings):>8.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,33 @@
+import asyncio
+import datetime
+import unittest
+
+import pytest
+from dateutil import tz
+
+from dnbad.awsad.aws_config import AwsConfig
+from dnbad.awsad.awsad import AwsAd
+
+
+@pytest.mark.usefixtures("fake_env")
+class TestFakeLogin(unittest.TestCase):
+    """ Runs the browserless parts of the login pipeline against the local fakes. """
+
+    def test_login_with_session_cookie(self):
+        AwsAd("fake-app-dev").login()
+
+        config = AwsConfig.load("fake-app-dev")
+        self.assertEqual(self.env.MAX_SESSION_DURATION, config.aws_session_duration)
+        self.assertGreater(config.aws_expiration_time, datetime.datetime.now(tz.UTC))
+        self.assertEqual(["AssumeRoleWithSAML", "GetRole", "AssumeRoleWithSAML"], self.env.sts_calls)
+
+    def test_concurrent_async_logins_inside_running_loop(self):
+        async def login_all():
+            await asyncio.gather(*(AwsAd(profile).login_async() for profile in self.env.APPS))
+            # The sync API must also work while a loop is running (e.g. in Jupyter):
+            AwsAd("fake-app-dev").login()
+
+        asyncio.run(login_all())
+        for profile in self.env.APPS:
+            self.assertTrue(AwsAd(profile).has_valid_credentials())
+        self.assertEqual(5, self.env.sts_calls.count("AssumeRoleWithSAML"))
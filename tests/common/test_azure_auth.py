@@ -0,0 +1,97 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from dnbad.common.azure_auth import AuthBrowser, AuthConfig
+
+
+class FakePage:
+    """ Fails calls made after close, as pyppeteer and cdp pages do. """
+
+    def __init__(self):
+        self.closed = False
+
+    def _check_open(self):
+        if self.closed:
+            raise ConnectionError("Page is closed")
+
+    async def exposeFunction(self, name, func):
+        self._check_open()
+
+    async def evaluateOnNewDocument(self, js):
+        self._check_open()
+
+    async def evaluate(self, js):
+        self._check_open()
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeAuthHandler:
+    def __init__(self):
+        self.saved = 0
+        self.password_manager = mock.Mock(username="user")
+
+    async def load_cookies(self, page: FakePage):
+        page._check_open()
+
+    async def save_cookies(self, page: FakePage):
+        page._check_open()
+        self.saved += 1
+
+    async def handle_auth(self, page: FakePage, watcher):
+        await asyncio.Event().wait()
+
+
+class TestMapAuthPages(unittest.TestCase):
+    def test_cookies_are_saved_before_pages_are_closed(self):
+        handler = FakeAuthHandler()
+        browser = AuthBrowser(handler, AuthConfig())
+        pages = []
+
+        async def new_page():
+            pages.append(FakePage())
+            return pages[-1]
+
+        async def action(auth_page, target):
+            return target * 2
+
+        async def run():
+            return [result async for result in browser.map_auth_pages([1, 2, 3], action)]
+
+        with mock.patch.object(browser, "new_page", new_page):
+            results = asyncio.run(run())
+        self.assertEqual([None, None, None], [result.error for result in results])
+        self.assertEqual([2, 4, 6], sorted(result.value for result in results))
+        self.assertEqual(3, handler.saved)
+        self.assertTrue(all(page.closed for page in pages))
+
+
+class TestChromiumProfile(unittest.TestCase):
+    @staticmethod
+    def _open(broker_browser) -> mock.Mock:
+        """ Opens and closes an AuthBrowser with a persistent profile, returning the ChromiumProfile mock. """
+        browser = AuthBrowser(FakeAuthHandler(), AuthConfig(persistent_profile=True, use_broker=True))
+        launched = mock.AsyncMock(process=None)
+        connect = mock.AsyncMock(return_value=broker_browser)
+
+        async def run():
+            async with browser:
+                pass
+
+        with mock.patch("dnbad.common.azure_auth.ChromiumProfile") as profile, \
+                mock.patch("dnbad.common.pyppeteer.BrowserBroker.connect", connect), \
+                mock.patch("dnbad.common.pyppeteer.BrokerEndpoint.touch"), \
+                mock.patch("dnbad.common.browser_backend.launch", mock.AsyncMock(return_value=launched)):
+            asyncio.run(run())
+        return profile
+
+    def test_not_acquired_with_broker(self):
+        profile = self._open(mock.AsyncMock())
+        profile.return_value.acquire.assert_not_called()
+
+    def test_acquired_when_launched(self):
+        profile = self._open(None)
+        profile.return_value.acquire.assert_called_once_with()
+        profile.return_value.release.assert_called_once_with()
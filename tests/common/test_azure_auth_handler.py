@@ -0,0 +1,53 @@
+import asyncio
+import unittest
+
+from dnbad.common.azure_auth_handler import AzureAuthHandler, AuthState, on_state
+from dnbad.gproxy.gproxy_ad_login import GProxyAzureAuthHandler
+
+
+class TestAuthStateTable(unittest.TestCase):
+    def test_find_normalized(self):
+        self.assertIs(AzureAuthHandler.STATE_MFA, AzureAuthHandler.find_state("Approve sign-in request"))
+        self.assertIs(AzureAuthHandler.STATE_MFA, AzureAuthHandler.find_state(" approve  SIGN IN request "))
+        self.assertIs(AzureAuthHandler.STATE_MFA_EXPIRED, AzureAuthHandler.find_state("We didn’t hear from you"))
+        self.assertIsNone(AzureAuthHandler.find_state("Something else"))
+
+    def test_subclass_registration(self):
+        self.assertIs(GProxyAzureAuthHandler.STATE_GPROXY, GProxyAzureAuthHandler.find_state("GitProxy"))
+        self.assertIsNone(AzureAuthHandler.find_state("GitProxy"))
+        self.assertEqual("_submit_gproxy_code", GProxyAzureAuthHandler._STATE_HANDLERS["STATE_OTC_CODE"])
+        self.assertEqual("_submit_otc", AzureAuthHandler._STATE_HANDLERS["STATE_OTC_CODE"])
+        self.assertEqual("_submit_password", GProxyAzureAuthHandler._STATE_HANDLERS["STATE_PWD"])
+
+    def test_override_without_registration(self):
+        submitted = []
+
+        class OverridingHandler(AzureAuthHandler):
+            async def _submit_password(self, page):
+                submitted.append(page)
+
+        handler = OverridingHandler.__new__(OverridingHandler)
+        asyncio.run(handler._on_state_changed("page", AzureAuthHandler.STATE_PWD))
+        self.assertEqual(["page"], submitted)
+
+    def test_duplicate_heading(self):
+        with self.assertRaises(Exception):
+            class DuplicateHandler(AzureAuthHandler):
+                STATE_DUPLICATE = AuthState("Sign In")
+
+                @on_state(STATE_DUPLICATE)
+                async def _duplicate(self, page):
+                    pass
+
+    def test_register_heading_after_duplicate(self):
+        # The class which failed to be defined is still a subclass, until it is garbage collected.
+        self.test_duplicate_heading()
+        state = AzureAuthHandler.STATE_MFA
+        matches = state.matches
+        try:
+            AzureAuthHandler.register_heading(state, "Godkjenn forespørsel om pålogging")
+            self.assertIs(state, GProxyAzureAuthHandler.find_state("Godkjenn forespørsel om pålogging"))
+        finally:
+            state.matches = matches
+            # Recompiles the tables without the heading:
+            AzureAuthHandler.register_heading(state)
@@ -0,0 +1,168 @@
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+import websockets
+
+from dnbad.common import cdp
+
+
+class FakeBrowser:
+    """ Answers the CDP commands used by the driver, and emits the events a navigation causes. """
+
+    def __init__(self):
+        self.commands = []
+        self.ws = None
+        self.server = None
+
+    async def start(self) -> str:
+        self.server = await websockets.serve(self._handle, "127.0.0.1", 0)
+        port = self.server.sockets[0].getsockname()[1]
+        return f"ws://127.0.0.1:{port}/devtools/browser/fake"
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def event(self, method: str, params: dict, session_id: str = "session-1"):
+        await self.ws.send(json.dumps({"method": method, "params": params, "sessionId": session_id}))
+
+    async def _handle(self, ws, path=None):
+        self.ws = ws
+        async for raw in ws:
+            message = json.loads(raw)
+            self.commands.append((message["method"], message["params"]))
+            result, events = self._result(message["method"], message["params"])
+            reply = {"id": message["id"], **result}
+            if "sessionId" in message:
+                reply["sessionId"] = message["sessionId"]
+            await ws.send(json.dumps(reply))
+            for method, params in events:
+                await self.event(method, params)
+
+    @staticmethod
+    def _result(method: str, params: dict):
+        if method == "Target.createTarget":
+            return {"result": {"targetId": "target-1"}}, []
+        if method == "Target.attachToTarget":
+            return {"result": {"sessionId": "session-1"}}, []
+        if method == "Page.getFrameTree":
+            return {"result": {"frameTree": {"frame": {"id": "frame-1", "url": "about:blank"}}}}, []
+        if method == "Page.navigate":
+            return {"result": {"frameId": "frame-1", "loaderId": "loader-2"}}, [
+                ("Page.frameNavigated", {"frame": {"id": "frame-1", "url": params["url"]}}),
+                ("Page.lifecycleEvent", {"frameId": "frame-1", "loaderId": "loader-1", "name": "load"}),
+                ("Page.lifecycleEvent", {"frameId": "frame-1", "loaderId": "loader-2", "name": "DOMContentLoaded"}),
+                ("Page.lifecycleEvent", {"frameId": "frame-1", "loaderId": "loader-2", "name": "load"}),
+            ]
+        if method == "Runtime.evaluate":
+            if "throw" in params["expression"]:
+                return {"result": {"result": {}, "exceptionDetails": {"text": "Uncaught"}}}, []
+            return {"result": {"result": {"value": params["expression"]}}}, []
+        return {"result": {}}, []
+
+
+# Answers the DevTools protocol on fd 3 and 4, as Chromium does with --remote-debugging-pipe. Fails on a port argument.
+FAKE_PIPE_CHROMIUM = f"""#!{sys.executable}
+import json, os, sys
+assert "--remote-debugging-pipe" in sys.argv and not any(a.startswith("--remote-debugging-port") for a in sys.argv)
+buffer = b""
+while True:
+    data = os.read(3, 65536)
+    if not data:
+        break
+    buffer += data
+    while b"\\0" in buffer:
+        raw, buffer = buffer.split(b"\\0", 1)
+        message = json.loads(raw)
+        os.write(4, json.dumps({{"id": message["id"], "result": {{"method": message["method"]}}}}).encode() + b"\\0")
+        if message["method"] == "Browser.close":
+            sys.exit(0)
+"""
+
+
+class TestCdp(unittest.TestCase):
+    def run_with_page(self, test):
+        async def run():
+            fake = FakeBrowser()
+            browser = await cdp.Browser.connect(await fake.start())
+            try:
+                await test(fake, await browser.newPage())
+            finally:
+                await browser.disconnect()
+                await fake.stop()
+
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(run())
+        finally:
+            loop.close()
+
+    def test_goto_waits_for_lifecycle_event_of_navigation(self):
+        async def test(fake, page):
+            await asyncio.wait_for(page.goto("https://example.com/", waitUntil="load"), 1)
+            self.assertEqual("https://example.com/", page.url)
+            self.assertIn("load", page._lifecycle["loader-2"])
+
+        self.run_with_page(test)
+
+    def test_evaluate(self):
+        async def test(fake, page):
+            # The fake echoes the expression:
+            self.assertEqual('((x) => x)("a", 1)', await page.evaluate("(x) => x", "a", 1))
+            self.assertEqual("document.title", await page.evaluate("document.title"))
+            with self.assertRaises(cdp.CdpError):
+                await page.evaluate("() => { throw 1 }")
+
+        self.run_with_page(test)
+
+    def test_exposed_function_receives_payload(self):
+        async def test(fake, page):
+            calls = []
+            await page.exposeFunction("binding", calls.append)
+            await fake.event("Runtime.bindingCalled", {"name": "binding", "payload": "Sign in"})
+            await asyncio.sleep(0.05)
+            self.assertEqual(["Sign in"], calls)
+
+        self.run_with_page(test)
+
+    def test_intercepted_requests(self):
+        async def test(fake, page):
+            await page.setRequestInterception(True)
+            paused = {"requestId": "fetch-1", "resourceType": "Document", "request": {
+                "url": "https://signin.aws.amazon.com/saml", "method": "POST", "postData": "SAMLResponse=abc"
+            }}
+            waiter = asyncio.ensure_future(page.waitForRequest("https://signin.aws.amazon.com/saml", timeout=1000))
+            await asyncio.sleep(0.01)
+            await fake.event("Fetch.requestPaused", paused)
+            request = await waiter
+            self.assertEqual("SAMLResponse=abc", request.postData)
+            self.assertEqual("document", request.resourceType)
+
+            # Without listeners, paused requests are continued:
+            await fake.event("Fetch.requestPaused", {**paused, "requestId": "fetch-2"})
+            await asyncio.sleep(0.05)
+            self.assertIn(("Fetch.continueRequest", {"requestId": "fetch-2"}), fake.commands)
+
+        self.run_with_page(test)
+
+    def test_launch_with_pipe(self):
+        async def run():
+            browser = await cdp.Browser.launch(executable=executable, pipe=True)
+            try:
+                self.assertIsNone(browser.wsEndpoint)
+                result = await browser.connection.root.send("Target.getVersion")
+                self.assertEqual({"method": "Target.getVersion"}, result)
+            finally:
+                await browser.close()
+            self.assertEqual(0, browser.process.returncode)
+
+        with tempfile.TemporaryDirectory() as d:
+            executable = os.path.join(d, "chromium")
+            with open(executable, "w") as f:
+                f.write(FAKE_PIPE_CHROMIUM)
+            os.chmod(executable, 0o700)
+            asyncio.run(asyncio.wait_for(run(), 10))
@@ -0,0 +1,76 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+
+from dnbad.common import cdp
+from dnbad.common.cookie_store import CookieStore
+from dnbad.common.utils import run_sync
+
+
+class FakeSession:
+    """ The DevTools session of a page, with the cookies of the browser. """
+    def __init__(self, cookies):
+        self.cookies = cookies
+
+    def on(self, event, listener):
+        pass
+
+    async def send(self, method, params=None):
+        if method == "Network.getAllCookies":
+            return {"cookies": self.cookies}
+        if method == "Network.setCookies":
+            self.cookies = params["cookies"]
+            return {}
+        raise AssertionError(method)
+
+
+class TestCookieStore(unittest.TestCase):
+    def test_write_prunes_and_scopes(self):
+        cookies = [
+            {"name": "ESTSAUTH", "value": "a", "domain": ".login.microsoftonline.com", "expires": -1},
+            {"name": "fresh", "value": "b", "domain": "myapplications.microsoft.com", "expires": time.time() + 60},
+            {"name": "expired", "value": "c", "domain": "login.microsoftonline.com", "expires": time.time() - 60},
+            {"name": "other", "value": "d", "domain": "example.com", "expires": -1},
+        ]
+        with tempfile.TemporaryDirectory() as d:
+            store = CookieStore(os.path.join(d, "cookies.json"))
+            self.assertEqual(2, store.write(cookies))
+            self.assertEqual(["ESTSAUTH", "fresh"], [c["name"] for c in store.load()])
+            self.assertEqual(0o600, os.stat(store.path).st_mode & 0o777)
+
+    def test_load_drops_expired_and_ignored(self):
+        with tempfile.TemporaryDirectory() as d:
+            store = CookieStore(os.path.join(d, "cookies.json"))
+            with open(store.path, "w") as f:
+                json.dump([
+                    {"name": "esctx", "value": "a", "domain": "login.microsoftonline.com", "expires": -1},
+                    {"name": "expired", "value": "b", "domain": "login.microsoftonline.com", "expires": 1},
+                ], f)
+            self.assertEqual([], store.load())
+            self.assertEqual([], CookieStore(os.path.join(d, "missing.json")).load())
+
+    def test_write_replaces_domains_of_browser(self):
+        with tempfile.TemporaryDirectory() as d:
+            store = CookieStore(os.path.join(d, "cookies.json"))
+            store.write([
+                {"name": "ESTSAUTH", "value": "old", "domain": "login.microsoftonline.com", "expires": -1},
+                {"name": "deleted", "value": "a", "domain": ".login.microsoftonline.com", "expires": time.time() + 60},
+                {"name": "other", "value": "b", "domain": "myapps.microsoft.com", "expires": time.time() + 60},
+                {"name": "session", "value": "c", "domain": "office.com", "expires": -1},
+            ])
+            # E.g. saved by a login which did not visit the other domains:
+            self.assertEqual(2, store.write([
+                {"name": "ESTSAUTH", "value": "new", "domain": "login.microsoftonline.com", "expires": -1},
+            ]))
+            self.assertEqual([("ESTSAUTH", "new"), ("other", "b")], [(c["name"], c["value"]) for c in store.load()])
+
+    def test_save_and_inject(self):
+        cookie = {"name": "ESTSAUTH", "value": "a", "domain": "login.microsoftonline.com", "path": "/"}
+        with tempfile.TemporaryDirectory() as d:
+            store = CookieStore(os.path.join(d, "cookies.json"))
+            self.assertEqual(1, run_sync(store.save(cdp.Page(FakeSession([{**cookie, "expires": -1}]), "target"))))
+            session = FakeSession([])
+            self.assertEqual(1, run_sync(store.inject(cdp.Page(session, "target"))))
+            self.assertEqual([cookie], session.cookies)
@@ -0,0 +1,40 @@
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from dnbad.common.file_lock import FileLock, LockTimeoutError
+
+
+class TestFileLock(unittest.TestCase):
+    def test_lock_of_crashed_holder_is_released(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "test.lock")
+            holder = subprocess.Popen(
+                [sys.executable, "-c", "import sys, time\n"
+                                       "from dnbad.common.file_lock import FileLock\n"
+                                       f"FileLock({path!r}).acquire()\n"
+                                       "print('locked', flush=True)\n"
+                                       "time.sleep(60)"],
+                stdout=subprocess.PIPE, text=True
+            )
+            try:
+                self.assertEqual("locked", holder.stdout.readline().strip())
+                self.assertFalse(FileLock(path).try_acquire())
+            finally:
+                holder.send_signal(signal.SIGKILL)
+                holder.wait()
+                holder.stdout.close()
+            lock = FileLock(path, timeout=5)
+            asyncio.run(lock.acquire_async())
+            lock.release()
+
+    def test_acquire_async_times_out(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "test.lock")
+            with FileLock(path):
+                with self.assertRaises(LockTimeoutError):
+                    asyncio.run(FileLock(path, timeout=0.2).acquire_async())
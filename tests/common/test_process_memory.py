@@ -0,0 +1,87 @@
+import asyncio
+import os
+import signal
+import subprocess
+import unittest
+
+from dnbad.common.process_memory import RssSampler, kill_processes, process_start_times, process_tree
+from dnbad.common.pyppeteer import PypBrowser
+from dnbad.common.utils import run_sync
+
+
+class TestProcessMemory(unittest.TestCase):
+    def test_tree_includes_children_and_kill(self):
+        child = subprocess.Popen(["sleep", "30"])
+        try:
+            tree = process_tree(os.getpid())
+            self.assertIn(os.getpid(), tree)
+            self.assertIn(child.pid, tree)
+            self.assertGreater(tree[os.getpid()], 0)
+
+            self.assertEqual(1, kill_processes([child.pid]))
+            child.wait(5)
+            self.assertEqual(0, kill_processes([child.pid]))
+        finally:
+            child.kill()
+            child.wait()
+
+    def test_kill_only_same_process(self):
+        child = subprocess.Popen(["sleep", "30"])
+        try:
+            start_times = process_start_times()
+            self.assertIn(child.pid, start_times)
+            # As if the pid was reused by another process since:
+            self.assertEqual(0, kill_processes([child.pid], {child.pid: "Thu Jan  1 00:00:00 1970"}))
+            self.assertIsNone(child.poll())
+            self.assertEqual(1, kill_processes([child.pid], start_times))
+            child.wait(5)
+        finally:
+            child.kill()
+            child.wait()
+
+    def test_sampler_peak_and_steady(self):
+        sampler = RssSampler(pid=0)
+        for total in (300, 500, 200, 100, 120, 110):
+            sampler.sample({1: total, 2: 0})
+        sampler.sample({})
+        self.assertEqual(500, sampler.peak)
+        self.assertEqual(110, sampler.steady)
+        self.assertEqual(2, sampler.max_processes)
+        self.assertEqual(6, len(sampler.samples))
+
+
+class FakeBrowser:
+    """ A browser process with a child process, like the renderers of Chromium. """
+    def __init__(self, process: asyncio.subprocess.Process, close_children: bool):
+        self.process = process
+        self.close_children = close_children
+
+    async def close(self):
+        if self.close_children:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        else:
+            self.process.kill()
+        await self.process.wait()
+
+
+class TestLowMemoryClose(unittest.TestCase):
+    @staticmethod
+    async def _close(close_children: bool) -> int:
+        process = await asyncio.create_subprocess_exec("sh", "-c", "sleep 30 & wait", start_new_session=True)
+        await asyncio.sleep(0.2)
+        child = next(pid for pid in process_tree(process.pid) if pid != process.pid)
+        browser = PypBrowser(headless=True, dump_io=False, backend="cdp", low_memory=True)
+        browser.browser = FakeBrowser(process, close_children)
+        await browser.__aexit__(None, None, None)
+        return child
+
+    def test_clean_close_kills_nothing(self):
+        with self.assertNoLogs("dnbad.common.pyppeteer", "INFO"):
+            child = run_sync(self._close(close_children=True))
+        self.assertNotIn(child, process_start_times())
+
+    def test_leftover_child_killed(self):
+        with self.assertLogs("dnbad.common.pyppeteer", "INFO") as logs:
+            child = run_sync(self._close(close_children=False))
+        self.assertEqual(["Killed 1 leftover browser processes."], [r.getMessage() for r in logs.records])
+        self.assertNotIn(child, process_start_times())
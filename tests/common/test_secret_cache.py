@@ -0,0 +1,76 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from dnbad.common.password_manager import PasswordManager
+from dnbad.common.secret_cache import SecretCache, SecretHelper, SecretHelperClient
+
+
+class TestSecretCache(unittest.TestCase):
+    def test_ttl_and_negative_entries(self):
+        cache = SecretCache(ttl=60)
+        cache.put("a", "secret")
+        cache.put("missing", None)
+        cache.put("expired", "old", ttl=-1)
+        self.assertEqual((True, "secret"), cache.get("a"))
+        self.assertEqual((True, None), cache.get("missing"))
+        self.assertEqual((False, None), cache.get("expired"))
+        self.assertEqual(2, cache.purge())
+
+    def test_concurrent_misses_load_once(self):
+        cache = SecretCache()
+        loads = []
+
+        def loader():
+            loads.append(1)
+            time.sleep(0.05)
+            return "secret"
+
+        threads = [threading.Thread(target=cache.get_or_load, args=("a", loader)) for _ in range(5)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(1, len(loads))
+
+    def test_password_managers_share_keyring_read(self):
+        with mock.patch.object(PasswordManager, "_CACHE", SecretCache()), \
+                mock.patch("dnbad.common.password_manager.keyring") as keyring:
+            keyring.get_password.return_value = "pw"
+            self.assertTrue(PasswordManager("user").is_keyring_set())
+            self.assertEqual("pw", PasswordManager("user").get_password())
+            self.assertEqual(1, keyring.get_password.call_count)
+
+            PasswordManager("user").set_keyring("new")
+            keyring.get_password.return_value = "new"
+            self.assertEqual("new", PasswordManager("user").get_password())
+
+
+class TestSecretHelper(unittest.TestCase):
+    def test_round_trip_over_private_socket(self):
+        with tempfile.TemporaryDirectory() as d:
+            helper = SecretHelper(ttl=60, socket_path=os.path.join(d, "s.sock"))
+            helper.POLL_TIME = 0.05
+            thread = threading.Thread(target=helper.run_sync, daemon=True)
+            thread.start()
+            client = SecretHelperClient(ttl=60, socket_path=helper.socket_path)
+            for _ in range(100):
+                if os.path.exists(client.socket_path):
+                    break
+                time.sleep(0.01)
+
+            self.assertEqual(0, os.stat(client.socket_path).st_mode & 0o077)
+            self.assertEqual((False, None), client.get("a"))
+            client.put("a", "secret")
+            self.assertEqual((True, "secret"), client.get("a"))
+            client.delete("a")
+            self.assertEqual((False, None), client.get("a"))
+
+            # The helper exits when its secrets have expired:
+            helper.cache.ttl = 0
+            thread.join(2)
+            self.assertFalse(thread.is_alive())
+            self.assertFalse(os.path.exists(client.socket_path))
@@ -0,0 +1,36 @@
+import asyncio
+import unittest
+
+from dnbad.common import trace
+
+
+class TestTrace(unittest.TestCase):
+    def setUp(self):
+        self.collector = trace.SpanCollector()
+        trace.add_hook(self.collector)
+
+    def tearDown(self):
+        trace.remove_hook(self.collector)
+
+    def test_nested_spans_across_tasks(self):
+        async def child():
+            with trace.span("child"):
+                await asyncio.sleep(0)
+
+        async def children():
+            await asyncio.gather(child(), child())
+
+        with trace.span("root") as root:
+            asyncio.run(children())
+
+        children = [s for s in self.collector.spans if s.name == "child"]
+        self.assertEqual(2, len(children))
+        self.assertTrue(all(s.parent_id == root.span_id and s.trace_id == root.trace_id for s in children))
+        self.assertIn("child      2", self.collector.summary())
+
+    def test_error_attribute(self):
+        with self.assertRaises(ValueError):
+            with trace.span("failing"):
+                raise ValueError()
+        self.assertEqual("ValueError", self.collector.spans[0].attributes["error"])
+        self.assertEqual("failing", self.collector.spans[0].to_otlp()["name"])
@@ -0,0 +1,29 @@
+"""
+Fixtures shared by the test folders.
+
+fake_env runs the offline fakes of Azure AD and AWS from benchmark/fake_services.py, with a valid session cookie, and
+sets it as `self.env` on unittest test cases using it. Arguments of FakeEnvironment are given with a marker:
+
+    @pytest.mark.usefixtures("fake_env")
+    class TestSomething(unittest.TestCase):
+        @pytest.mark.fake_env(session_duration=3600)
+        def test_something(self):
+            ...
+"""
+import pytest
+
+from benchmark.fake_services import FakeEnvironment
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "fake_env(**kwargs): Arguments of the FakeEnvironment of the fake_env fixture")
+
+
+@pytest.fixture
+def fake_env(request) -> FakeEnvironment:
+    marker = request.node.get_closest_marker("fake_env")
+    with FakeEnvironment(**(marker.kwargs if marker else {})) as env:
+        env.seed_session()
+        if request.instance is not None:
+            request.instance.env = env
+        yield env
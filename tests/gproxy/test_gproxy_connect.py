@@ -0,0 +1,79 @@
+import asyncio
+import time
+import unittest
+from unittest import mock
+
+import pexpect
+
+from dnbad.common.azure_auth import AuthConfig
+from dnbad.common.password_manager import PasswordManager
+from dnbad.gproxy.gproxy import GProxy
+from dnbad.gproxy.gproxy_ad_login import GProxyAdLogin
+
+# Prints the device code prompt after a delay, like ssh after the handshake, and exits on enter.
+FAKE_SSH = (
+    "sleep 0.3; "
+    "echo 'To sign in, use a web browser to open the page https://microsoft.com/devicelogin "
+    "and enter the code ABCDEFGHI to authenticate.'; "
+    "read x"
+)
+
+
+class TestGProxyConnect(unittest.TestCase):
+    @staticmethod
+    def _connect(fake_ssh: str, auth_config: AuthConfig, fake_login):
+        spawn = pexpect.spawn
+        with mock.patch("dnbad.gproxy.gproxy.read_ssh_config"), \
+                mock.patch.object(GProxy, "_connect_args", lambda self: ["-c", fake_ssh]), \
+                mock.patch.object(GProxy, "is_connected", return_value=True), \
+                mock.patch.object(GProxyAdLogin, "login", fake_login), \
+                mock.patch.object(pexpect, "spawn", lambda _, args, **kwargs: spawn("sh", args, **kwargs)):
+            GProxy(mock.Mock()).connect(PasswordManager("user"), auth_config)
+
+    def test_browser_starts_while_ssh_negotiates(self):
+        submitted = []
+        overlaps = []
+
+        async def fake_login(gproxy_login: GProxyAdLogin):
+            gproxy_login.started_at = time.time()
+            await asyncio.sleep(0.1)
+            gproxy_login.page_ready_at = time.time()
+            submitted.append(await gproxy_login.auth_handler._wait_for_code())
+
+        original_report_overlap = GProxy._report_overlap
+
+        def report_overlap(gproxy_login: GProxyAdLogin, code_at: float) -> float:
+            overlaps.append(original_report_overlap(gproxy_login, code_at))
+            return overlaps[-1]
+
+        spawn = pexpect.spawn
+        with mock.patch("dnbad.gproxy.gproxy.read_ssh_config"), \
+                mock.patch.object(GProxy, "_connect_args", lambda self: ["-c", FAKE_SSH]), \
+                mock.patch.object(GProxy, "_report_overlap", staticmethod(report_overlap)), \
+                mock.patch.object(GProxyAdLogin, "login", fake_login), \
+                mock.patch.object(pexpect, "spawn", lambda _, args, **kwargs: spawn("sh", args, **kwargs)):
+            GProxy(mock.Mock()).connect(PasswordManager("user"), AuthConfig())
+
+        self.assertEqual(["ABCDEFGHI"], submitted)
+        self.assertAlmostEqual(0.1, overlaps[0], delta=0.05)
+
+    def test_no_browser_when_ssh_exits(self):
+        # E.g. SSH reusing the connection of the control socket.
+        logins = []
+
+        async def fake_login(gproxy_login: GProxyAdLogin):
+            logins.append(gproxy_login)
+
+        self._connect("exit 0", AuthConfig(), fake_login)
+        self.assertEqual([], logins)
+
+    def test_low_memory_starts_browser_for_code(self):
+        started = []
+
+        async def fake_login(gproxy_login: GProxyAdLogin):
+            gproxy_login.started_at = time.time()
+            started.append(gproxy_login.auth_handler.code)
+            await gproxy_login.auth_handler._wait_for_code()
+
+        self._connect(FAKE_SSH, AuthConfig(low_memory=True), fake_login)
+        self.assertEqual(["ABCDEFGHI"], started)